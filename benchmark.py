@@ -1,20 +1,98 @@
+import argparse
+import contextlib
+import datetime
+import functools
+import itertools
 import json
 import os
 import random
 import time
 import uuid
 
-import matplotlib.pyplot as plt
+from harness.concurrency import CONCURRENCY_LEVELS, saturation_curve
+from harness.history import ResultsHistory, describe
+from harness.input_pack import InputPack, batched
+from harness.io_accounting import IOProfiler, amplification
+from harness.isolation import run_isolated
+from harness.latency import PhaseRecorder
+from harness.live_feed import describe as describe_live_feed, run_live_feed
+from harness.memory import MemoryProfiler
+from harness.page_cache import evict
+from harness.profiling import PROFILER, Profiler
+from harness.registry import STORES, load_config, select
+from harness.scaling import SCALING_SIZES, ScalingCurve
+from harness.synthetic import encode_json, generate_parallel, keep_document, load_pack
+from harness.workloads import draw, workload
 
-from stores.apache_parquet import ApacheParquetStore
-
-stores = [
-    # The list of stores to benchmark, and whether to run read benchmarks
-    (ApacheParquetStore(timestamp_group=1), True),
-]
+# The stores to benchmark, as harness.registry.StoreEntry: read from
+# benchmark.toml (or --config) and filtered with --stores
+stores = []
 
 MAX_DOCUMENTS = 100
 RANDOM_READS = 1000
+# Which snapshots the read phases ask for (harness/workloads.py): "uniform",
+# "zipf" (skew), "latest" (n), "sequential" or "burst" (length)
+READ_WORKLOAD = "uniform"
+READ_WORKLOAD_PARAMS = {}
+# Ingest the undecoded file contents through store_raw instead of store_document
+RAW_INGEST = False
+# Documents per store_documents / get_documents call, 1 disables the batch API
+WRITE_BATCH_SIZE = 1
+READ_BATCH_SIZE = 10
+# Also read RANDOM_READS documents as pyarrow Tables
+ARROW_READS = True
+# Range scan phase: replays of RANGE_SCAN_DOCUMENTS consecutive snapshots
+RANGE_SCANS = 10
+RANGE_SCAN_DOCUMENTS = 50
+# Concurrent read mode: every client opens its own store instance and reads
+# for a fixed duration, for each concurrency level and worker pool kind
+CONCURRENT_READS = False
+CONCURRENT_READ_DURATION = 10
+CONCURRENT_READ_MODES = ("thread", "process")
+# Live feed mode: after the other phases, the store is reset and MAX_DOCUMENTS
+# snapshots are replayed by one writer, one every LIVE_FEED_INTERVAL seconds
+# (20 in production), while LIVE_FEED_READERS clients read one of the
+# LIVE_FEED_RECENT latest written snapshots after the other. Reports the read
+# latency under write load and the time until a stored snapshot is readable.
+LIVE_FEED = False
+LIVE_FEED_INTERVAL = 0.2
+LIVE_FEED_READERS = 4
+LIVE_FEED_RECENT = 10
+LIVE_FEED_MODE = "thread"
+# Decode data/ once into a memory-mapped Arrow file (data.arrow) shared by every
+# store, rebuilt when data/ changes, instead of parsing every file per store
+INPUT_PACK = True
+# Benchmark generated snapshots (harness/synthetic.py) instead of data/, e.g.
+# dict(seed=0, start="2024-03-20T00:00:00", count=100000, interval=20)
+SYNTHETIC_DATA = None
+# Run every store in its own spawned process, so imports, connection pools and
+# heap state of one store do not leak into the measurements of the next one
+ISOLATE_STORES = True
+# Reads preceded by the eviction of the files of the store from the OS page
+# cache (posix_fadvise), reported as cold_read next to the warm reads; only for
+# stores keeping their data in local files
+COLD_READS = 0
+SHOW_PLOTS = True
+# Append every run to results/history.sqlite, see `python benchmark.py compare`
+KEEP_HISTORY = True
+# Record the /proc/self/io counters and the size of the store's files around
+# every phase, and the write and read amplification they imply
+IO_ACCOUNTING = True
+# Record the resident set size (sampled) and page faults of every phase
+MEMORY_PROFILE = True
+# Also trace Python allocations with tracemalloc (heap peak, top allocation
+# sites); this slows stores written in Python down, so latencies are inflated
+TRACE_ALLOCATIONS = False
+# CPU profile of every phase (or --profile): collapsed stacks, a flame graph and
+# the functions with the most self time, written to results/profiles/
+PROFILE = False
+# Scaling sweep: instead of a single MAX_DOCUMENTS run, ingest every store up to
+# each of SCALING_SIZES in turn, continuing from the previous size, and fit how
+# the cost of a write and of a read grows with the number of documents
+SCALING_SWEEP = False
+SCALING_READS = 200
+# A store leaves the sweep once one of its steps takes longer than this (s)
+SCALING_STEP_LIMIT = 900
 
 
 # Json parser for uuids
@@ -25,59 +103,373 @@ class UUIDEncoder:
         return obj
 
 
-def data_iterator():
-    # yield the json of each file in data, sorted by name ascending
+def data_files(limit=None):
+    # yield the name of each file in data, sorted by name ascending
+    limit = MAX_DOCUMENTS if limit is None else limit
     for file in os.walk("data"):
         files = file[2]
         # Sort files by name
         files.sort()
         for i, f in enumerate(files):
-            if i >= MAX_DOCUMENTS:
+            if i >= limit:
                 break
 
-            with open(f"data/{f}", "r") as file:
-                yield json.load(file), f.split(".json")[0]
+            yield f
 
 
-def benchmark():
-    benchmark_time = time.time()
-    timestamps = [timestamp for _, timestamp in data_iterator()]
+@functools.cache
+def input_pack():
+    if SYNTHETIC_DATA:
+        return load_pack(**SYNTHETIC_DATA)
+    return InputPack.load("data")
 
-    size_stats = {}
-    write_stats = {}
-    read_stats = {}
 
-    for store, enabled_read_bench in stores:
-        name = store.__class__.__name__ if not hasattr(store, "name") else store.name()
+def available_documents():
+    if INPUT_PACK:
+        return len(input_pack())
+    if SYNTHETIC_DATA:
+        return SYNTHETIC_DATA.get("count", MAX_DOCUMENTS)
+    return sum(1 for _ in data_files(limit=float("inf")))
 
-        print(f"Running benchmark for {name}")
-        store.reset()
-        store_start = time.time()
-        for data, timestamp in data_iterator():
-            store.store_document(data, timestamp)
-        print(
-            f"{name} took {store.get_total_size() // 1024 / 1024} MB to store {MAX_DOCUMENTS} documents"
-        )
 
-        size_stats[name] = store.get_total_size() // 1024 / 1024
+@functools.cache
+def source_sizes():
+    # Size of the original file of every snapshot, by timestamp
+    if INPUT_PACK:
+        return input_pack().raw_sizes()
+    if SYNTHETIC_DATA:
+        return {}
+    return {f.split(".json")[0]: os.path.getsize(f"data/{f}") for f in data_files(limit=float("inf"))}
 
-        store_end = time.time()
-        print(
-            f"{name} took {store_end - store_start} seconds to store {MAX_DOCUMENTS} documents"
-        )
-        write_stats[name] = store_end - store_start
 
-        if not enabled_read_bench:
-            continue
+def document_size(timestamp):
+    return source_sizes().get(timestamp, 0)
+
+
+def synthetic_documents(limit, encode):
+    count = min(SYNTHETIC_DATA.get("count", limit), limit)
+    return generate_parallel(**{**SYNTHETIC_DATA, "count": count}, encode=encode)
+
+
+def data_iterator(limit=None):
+    # yield the json of each file in data, sorted by name ascending
+    limit = MAX_DOCUMENTS if limit is None else limit
+    if INPUT_PACK:
+        yield from input_pack().documents(limit)
+        return
+    if SYNTHETIC_DATA:
+        yield from synthetic_documents(limit, keep_document)
+        return
+    for f in data_files(limit):
+        with open(f"data/{f}", "r") as file:
+            yield json.load(file), f.split(".json")[0]
+
+
+def raw_data_iterator(limit=None):
+    # yield the undecoded bytes of each file in data, sorted by name ascending
+    limit = MAX_DOCUMENTS if limit is None else limit
+    if INPUT_PACK:
+        for raw, timestamp, _ in input_pack().raw_documents(limit):
+            yield raw, timestamp
+        return
+    if SYNTHETIC_DATA:
+        yield from synthetic_documents(limit, encode_json)
+        return
+    for f in data_files(limit):
+        with open(f"data/{f}", "rb") as file:
+            yield file.read(), f.split(".json")[0]
+
+
+def ingest(store, documents, phase):
+    # Store (document, timestamp) pairs, or (raw bytes, timestamp) pairs with RAW_INGEST
+    if RAW_INGEST:
+        for raw, timestamp in documents:
+            phase.measure(store.store_raw, raw, timestamp, features=raw.count(b'"Feature"'))
+            phase.source_bytes += len(raw)
+    elif WRITE_BATCH_SIZE > 1:
+        for batch in batched(documents, WRITE_BATCH_SIZE):
+            phase.measure(
+                store.store_documents,
+                batch,
+                features=sum(len(data["features"]) for data, _ in batch),
+            )
+            phase.source_bytes += sum(document_size(timestamp) for _, timestamp in batch)
+    else:
+        for data, timestamp in documents:
+            phase.measure(store.store_document, data, timestamp, features=len(data["features"]))
+            phase.source_bytes += document_size(timestamp)
+
+
+def count_features(document):
+    # Some stores return driver objects rather than a FeatureCollection
+    if isinstance(document, dict) and isinstance(document.get("features"), list):
+        return len(document["features"])
+    return 0
+
 
+def run_range_scans(store, timestamps):
+    phase = PhaseRecorder("range_scan")
+    for _ in range(RANGE_SCANS):
+        first = random.randrange(max(len(timestamps) - RANGE_SCAN_DOCUMENTS, 1))
+        start = timestamps[first]
+        # The end of the range is exclusive, past the last snapshot it is one
+        # second after it: stores parse it as a timestamp
+        last = first + RANGE_SCAN_DOCUMENTS
+        if last < len(timestamps):
+            end = timestamps[last]
+        else:
+            end = (datetime.datetime.fromisoformat(timestamps[-1]) + datetime.timedelta(seconds=1)).isoformat()
+
+        scan_start = time.perf_counter_ns()
+        try:
+            features = 0
+            for data, timestamp in store.iter_documents(start, end):
+                features += count_features(data)
+                phase.source_bytes += document_size(timestamp)
+        except NotImplementedError:
+            print(f"{store.__class__.__name__} does not support range scans")
+            return None
+        phase.record(scan_start, time.perf_counter_ns(), features)
+    return phase
+
+
+def run_cold_reads(store, timestamps, instrument):
+    # Reads after evicting the files of the store from the OS page cache
+    paths = store.storage_paths()
+    if not paths:
+        print(f"{store.__class__.__name__} keeps no local files, skipping cold reads")
+        return None
+    phase = PhaseRecorder("cold_read")
+    reads = workload(timestamps, READ_WORKLOAD, READ_WORKLOAD_PARAMS)
+    with instrument("cold_read"):
+        for i in draw(reads, COLD_READS):
+            # The eviction itself is not timed
+            if not evict(paths):
+                print("posix_fadvise is not available, skipping cold reads")
+                return None
+            document = phase.measure(store.get_document, i)
+            phase.features += count_features(document)
+            phase.source_bytes += document_size(i)
+    return phase
+
+
+def benchmark_store(store, enabled_read_bench, timestamps, profile_dir=None):
+    # Runs every phase on one store, returns {stat group: value for this store}
+    name = store.__class__.__name__ if not hasattr(store, "name") else store.name()
+    stats = {"latency_stats": {}, "latency_samples": {}}
+    memory_profilers = {}
+    profilers = {}
+    io_profilers = {}
+    phases = {}
+
+    def report(phase):
+        phases[phase.name] = phase
+        stats["latency_stats"][phase.name] = phase.summary()
+        # Latency of every call, kept for the comparisons of the results history
+        stats["latency_samples"][phase.name] = [latency for _, latency in phase.samples]
+
+    @contextlib.contextmanager
+    def instrument(phase):
+        with contextlib.ExitStack() as stack:
+            memory_profiler = None
+            if MEMORY_PROFILE:
+                memory_profiler = memory_profilers[phase] = stack.enter_context(MemoryProfiler(phase, TRACE_ALLOCATIONS))
+            if profile_dir:
+                profilers[phase] = stack.enter_context(Profiler(phase, PROFILER))
+            if IO_ACCOUNTING:
+                # Without the reads of the memory sampler of the same phase
+                io_profilers[phase] = stack.enter_context(
+                    IOProfiler(phase, store.storage_paths(), exclude=memory_profiler)
+                )
+            yield
+
+    print(f"Running benchmark for {name}")
+    store.reset()
+    write_phase = PhaseRecorder("write")
+    store_start = time.time()
+    with instrument("write"):
+        ingest(store, raw_data_iterator() if RAW_INGEST else data_iterator(), write_phase)
+    store_end = time.time()
+    print(
+        f"{name} took {store_end - store_start} seconds to store {MAX_DOCUMENTS} documents"
+    )
+    stats["write_stats"] = store_end - store_start
+    report(write_phase)
+    print(f"{name} write latency: {write_phase.describe()}")
+
+    # Buffered writes, compression and compaction, outside of the write phase
+    finalize_phase = PhaseRecorder("finalize")
+    with instrument("finalize"):
+        finalize_phase.measure(store.finalize)
+    stats["finalize_stats"] = finalize_phase.summary()["wall_s"]
+    report(finalize_phase)
+    print(f"{name} took {stats['finalize_stats']} seconds to finalize")
+
+    stats["size_stats"] = store.get_total_size() // 1024 / 1024
+    print(f"{name} took {stats['size_stats']} MB to store {MAX_DOCUMENTS} documents")
+
+    if MEMORY_PROFILE:
+        print(f"{name} write memory: {memory_profilers['write'].describe()}")
+    if IO_ACCOUNTING:
+        print(f"{name} write I/O: {io_profilers['write'].describe()}")
+
+    if enabled_read_bench:
+        if COLD_READS:
+            cold_read_phase = run_cold_reads(store, timestamps, instrument)
+            if cold_read_phase is not None:
+                print(f"{name} cold read latency: {cold_read_phase.describe()}")
+                stats["cold_read_stats"] = cold_read_phase.summary()["wall_s"]
+                report(cold_read_phase)
+
+        read_phase = PhaseRecorder("read")
         start = time.time()
-        for i in random.choices(timestamps, k=RANDOM_READS):
-            store.get_document(i)
+        reads = workload(timestamps, READ_WORKLOAD, READ_WORKLOAD_PARAMS)
+        with instrument("read"):
+            for i in draw(reads, RANDOM_READS):
+                document = read_phase.measure(store.get_document, i)
+                read_phase.features += count_features(document)
+                read_phase.source_bytes += document_size(i)
 
         end = time.time()
 
         print(f"{name} took {end - start} seconds to get {RANDOM_READS} documents")
-        read_stats[name] = end - start
+        print(f"{name} read latency: {read_phase.describe()}")
+        if MEMORY_PROFILE:
+            print(f"{name} read memory: {memory_profilers['read'].describe()}")
+        if IO_ACCOUNTING:
+            print(f"{name} read I/O: {io_profilers['read'].describe()}")
+        stats["read_stats"] = end - start
+        report(read_phase)
+
+        if ARROW_READS:
+            arrow_read_phase = PhaseRecorder("arrow_read")
+            reads = workload(timestamps, READ_WORKLOAD, READ_WORKLOAD_PARAMS)
+            with instrument("arrow_read"):
+                for i in draw(reads, RANDOM_READS):
+                    table = arrow_read_phase.measure(store.get_document_arrow, i)
+                    arrow_read_phase.features += table.num_rows
+                    arrow_read_phase.source_bytes += document_size(i)
+
+            print(f"{name} arrow read latency: {arrow_read_phase.describe()}")
+            stats["arrow_read_stats"] = arrow_read_phase.summary()["wall_s"]
+            report(arrow_read_phase)
+
+        if READ_BATCH_SIZE > 1:
+            batch_read_phase = PhaseRecorder("batch_read")
+            reads = workload(timestamps, READ_WORKLOAD, READ_WORKLOAD_PARAMS)
+            with instrument("batch_read"):
+                for _ in range(RANDOM_READS // READ_BATCH_SIZE):
+                    batch = draw(reads, READ_BATCH_SIZE)
+                    documents = batch_read_phase.measure(store.get_documents, batch)
+                    batch_read_phase.features += sum(map(count_features, documents))
+                    batch_read_phase.source_bytes += sum(map(document_size, batch))
+
+            print(
+                f"{name} took {batch_read_phase.summary()['wall_s']} seconds to get "
+                f"{RANDOM_READS} documents in batches of {READ_BATCH_SIZE}"
+            )
+            stats["batch_read_stats"] = batch_read_phase.summary()["wall_s"]
+            report(batch_read_phase)
+
+        if RANGE_SCANS:
+            with instrument("range_scan"):
+                range_phase = run_range_scans(store, timestamps)
+            if range_phase is not None:
+                print(f"{name} range scan latency: {range_phase.describe()}")
+                stats["range_scan_stats"] = range_phase.summary()["wall_s"]
+                report(range_phase)
+
+        if CONCURRENT_READS:
+            stats["concurrency_stats"] = {}
+            for mode in CONCURRENT_READ_MODES:
+                print(f"Running concurrent {mode} reads for {name}")
+                stats["concurrency_stats"][mode] = saturation_curve(
+                    store, timestamps, CONCURRENT_READ_DURATION, mode, CONCURRENCY_LEVELS,
+                    (READ_WORKLOAD, READ_WORKLOAD_PARAMS),
+                )
+
+    if LIVE_FEED:
+        print(f"Running live feed for {name}")
+        store.reset()
+        stats["live_feed_stats"] = run_live_feed(
+            store, data_iterator(), timestamps, LIVE_FEED_INTERVAL, LIVE_FEED_READERS,
+            LIVE_FEED_RECENT, LIVE_FEED_MODE,
+        )
+        print(f"{name} live feed: {describe_live_feed(stats['live_feed_stats'])}")
+
+    stats["memory_stats"] = {phase: profiler.summary() for phase, profiler in memory_profilers.items()}
+    if IO_ACCOUNTING:
+        stats["io_stats"] = {phase: profiler.summary() for phase, profiler in io_profilers.items()}
+        stats["amplification_stats"] = amplification(stats["io_stats"], phases, stats["size_stats"] * 1024 * 1024)
+        for phase, values in stats["amplification_stats"].items():
+            print(f"{name} {phase} amplification: " + ", ".join(
+                f"{key} {value:.2f}" for key, value in values.items()
+                if key.endswith("amplification") and value is not None
+            ))
+    if profile_dir:
+        for phase, profiler in profilers.items():
+            path = profiler.write(profile_dir, name)
+            print(f"{name} {phase} profile, flame graph in {path}.svg:\n{profiler.describe()}")
+        stats["profile_stats"] = {phase: profiler.summary() for phase, profiler in profilers.items()}
+    return name, stats
+
+
+def benchmark_store_entry(entry, timestamps, profile_dir=None):
+    # Entry point of the isolated runner: the store is imported and opened in the child
+    return benchmark_store(entry.open(), entry.read, timestamps, profile_dir)
+
+
+def settings():
+    # Benchmark constants of this run, kept with its results history
+    return {key: value for key, value in globals().items() if key.isupper() and not key.startswith("_")}
+
+
+def compare(base=None, new=None):
+    history = ResultsHistory()
+    new = new or history.latest_run()
+    base = base or (history.previous_run(new) if new else None)
+    if not base or not new:
+        print("No runs to compare, at least two runs on this machine with the same data size are needed")
+        return
+    print(f"Comparing run {new} with run {base}")
+    findings = history.compare(base, new)
+    for finding in findings:
+        print(describe(finding))
+    if not findings:
+        print("No significant change")
+    return findings
+
+
+def benchmark():
+    benchmark_time = time.time()
+    if INPUT_PACK:
+        timestamps = input_pack().timestamps[:MAX_DOCUMENTS]
+    else:
+        timestamps = [timestamp for _, timestamp in data_iterator()]
+
+    groups = (
+        "write_stats", "finalize_stats", "size_stats", "read_stats", "cold_read_stats", "batch_read_stats",
+        "arrow_read_stats", "range_scan_stats", "latency_stats", "concurrency_stats", "memory_stats",
+        "profile_stats", "io_stats", "amplification_stats", "live_feed_stats",
+    )
+    results = {group: {} for group in groups}
+    profile_dir = f"results/profiles/{benchmark_time}" if PROFILE else None
+    # Latencies measured under the profiler are not comparable with other runs
+    keep_history = KEEP_HISTORY and not PROFILE
+    if keep_history:
+        history = ResultsHistory()
+        run_id = history.start_run(len(timestamps), settings())
+
+    for entry in stores:
+        if ISOLATE_STORES:
+            name, stats = run_isolated(benchmark_store_entry, entry, timestamps, profile_dir)
+        else:
+            name, stats = benchmark_store_entry(entry, timestamps, profile_dir)
+        samples = stats.pop("latency_samples")
+        for group, value in stats.items():
+            results[group][name] = value
+        if keep_history:
+            history.record(run_id, str(entry), name, stats, samples)
 
         # Write all stats to a file
         with open(
@@ -85,24 +477,169 @@ def benchmark():
         ) as file:
             json.dump(
                 {
-                    "write_stats": write_stats,
-                    "size_stats": size_stats,
-                    "read_stats": read_stats,
+                    **results,
+                    "workload": {"name": READ_WORKLOAD, "params": READ_WORKLOAD_PARAMS},
                 },
                 file,
             )
 
+    if not SHOW_PLOTS:
+        return
+
     def plot_stats(stats, title):
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(20, 10))
         # Reverse plot (so X axis is the store name)
         plt.barh(list(stats.keys()), list(stats.values()))
         plt.title(title)
         plt.show()
 
-    plot_stats(write_stats, "Write times")
-    plot_stats(size_stats, "Size")
-    plot_stats(read_stats, "Read times")
+    plot_stats(results["write_stats"], "Write times")
+    plot_stats(results["finalize_stats"], "Finalize times")
+    plot_stats(results["size_stats"], "Size")
+    plot_stats(results["read_stats"], "Read times")
+    if COLD_READS:
+        plot_stats(results["cold_read_stats"], "Read times (cold page cache)")
+    plot_stats(results["arrow_read_stats"], "Read times (pyarrow.Table)")
+    plot_stats(results["range_scan_stats"], f"Range scan times ({RANGE_SCAN_DOCUMENTS} documents)")
+    plot_stats(results["batch_read_stats"], f"Read times (batches of {READ_BATCH_SIZE})")
+    if MEMORY_PROFILE:
+        plot_stats(
+            {
+                name: phases["write"]["rss_peak_growth_mb"] or 0
+                for name, phases in results["memory_stats"].items()
+            },
+            "Peak RSS growth while writing (MB)",
+        )
+
+
+def recording_timestamps(documents, timestamps):
+    for document, timestamp in documents:
+        timestamps.append(timestamp)
+        yield document, timestamp
+
+
+def scaling_sweep():
+    sweep_time = time.time()
+    available = available_documents()
+    sizes = [size for size in SCALING_SIZES if size <= available]
+    if not sizes:
+        raise SystemExit(
+            f"Only {available} documents available, the scaling sweep needs at least {min(SCALING_SIZES)}"
+        )
+    if len(sizes) < len(SCALING_SIZES):
+        print(f"Only {available} documents available, sweeping {sizes}")
+    sweep_stats = {}
+
+    for entry in stores:
+        store, enabled_read_bench = entry.open(), entry.read
+        name = store.__class__.__name__ if not hasattr(store, "name") else store.name()
+        print(f"Running scaling sweep for {name}")
+        store.reset()
+        curve = ScalingCurve(name)
+        steps = []
+        # A single pass over the input: every step only ingests the documents
+        # between the previous size and the next one
+        documents = raw_data_iterator(sizes[-1]) if RAW_INGEST else data_iterator(sizes[-1])
+        timestamps = []
+        previous = 0
+        for size in sizes:
+            write_phase = PhaseRecorder("write")
+            step = itertools.islice(documents, size - previous)
+            ingest(store, recording_timestamps(step, timestamps), write_phase)
+            finalize_phase = PhaseRecorder("finalize")
+            finalize_phase.measure(store.finalize)
+            # Time spent writing, per document
+            curve.add("write", size, write_phase.histogram.total / 1e6 / (len(timestamps) - previous))
+            previous = size
+            step_stats = {
+                "size": size,
+                "size_mb": store.get_total_size() // 1024 / 1024,
+                "write": write_phase.summary(),
+                "finalize": finalize_phase.summary(),
+            }
+            step_time = write_phase.summary()["wall_s"] + finalize_phase.summary()["wall_s"]
+
+            if enabled_read_bench:
+                read_phase = PhaseRecorder("read")
+                reads = workload(timestamps, READ_WORKLOAD, READ_WORKLOAD_PARAMS)
+                for i in draw(reads, SCALING_READS):
+                    read_phase.measure(store.get_document, i)
+                curve.add("read", size, read_phase.histogram.summary()["mean_ms"])
+                step_stats["read"] = read_phase.summary()
+                step_time += read_phase.summary()["wall_s"]
+
+            steps.append(step_stats)
+            print(f"{name} at {size} documents: " + ", ".join(
+                f"{phase} {values[-1][1]:.3f}ms" for phase, values in curve.points.items()
+            ))
+
+            # Checkpoint after every size, a long sweep keeps what it measured
+            sweep_stats[name] = {"steps": steps, "workload": READ_WORKLOAD, **curve.summary()}
+            with open(f"results/scaling_results_{sweep_time}.json", "w") as file:
+                json.dump(sweep_stats, file)
+
+            if step_time > SCALING_STEP_LIMIT and size != sizes[-1]:
+                curve.stopped_at = sizes[sizes.index(size) + 1]
+                sweep_stats[name] = {"steps": steps, "workload": READ_WORKLOAD, **curve.summary()}
+                break
+
+        print(curve.describe())
+
+    with open(f"results/scaling_results_{sweep_time}.json", "w") as file:
+        json.dump(sweep_stats, file)
+
+    if not SHOW_PLOTS:
+        return
+
+    # matplotlib takes longer to import than the rest of the harness
+    import matplotlib.pyplot as plt
+
+    for phase in ("write", "read"):
+        plt.figure(figsize=(20, 10))
+        for name, stats in sweep_stats.items():
+            if phase in stats["phases"]:
+                points = stats["phases"][phase]
+                plt.loglog(points["sizes"], points["mean_ms"], marker="o", label=name)
+        plt.xlabel("Documents stored")
+        plt.ylabel("Mean time per document (ms)")
+        plt.title(f"Scaling of the {phase} cost")
+        plt.legend()
+        plt.show()
 
 
 if __name__ == "__main__":
-    benchmark()
+    parser = argparse.ArgumentParser(description="Benchmark the stores on the snapshots of data/")
+    parser.add_argument(
+        "command", nargs="?", choices=("run", "compare"), default="run",
+        help="run the benchmark, or compare two runs of the results history",
+    )
+    parser.add_argument("--config", default="benchmark.toml", help="stores and parameter sweeps")
+    parser.add_argument("--stores", nargs="+", metavar="PATTERN", help="store names to run, e.g. parquet*")
+    parser.add_argument("--list", action="store_true", help="list the registered stores")
+    parser.add_argument("--base", type=int, help="compare: run id of the reference run")
+    parser.add_argument("--new", type=int, help="compare: run id of the compared run (default: latest)")
+    parser.add_argument("--no-plot", action="store_true", help="do not show the plots")
+    parser.add_argument("--profile", action="store_true", help="profile every phase, see PROFILE")
+    args = parser.parse_args()
+    SHOW_PLOTS = not args.no_plot
+    PROFILE = PROFILE or args.profile
+
+    if args.command == "compare":
+        findings = compare(args.base, args.new)
+        # Non-zero exit status when something got slower or bigger, for CI
+        raise SystemExit(any(finding["kind"] == "regression" for finding in findings or []))
+    elif args.list:
+        print("\n".join(f"{name}: {target}" for name, target in STORES.items()))
+    else:
+        stores = select(load_config(args.config), args.stores)
+        if not stores:
+            if args.stores:
+                parser.error(f"no store matches {' '.join(args.stores)}")
+            parser.error(f"{args.config} selects no store")
+        print(f"Benchmarking {', '.join(map(str, stores))}")
+        if SCALING_SWEEP:
+            scaling_sweep()
+        else:
+            benchmark()
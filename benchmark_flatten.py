@@ -0,0 +1,127 @@
+import json
+import os
+import time
+
+import pyarrow
+
+from stores import columnar
+from stores.apache_parquet import SCHEMA
+
+# Microbenchmark of the shared feature flattener against the per-feature
+# comprehensions the stores used to build their rows with
+DOCUMENTS = 100
+REPEAT = 5
+
+
+def load_documents():
+    files = sorted(os.listdir("data"))[:DOCUMENTS]
+    documents = []
+    for f in files:
+        with open(f"data/{f}", "r") as file:
+            documents.append((json.load(file), f.split(".json")[0]))
+    return documents
+
+
+def pylist_comprehension(documents):
+    # ApacheParquetStore, one pyarrow.Table.from_pylist per snapshot
+    return [
+        pyarrow.Table.from_pylist(
+            [
+                {
+                    "timestamp": timestamp,
+                    "uuid": feature["properties"]["uuid"],
+                    "id": feature["properties"]["id"],
+                    "color": feature["properties"]["color"],
+                    "direction": bool(feature["properties"]["direction"] - 1),
+                    "distance": feature["properties"]["distance"],
+                    "distanceFromPoint": feature["properties"]["distanceFromPoint"],
+                    "lineId": feature["properties"]["lineId"],
+                    "coordinates_0": feature["geometry"]["coordinates"][0],
+                    "coordinates_1": feature["geometry"]["coordinates"][1],
+                    "uuidx": feature["properties"]["uuid"],
+                }
+                for feature in data["features"]
+            ],
+            schema=SCHEMA,
+        )
+        for data, timestamp in documents
+    ]
+
+
+def dict_comprehension(documents):
+    # MongoTimeSeriesStore, CitusStore and TimeScaleDBTimeSeriesStore rows
+    return [
+        [
+            {
+                "timestamp": timestamp,
+                "uuid": feature["properties"]["uuid"],
+                "id": feature["properties"]["id"],
+                "color": feature["properties"]["color"],
+                "direction": bool(feature["properties"]["direction"] - 1),
+                "distance": feature["properties"]["distance"],
+                "distanceFromPoint": feature["properties"]["distanceFromPoint"],
+                "lineId": feature["properties"]["lineId"],
+                "coordinates_0": feature["geometry"]["coordinates"][0],
+                "coordinates_1": feature["geometry"]["coordinates"][1],
+            }
+            for feature in data["features"]
+        ]
+        for data, timestamp in documents
+    ]
+
+
+def flatten_records(documents):
+    # The same rows built from the flattened columns: slower, row-oriented
+    # sinks keep the comprehension
+    names = ("uuid", "id", "color", "direction", "distance", "distanceFromPoint", "lineId", "coordinates_0", "coordinates_1")
+    rows = []
+    for data, timestamp in documents:
+        columns = columnar.flatten([(data, timestamp)])
+        rows.append([{"timestamp": timestamp, **dict(zip(names, record))} for record in columnar.records(columns, names)])
+    return rows
+
+
+def flatten_per_document(documents):
+    return [columnar.flatten([document]) for document in documents]
+
+
+def flatten_table_per_document(documents):
+    tables = []
+    for document in documents:
+        columns = columnar.flatten([document])
+        columns["uuidx"] = columns["uuid"]
+        tables.append(columnar.table_from_columns(columns, SCHEMA))
+    return tables
+
+
+def flatten_batch(documents):
+    return columnar.documents_to_table(documents)
+
+
+def run():
+    documents = load_documents()
+    features = sum(len(data["features"]) for data, _ in documents)
+    print(f"{len(documents)} snapshots, {features} features")
+
+    baseline = None
+    for fn in (
+        pylist_comprehension,
+        dict_comprehension,
+        flatten_records,
+        flatten_per_document,
+        flatten_table_per_document,
+        flatten_batch,
+    ):
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            fn(documents)
+        per_document = (time.perf_counter() - start) / REPEAT / len(documents)
+        baseline = baseline or per_document
+        print(
+            f"{fn.__name__:>28}: {per_document * 1e3:.3f} ms/snapshot "
+            f"({baseline / per_document:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,28 @@
+import argparse
+import os
+
+from harness.synthetic import START, generate_parallel, load_pack
+
+
+def generate_data(seed, start, count, interval, workers):
+    # Write the snapshots to data/, as get_data does with the live API
+    os.makedirs("data", exist_ok=True)
+    for raw, timestamp in generate_parallel(seed, start, count, interval, workers=workers):
+        with open(f"data/{timestamp}.json", "wb") as file:
+            file.write(raw)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic STIB vehicle positions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default=START)
+    parser.add_argument("--count", type=int, default=720, help="number of snapshots")
+    parser.add_argument("--interval", type=int, default=20, help="seconds between snapshots")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--pack", help="write an input pack (e.g. synthetic.arrow) instead of data/")
+    args = parser.parse_args()
+
+    if args.pack:
+        load_pack(args.seed, args.start, args.count, args.interval, args.pack, args.workers)
+    else:
+        generate_data(args.seed, args.start, args.count, args.interval, args.workers)
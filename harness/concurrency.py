@@ -0,0 +1,112 @@
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+
+from harness.latency import LatencyHistogram, PhaseRecorder
+from harness.workloads import workload
+
+CONCURRENCY_LEVELS = (1, 2, 4, 8, 16)
+# Time given to every client to open its own store instance before the run
+START_TIMEOUT = 120
+
+
+def read_client(store_spec, timestamps, duration, seed, barrier, results, client_id, read_workload):
+    try:
+        store_class, args, kwargs = store_spec
+        store = store_class(*args, **kwargs)
+        name, params = read_workload
+        # Every client follows the workload on its own, from its own seed
+        reads = workload(timestamps, name, params, seed)
+        phase = PhaseRecorder(f"client_{client_id}")
+        # Warm up lazy imports, connection pools and thread pools before the run
+        store.get_document(next(reads))
+
+        barrier.wait(timeout=START_TIMEOUT)
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            phase.measure(store.get_document, next(reads))
+
+        results.put((client_id, phase.histogram, phase.summary()["wall_s"], None))
+    except Exception:
+        barrier.abort()
+        results.put((client_id, None, 0, traceback.format_exc()))
+
+
+def run_concurrent_reads(
+    store, timestamps, concurrency, duration, mode="thread", seed=0, read_workload=("uniform", {})
+):
+    if mode == "thread":
+        barrier = threading.Barrier(concurrency)
+        results = queue.Queue()
+        worker = threading.Thread
+    elif mode == "process":
+        # Spawned processes do not inherit the connections of the parent
+        context = multiprocessing.get_context("spawn")
+        barrier = context.Barrier(concurrency)
+        results = context.Queue()
+        worker = context.Process
+    else:
+        raise ValueError(f"Unknown concurrency mode {mode}")
+
+    clients = [
+        worker(
+            target=read_client,
+            args=(store.spec(), timestamps, duration, seed + i, barrier, results, i, read_workload),
+            daemon=True,
+        )
+        for i in range(concurrency)
+    ]
+    for client in clients:
+        client.start()
+
+    # Drain the queue before joining, a process blocks until its result is consumed
+    outcomes = sorted(
+        (results.get(timeout=START_TIMEOUT + duration * 2) for _ in clients),
+        key=lambda outcome: outcome[0],
+    )
+    for client in clients:
+        client.join()
+
+    errors = [error for _, _, _, error in outcomes if error]
+    if errors:
+        raise RuntimeError(f"{len(errors)} {mode} client(s) failed:\n{errors[0]}")
+
+    total = LatencyHistogram()
+    per_client = []
+    for client_id, histogram, wall, _ in outcomes:
+        total.merge(histogram)
+        per_client.append(
+            {
+                "client": client_id,
+                "ops_per_s": histogram.count / wall if wall else 0,
+                **histogram.summary(),
+            }
+        )
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "workload": read_workload[0],
+        "ops_per_s": total.count / duration,
+        **total.summary(),
+        "per_client": per_client,
+    }
+
+
+def saturation_curve(
+    store, timestamps, duration, mode="thread", levels=CONCURRENCY_LEVELS, read_workload=("uniform", {})
+):
+    curve = []
+    for concurrency in levels:
+        result = run_concurrent_reads(
+            store, timestamps, concurrency, duration, mode, read_workload=read_workload
+        )
+        print(
+            f"  {mode} x{concurrency}: {result['ops_per_s']:.1f} ops/s, "
+            f"p50={result['p50_ms']:.3f}ms p99={result['p99_ms']:.3f}ms"
+        )
+        curve.append(result)
+    return curve
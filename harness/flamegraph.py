@@ -0,0 +1,71 @@
+import html
+import zlib
+
+WIDTH = 1200
+FRAME_HEIGHT = 16
+FONT_SIZE = 11
+# Frames narrower than this are not drawn (in pixels)
+MIN_WIDTH = 0.1
+# Average width of a character relative to the font size, to truncate labels
+CHARACTER_WIDTH = 0.6
+
+
+def build_tree(stacks):
+    # Collapsed stacks ("a;b;c" -> weight) as nested [weight, {frame: node}]
+    root = [0, {}]
+    for stack, weight in stacks.items():
+        node = root
+        node[0] += weight
+        for frame in stack.split(";"):
+            node = node[1].setdefault(frame, [0, {}])
+            node[0] += weight
+    return root
+
+
+def color(frame):
+    # Warm colors as flamegraph.pl, stable for a given frame across graphs
+    value = zlib.crc32(frame.encode())
+    return "rgb({},{},{})".format(
+        205 + value % 50, (value >> 8) % 230, (value >> 16) % 55
+    )
+
+
+def render(stacks, title, unit="us"):
+    # SVG flame graph of collapsed stacks: the root at the bottom, every frame
+    # as wide as the share of the weight spent in it and its callees
+    root = build_tree(stacks)
+    total = root[0] or 1
+    frames = []
+
+    def layout(children, x, depth):
+        for frame, (weight, grandchildren) in sorted(children.items()):
+            width = weight / total * WIDTH
+            if width >= MIN_WIDTH:
+                frames.append((frame, weight, x, depth, width))
+                layout(grandchildren, x, depth + 1)
+            x += width
+
+    layout(root[1], 0, 0)
+    depth = max((frame[3] for frame in frames), default=0) + 1
+    height = (depth + 2) * FRAME_HEIGHT
+
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{height}" '
+        f'font-family="monospace" font-size="{FONT_SIZE}">',
+        '<rect width="100%" height="100%" fill="#f8f8f8"/>',
+        f'<text x="{WIDTH / 2}" y="{FRAME_HEIGHT}" text-anchor="middle">{html.escape(title)}</text>',
+    ]
+    for frame, weight, x, level, width in frames:
+        y = height - (level + 1) * FRAME_HEIGHT
+        label = html.escape(frame)
+        characters = int(width / (FONT_SIZE * CHARACTER_WIDTH))
+        text = frame if len(frame) <= characters else frame[:characters - 2] + ".."
+        lines.append(
+            f'<g><title>{label} ({weight} {unit}, {weight / total:.2%})</title>'
+            f'<rect x="{x:.2f}" y="{y}" width="{width:.2f}" height="{FRAME_HEIGHT - 1}" '
+            f'fill="{color(frame)}"/>'
+            + (f'<text x="{x + 2:.2f}" y="{y + FRAME_HEIGHT - 4}">{html.escape(text)}</text>' if characters > 2 else "")
+            + "</g>"
+        )
+    lines.append("</svg>")
+    return "\n".join(lines)
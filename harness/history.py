@@ -0,0 +1,242 @@
+import hashlib
+import json
+import math
+import os
+import platform
+import sqlite3
+import subprocess
+import time
+
+import numpy
+
+HISTORY_PATH = "results/history.sqlite"
+# A difference is reported when the one-sided Mann-Whitney p-value is below
+# ALPHA and the median moved by more than MIN_CHANGE
+ALPHA = 0.01
+MIN_CHANGE = 0.05
+# Relative growth of the size on disk reported as a regression
+SIZE_CHANGE = 0.01
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    git_commit TEXT,
+    host TEXT NOT NULL,
+    host_fingerprint TEXT NOT NULL,
+    documents INTEGER NOT NULL,
+    settings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    store TEXT NOT NULL,
+    store_name TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    store TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    -- Latency of every call in nanoseconds, as little-endian int64
+    latencies_ns BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS metrics_run ON metrics(run_id, store);
+CREATE INDEX IF NOT EXISTS samples_run ON samples(run_id, store);
+"""
+
+
+def git_commit():
+    # Commit of the working tree, suffixed with -dirty if tracked files changed
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        changes = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if changes else commit
+
+
+def host():
+    # Description of the machine, runs are only compared on the same one
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "system": platform.platform(),
+        "python": platform.python_version(),
+    }
+
+
+def mann_whitney(base, new):
+    # One-sided Mann-Whitney U test that new tends to be larger than base, with
+    # the normal approximation and tie correction. Returns the p-value.
+    base, new = numpy.asarray(base, dtype=numpy.float64), numpy.asarray(new, dtype=numpy.float64)
+    n1, n2 = len(new), len(base)
+    if not n1 or not n2:
+        return 1.0
+    combined = numpy.concatenate([new, base])
+    _, inverse, counts = numpy.unique(combined, return_inverse=True, return_counts=True)
+    # Average rank of every distinct value, 1-based
+    ranks = (numpy.cumsum(counts) - (counts - 1) / 2)[inverse]
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    ties = (counts ** 3 - counts).sum() / (n * (n - 1)) if n > 1 else 0
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties))
+    if sigma == 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / sigma
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+class ResultsHistory:
+    """Every benchmark run, kept in a SQLite database to compare runs."""
+
+    def __init__(self, path=HISTORY_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def start_run(self, documents: int, settings: dict):
+        description = host()
+        fingerprint = hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()[:16]
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started, git_commit, host, host_fingerprint, documents, settings) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (time.time(), git_commit(), json.dumps(description), fingerprint, documents,
+                 json.dumps(settings, default=str)),
+            )
+        return cursor.lastrowid
+
+    def record(self, run_id: int, store: str, store_name: str, stats: dict, samples: dict):
+        # store is the configuration (registry name and parameters), the key
+        # under which runs are compared
+        rows = []
+        for group, phase, metric in (
+            ("write_stats", "write", "total_s"),
+            ("finalize_stats", "finalize", "total_s"),
+            ("size_stats", "size", "mb"),
+        ):
+            if group in stats:
+                rows.append((phase, metric, stats[group]))
+        for phase, summary in stats.get("latency_stats", {}).items():
+            rows += [
+                (phase, metric, value)
+                for metric, value in summary.items()
+                if isinstance(value, (int, float))
+            ]
+        for phase, summary in stats.get("memory_stats", {}).items():
+            rows.append((phase, "rss_peak_growth_mb", summary["rss_peak_growth_mb"]))
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, store, store_name, phase, metric, value) for phase, metric, value in rows],
+            )
+            self.connection.executemany(
+                "INSERT INTO samples VALUES (?, ?, ?, ?)",
+                [
+                    (run_id, store, phase, numpy.asarray(latencies, dtype="<i8").tobytes())
+                    for phase, latencies in samples.items()
+                ],
+            )
+
+    def runs(self):
+        return self.connection.execute(
+            "SELECT run_id, started, git_commit, host_fingerprint, documents FROM runs ORDER BY run_id"
+        ).fetchall()
+
+    def previous_run(self, run_id: int):
+        # Latest earlier run on the same machine with the same number of documents
+        row = self.connection.execute(
+            "SELECT b.run_id FROM runs a JOIN runs b "
+            "ON b.host_fingerprint = a.host_fingerprint AND b.documents = a.documents "
+            "AND b.run_id < a.run_id WHERE a.run_id = ? ORDER BY b.run_id DESC LIMIT 1",
+            (run_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def latest_run(self):
+        row = self.connection.execute("SELECT MAX(run_id) FROM runs").fetchone()
+        return row[0]
+
+    def metrics(self, run_id):
+        return {
+            (store, phase, metric): value
+            for store, phase, metric, value in self.connection.execute(
+                "SELECT store, phase, metric, value FROM metrics WHERE run_id = ?", (run_id,)
+            )
+        }
+
+    def samples(self, run_id):
+        return {
+            (store, phase): numpy.frombuffer(latencies, dtype="<i8")
+            for store, phase, latencies in self.connection.execute(
+                "SELECT store, phase, latencies_ns FROM samples WHERE run_id = ?", (run_id,)
+            )
+        }
+
+    def compare(self, base: int, new: int):
+        # Changes between two runs, for every store and phase present in both
+        findings = []
+        base_samples, new_samples = self.samples(base), self.samples(new)
+        for key in sorted(base_samples.keys() & new_samples.keys()):
+            before, after = base_samples[key], new_samples[key]
+            median_before, median_after = numpy.median(before), numpy.median(after)
+            change = (median_after - median_before) / median_before if median_before else 0
+            if change > MIN_CHANGE:
+                p_value = mann_whitney(before, after)
+            elif change < -MIN_CHANGE:
+                p_value = mann_whitney(after, before)
+            else:
+                continue
+            if p_value < ALPHA:
+                findings.append(
+                    {
+                        "store": key[0],
+                        "phase": key[1],
+                        "kind": "regression" if change > 0 else "improvement",
+                        "change": change,
+                        "p_value": p_value,
+                        "median_ms": (median_before / 1e6, median_after / 1e6),
+                        "p99_ms": (numpy.percentile(before, 99) / 1e6, numpy.percentile(after, 99) / 1e6),
+                    }
+                )
+
+        # The size has no distribution, any growth beyond SIZE_CHANGE is reported
+        base_metrics, new_metrics = self.metrics(base), self.metrics(new)
+        for key in sorted(base_metrics.keys() & new_metrics.keys()):
+            if key[1:] != ("size", "mb") or not base_metrics[key]:
+                continue
+            change = (new_metrics[key] - base_metrics[key]) / base_metrics[key]
+            if abs(change) > SIZE_CHANGE:
+                findings.append(
+                    {
+                        "store": key[0],
+                        "phase": "size",
+                        "kind": "regression" if change > 0 else "improvement",
+                        "change": change,
+                        "p_value": None,
+                        "mb": (base_metrics[key], new_metrics[key]),
+                    }
+                )
+        return findings
+
+
+def describe(finding):
+    text = f"{finding['kind'].upper()} {finding['store']} {finding['phase']}: {finding['change']:+.1%}"
+    if finding["p_value"] is None:
+        return text + " (size {:.3f}MB -> {:.3f}MB)".format(*finding["mb"])
+    return text + (
+        " (median {:.3f}ms -> {:.3f}ms, p99 {:.3f}ms -> {:.3f}ms, ".format(
+            *finding["median_ms"], *finding["p99_ms"]
+        )
+        + f"p={finding['p_value']:.2g})"
+    )
@@ -0,0 +1,167 @@
+import hashlib
+import itertools
+import json
+import marshal
+import os
+import sys
+
+import numpy
+import pyarrow
+import pyarrow.compute
+import pyarrow.ipc
+
+# Snapshots per record batch of the pack
+PACK_BATCH_SIZE = 256
+# Bumped whenever the layout of the pack changes
+PACK_VERSION = 1
+
+PACK_SCHEMA = pyarrow.schema(
+    [
+        ("timestamp", pyarrow.string()),
+        ("features", pyarrow.int32()),
+        # The file contents as read from data/, for store_raw
+        ("raw", pyarrow.large_binary()),
+        # The decoded document, serialized with marshal: loading it is several
+        # times cheaper than parsing the JSON again
+        ("document", pyarrow.large_binary()),
+    ]
+)
+
+
+def data_files(data_dir):
+    return sorted(
+        f for f in os.listdir(data_dir) if os.path.isfile(os.path.join(data_dir, f))
+    )
+
+
+def fingerprint(data_dir):
+    # Hash of the name, size and mtime of every file of the directory, so the
+    # pack is rebuilt as soon as a snapshot is added, removed or rewritten
+    digest = hashlib.sha1(f"{PACK_VERSION}:{marshal.version}".encode())
+    for f in data_files(data_dir):
+        stat = os.stat(os.path.join(data_dir, f))
+        digest.update(f"{f}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def pack_row(document, timestamp, raw=None):
+    # Row of the pack for a decoded document and its original bytes
+    raw = json.dumps(document).encode() if raw is None else raw
+    return timestamp, len(document["features"]), raw, marshal.dumps(document)
+
+
+def data_rows(data_dir):
+    for f in data_files(data_dir):
+        with open(os.path.join(data_dir, f), "rb") as file:
+            raw = file.read()
+        yield pack_row(json.loads(raw), f.split(".json")[0], raw)
+
+
+def batched(iterable, size):
+    # Tuples of size items, the last one possibly shorter (itertools.batched
+    # needs Python 3.12)
+    iterator = iter(iterable)
+    while batch := tuple(itertools.islice(iterator, size)):
+        yield batch
+
+
+def write_pack(path, rows, fingerprint):
+    # Write (timestamp, features, raw, document) rows, PACK_BATCH_SIZE per record batch
+    metadata = {"fingerprint": fingerprint, "python": sys.version}
+    schema = PACK_SCHEMA.with_metadata(metadata)
+    # Write next to the pack and rename, an interrupted build never leaves a
+    # truncated pack behind
+    with pyarrow.OSFile(f"{path}.tmp", "wb") as sink:
+        with pyarrow.ipc.new_file(sink, schema) as writer:
+            for batch in batched(rows, PACK_BATCH_SIZE):
+                columns = [list(column) for column in zip(*batch)]
+                writer.write_batch(pyarrow.RecordBatch.from_arrays(columns, schema=schema))
+    os.replace(f"{path}.tmp", path)
+
+
+def build_pack(data_dir, path):
+    print(f"Building input pack {path} from {data_dir}/")
+    write_pack(path, data_rows(data_dir), fingerprint(data_dir))
+
+
+def binary_values(array):
+    # Zero-copy views on the values of a large_binary array, straight into the
+    # memory-mapped file
+    _, offsets, data = array.buffers()
+    offsets = numpy.frombuffer(offsets, dtype=numpy.int64)
+    offsets = offsets[array.offset:array.offset + len(array) + 1].tolist()
+    view = memoryview(data)
+    return [view[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+class InputPack:
+    """
+    The snapshots of a data directory decoded once into an Arrow IPC file,
+    memory-mapped and shared by every store of the benchmark.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.table = pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all()
+        self.timestamps = self.table.column("timestamp").to_pylist()
+        self.index = {timestamp: i for i, timestamp in enumerate(self.timestamps)}
+
+    @classmethod
+    def load(cls, data_dir="data", path=None):
+        # Open the pack of data_dir, (re)building it if data_dir changed since
+        path = path or f"{data_dir.rstrip(os.sep)}.arrow"
+        return cls.open(path, fingerprint(data_dir), lambda: build_pack(data_dir, path))
+
+    @classmethod
+    def open(cls, path, expected_fingerprint, build):
+        # Open the pack at path, calling build first if it is missing or stale
+        if not os.path.exists(path) or cls.stored_fingerprint(path) != expected_fingerprint:
+            build()
+        return cls(path)
+
+    @staticmethod
+    def stored_fingerprint(path):
+        try:
+            metadata = pyarrow.ipc.open_file(pyarrow.memory_map(path)).schema.metadata
+        except pyarrow.ArrowInvalid:
+            return None
+        return (metadata or {}).get(b"fingerprint", b"").decode()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def batches(self, limit=None):
+        # Yield (timestamps, features, raw views, document views) per record batch
+        remaining = len(self) if limit is None else min(limit, len(self))
+        for batch in self.table.to_batches():
+            if remaining <= 0:
+                return
+            batch = batch.slice(0, remaining)
+            remaining -= batch.num_rows
+            yield (
+                batch.column("timestamp").to_pylist(),
+                batch.column("features").to_pylist(),
+                binary_values(batch.column("raw")),
+                binary_values(batch.column("document")),
+            )
+
+    def documents(self, limit=None):
+        # yield (document, timestamp), sorted by timestamp ascending
+        for timestamps, _, _, documents in self.batches(limit):
+            for document, timestamp in zip(documents, timestamps):
+                yield marshal.loads(document), timestamp
+
+    def raw_documents(self, limit=None):
+        # yield (raw bytes, timestamp, number of features); the view is copied
+        # to bytes since stores may keep or json.loads it
+        for timestamps, features, raws, _ in self.batches(limit):
+            yield from zip(map(bytes, raws), timestamps, features)
+
+    def raw_sizes(self):
+        # Size of the original file of every snapshot, by timestamp
+        lengths = pyarrow.compute.binary_length(self.table.column("raw")).to_pylist()
+        return dict(zip(self.timestamps, lengths))
+
+    def get_document(self, timestamp):
+        i = self.index[timestamp]
+        return marshal.loads(self.table.column("document")[i].as_buffer())
@@ -0,0 +1,132 @@
+import os
+
+from harness.page_cache import files
+
+# Counters of /proc/self/io: rchar and wchar are the bytes passed to read and
+# write calls (files, pipes and sockets, page cache hits included), read_bytes
+# and write_bytes the bytes the process made the block layer fetch or dirty,
+# cancelled_write_bytes the dirty bytes dropped before writeback (truncated or
+# deleted files), syscr and syscw the number of read and write calls.
+IO_FIELDS = ("rchar", "wchar", "syscr", "syscw", "read_bytes", "write_bytes", "cancelled_write_bytes")
+
+
+def io_counters():
+    # None where /proc/self/io is not available (not Linux, restricted /proc)
+    try:
+        with open("/proc/self/io") as file:
+            counters = dict(line.split(": ") for line in file.read().splitlines())
+    except OSError:
+        return None
+    return {field: int(counters[field]) for field in IO_FIELDS if field in counters}
+
+
+def disk_usage(paths):
+    # Apparent size of every file under paths, in bytes
+    size = 0
+    for path in files(paths):
+        try:
+            size += os.path.getsize(path)
+        except FileNotFoundError:
+            continue
+    return size
+
+
+def ratio(numerator, denominator):
+    if numerator is None or not denominator:
+        return None
+    return numerator / denominator
+
+
+class IOProfiler:
+    """
+    I/O of one benchmark phase: the /proc/self/io counters of the process and
+    the size of the store's local files (BaseStore.storage_paths) around it.
+
+    Only the benchmark process is seen: the work of database servers shows as
+    socket traffic in rchar/wchar, and reads of memory-mapped files as page
+    faults in the memory stats rather than here. The reads of a
+    harness.memory.MemoryProfiler sampling the same phase, given as exclude,
+    are subtracted.
+    """
+
+    def __init__(self, name: str, paths=(), exclude=None):
+        self.name = name
+        self.paths = list(paths)
+        self.exclude = exclude
+        self.counters_start = self.counters_end = None
+        self.excluded_start = self.excluded_end = {}
+        self.size_start = self.size_end = None
+
+    def snapshot(self):
+        if self.exclude is None:
+            return io_counters(), {}
+        with self.exclude.sampler_lock:
+            return io_counters(), dict(self.exclude.sampler_io)
+
+    def __enter__(self):
+        self.size_start = disk_usage(self.paths) if self.paths else None
+        self.counters_start, self.excluded_start = self.snapshot()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.counters_end, self.excluded_end = self.snapshot()
+        self.size_end = disk_usage(self.paths) if self.paths else None
+
+    def counter(self, field):
+        if self.counters_start is None or self.counters_end is None:
+            return None
+        excluded = self.excluded_end.get(field, 0) - self.excluded_start.get(field, 0)
+        return self.counters_end.get(field, 0) - self.counters_start.get(field, 0) - excluded
+
+    def summary(self):
+        def mb(value):
+            return value / 1024 / 1024 if value is not None else None
+
+        return {
+            **{field: self.counter(field) for field in IO_FIELDS},
+            "size_start_mb": mb(self.size_start),
+            "size_end_mb": mb(self.size_end),
+            "size_growth_mb": mb(self.size_end - self.size_start) if self.paths else None,
+        }
+
+    def describe(self):
+        stats = self.summary()
+        if stats["wchar"] is None:
+            return "/proc/self/io is not available"
+        return (
+            f"read {stats['rchar'] / 1024 / 1024:.1f}MB in {stats['syscr']} calls "
+            f"({stats['read_bytes'] / 1024 / 1024:.1f}MB from disk), "
+            f"wrote {stats['wchar'] / 1024 / 1024:.1f}MB in {stats['syscw']} calls "
+            f"({stats['write_bytes'] / 1024 / 1024:.1f}MB to disk)"
+        )
+
+
+def amplification(io_stats, phases, total_size):
+    # Write amplification: bytes written while ingesting and finalizing per
+    # byte of the final footprint, as written by the process (wchar) and as
+    # dirtied on the disk (write_bytes, minus what was dropped before reaching
+    # it). Read amplification: bytes read per byte of snapshot returned, for
+    # every read phase. phases maps phase names to their harness.latency.PhaseRecorder.
+    stats = {}
+    for name, io in io_stats.items():
+        phase = phases.get(name)
+        if phase is None or name == "finalize" or io["wchar"] is None:
+            continue
+        calls = phase.histogram.count
+        stats[name] = {
+            "source_mb": phase.source_bytes / 1024 / 1024,
+            "syscalls_per_call": (io["syscr"] + io["syscw"]) / calls if calls else None,
+        }
+        if name == "write":
+            finalize = io_stats.get("finalize", {})
+            written = io["wchar"] + (finalize.get("wchar") or 0)
+            dirtied = sum(
+                (counters.get("write_bytes") or 0) - (counters.get("cancelled_write_bytes") or 0)
+                for counters in (io, finalize)
+            )
+            stats[name]["write_amplification"] = ratio(written, total_size)
+            stats[name]["disk_write_amplification"] = ratio(dirtied, total_size)
+        else:
+            stats[name]["read_amplification"] = ratio(io["rchar"], phase.source_bytes)
+            stats[name]["disk_read_amplification"] = ratio(io["read_bytes"], phase.source_bytes)
+    return stats
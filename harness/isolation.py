@@ -0,0 +1,38 @@
+import multiprocessing
+import traceback
+
+
+def child(target, args, connection):
+    try:
+        connection.send((target(*args), None))
+    except Exception:
+        connection.send((None, traceback.format_exc()))
+    finally:
+        connection.close()
+
+
+def run_isolated(target, *args):
+    # Calls target(*args) in a freshly spawned interpreter and returns its result,
+    # sent back over a pipe. Nothing imported or allocated by target survives it.
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=child, args=(target, args, sender))
+    process.start()
+    # Only the child holds the sending end, so recv fails if it dies without a result
+    sender.close()
+    received = False
+    try:
+        result, error = receiver.recv()
+        received = True
+    except EOFError:
+        pass
+    finally:
+        receiver.close()
+        process.join()
+
+    if not received:
+        result, error = None, f"the process exited with code {process.exitcode} without a result"
+
+    if error:
+        raise RuntimeError(f"Isolated run of {target.__name__} failed:\n{error}")
+    return result
@@ -0,0 +1,131 @@
+import time
+
+# Number of linear sub-buckets per power of two, as in an HDR histogram with
+# ~2 significant digits: every recorded value is kept within 1/128 relative error.
+SUB_BUCKET_BITS = 7
+TIMELINE_WINDOWS = 100
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+class LatencyHistogram:
+    def __init__(self, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def bucket_index(self, value: int):
+        exponent = max(value.bit_length() - self.sub_bucket_bits, 0)
+        return exponent, value >> exponent
+
+    def bucket_value(self, index):
+        exponent, sub_bucket = index
+        # Report the upper bound of the bucket, so percentiles never under-report
+        return ((sub_bucket + 1) << exponent) - 1
+
+    def record(self, value: int):
+        index = self.bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q: float):
+        if not self.count:
+            return 0
+        threshold = q / 100 * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= threshold:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        # All latencies are reported in milliseconds
+        return {
+            "count": self.count,
+            "min_ms": (self.min or 0) / 1e6,
+            "mean_ms": self.total / self.count / 1e6 if self.count else 0,
+            **{f"p{q}_ms": self.percentile(q) / 1e6 for q in PERCENTILES},
+            "max_ms": (self.max or 0) / 1e6,
+        }
+
+
+class PhaseRecorder:
+    """Collects the latency of every call of one benchmark phase of one store."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.histogram = LatencyHistogram()
+        self.samples = []
+        self.features = 0
+        # Size of the input snapshots written or returned, for the I/O amplification
+        self.source_bytes = 0
+        self.first_start = None
+        self.last_end = None
+
+    def record(self, start: int, end: int, features: int = 0):
+        if self.first_start is None:
+            self.first_start = start
+        self.last_end = end
+        self.histogram.record(end - start)
+        self.samples.append((start - self.first_start, end - start))
+        self.features += features
+
+    def measure(self, fn, *args, features: int = 0):
+        start = time.perf_counter_ns()
+        result = fn(*args)
+        self.record(start, time.perf_counter_ns(), features)
+        return result
+
+    def timeline(self, windows=TIMELINE_WINDOWS):
+        # Latency over time, split in equal call-count windows
+        if not self.samples:
+            return []
+        size = max(len(self.samples) // windows, 1)
+        series = []
+        for i in range(0, len(self.samples), size):
+            window = LatencyHistogram()
+            for _, latency in self.samples[i:i + size]:
+                window.record(latency)
+            series.append(
+                {
+                    "offset_s": self.samples[i][0] / 1e9,
+                    "calls": window.count,
+                    "p50_ms": window.percentile(50) / 1e6,
+                    "p99_ms": window.percentile(99) / 1e6,
+                    "max_ms": window.max / 1e6,
+                }
+            )
+        return series
+
+    def summary(self):
+        wall = (self.last_end - self.first_start) / 1e9 if self.samples else 0
+        return {
+            **self.histogram.summary(),
+            "wall_s": wall,
+            "ops_per_s": self.histogram.count / wall if wall else 0,
+            "features_per_s": self.features / wall if wall else 0,
+            "timeline": self.timeline(),
+        }
+
+    def describe(self):
+        stats = self.histogram.summary()
+        return (
+            f"p50={stats['p50_ms']:.3f}ms p95={stats['p95_ms']:.3f}ms "
+            f"p99={stats['p99_ms']:.3f}ms max={stats['max_ms']:.3f}ms"
+        )
@@ -0,0 +1,230 @@
+import collections
+import multiprocessing
+import queue
+import random
+import threading
+import time
+import traceback
+
+from harness.latency import LatencyHistogram, PhaseRecorder
+
+# Time given to every reader to open its own store instance before the feed starts
+START_TIMEOUT = 120
+# Pause between two readability checks of the oldest snapshot not yet readable
+FRESHNESS_POLL = 0.001
+# Time left after the last write for the stored snapshots to become readable
+FRESHNESS_TIMEOUT = 10
+
+
+class Counter:
+    # Same interface as multiprocessing.Value for the thread mode
+    def __init__(self):
+        self.value = 0
+
+
+def readable(document):
+    # Stores return None, an empty FeatureCollection or raise for missing snapshots
+    if document is None:
+        return False
+    if isinstance(document, dict):
+        return bool(document.get("features"))
+    return True
+
+
+def live_reader(store_spec, timestamps, written, recent, seed, barrier, stop, results, client_id):
+    # Reads one of the `recent` latest written snapshots after the other until stopped
+    try:
+        store_class, args, kwargs = store_spec
+        store = store_class(*args, **kwargs)
+        rng = random.Random(seed)
+        histogram = LatencyHistogram()
+        # Reads that returned no features, timed apart: a buffering store
+        # answers them without reading anything
+        misses = LatencyHistogram()
+        errors = collections.Counter()
+        barrier.wait(timeout=START_TIMEOUT)
+        while not stop.is_set():
+            count = written.value
+            if not count:
+                time.sleep(FRESHNESS_POLL)
+                continue
+            timestamp = timestamps[rng.randrange(max(count - recent, 0), count)]
+            start = time.perf_counter_ns()
+            try:
+                document = store.get_document(timestamp)
+            except Exception as error:
+                # e.g. a file read while it is being rewritten
+                errors[type(error).__name__] += 1
+                # Retry as a dashboard would, without spinning on the failure
+                time.sleep(FRESHNESS_POLL)
+                continue
+            (histogram if readable(document) else misses).record(time.perf_counter_ns() - start)
+        results.put((client_id, histogram, dict(errors), misses, None))
+    except Exception:
+        barrier.abort()
+        results.put((client_id, None, {}, None, traceback.format_exc()))
+
+
+class FreshnessProbe(threading.Thread):
+    """
+    Time between the return of store_document and the first read that returns
+    the snapshot, polled on a store instance of its own. Snapshots are assumed
+    to become readable in the order they were written.
+    """
+
+    def __init__(self, store_spec):
+        super().__init__(daemon=True)
+        self.store_spec = store_spec
+        self.stored = queue.Queue()
+        self.done = threading.Event()
+        self.lag = LatencyHistogram()
+        self.unreadable = 0
+        self.error = None
+
+    def run(self):
+        try:
+            store_class, args, kwargs = self.store_spec
+            store = store_class(*args, **kwargs)
+            pending = collections.deque()
+            deadline = None
+            while True:
+                while not self.stored.empty():
+                    pending.append(self.stored.get())
+                if self.done.is_set():
+                    deadline = deadline or time.perf_counter_ns() + FRESHNESS_TIMEOUT * 1e9
+                    if not pending or time.perf_counter_ns() > deadline:
+                        break
+                if not pending:
+                    time.sleep(FRESHNESS_POLL)
+                    continue
+                timestamp, stored_at = pending[0]
+                try:
+                    document = store.get_document(timestamp)
+                except Exception:
+                    document = None
+                if readable(document):
+                    self.lag.record(time.perf_counter_ns() - stored_at)
+                    pending.popleft()
+                else:
+                    time.sleep(FRESHNESS_POLL)
+            self.unreadable = len(pending)
+        except Exception:
+            self.error = traceback.format_exc()
+
+
+def run_live_feed(store, documents, timestamps, interval, readers, recent=10, mode="thread", seed=0):
+    # One writer (this thread) storing a snapshot every `interval` seconds while
+    # `readers` clients read the latest ones, as dashboards following a live feed
+    if mode == "thread":
+        written = Counter()
+        barrier = threading.Barrier(readers + 1)
+        stop = threading.Event()
+        results = queue.Queue()
+        worker = threading.Thread
+    elif mode == "process":
+        context = multiprocessing.get_context("spawn")
+        written = context.Value("q", 0)
+        barrier = context.Barrier(readers + 1)
+        stop = context.Event()
+        results = context.Queue()
+        worker = context.Process
+    else:
+        raise ValueError(f"Unknown concurrency mode {mode}")
+
+    clients = [
+        worker(
+            target=live_reader,
+            args=(store.spec(), timestamps, written, recent, seed + i, barrier, stop, results, i),
+            daemon=True,
+        )
+        for i in range(readers)
+    ]
+    for client in clients:
+        client.start()
+    probe = FreshnessProbe(store.spec())
+    probe.start()
+
+    write_phase = PhaseRecorder("live_write")
+    # How late every write started compared to the schedule of the feed
+    behind = LatencyHistogram()
+    started = False
+    start = time.perf_counter_ns()
+    try:
+        try:
+            barrier.wait(timeout=START_TIMEOUT)
+            started = True
+        except threading.BrokenBarrierError:
+            # A reader failed to start, its traceback is reported below
+            documents = []
+        start = time.perf_counter_ns()
+        for i, (data, timestamp) in enumerate(documents):
+            scheduled = start + int(i * interval * 1e9)
+            delay = scheduled - time.perf_counter_ns()
+            if delay > 0:
+                time.sleep(delay / 1e9)
+            behind.record(max(-delay, 0))
+            write_phase.measure(store.store_document, data, timestamp, features=len(data["features"]))
+            probe.stored.put((timestamp, time.perf_counter_ns()))
+            written.value = i + 1
+    finally:
+        probe.done.set()
+        probe.join()
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+        stop.set()
+        # Releases the readers still waiting to start
+        barrier.abort()
+        outcomes = sorted(
+            (results.get(timeout=START_TIMEOUT) for _ in clients), key=lambda outcome: outcome[0]
+        )
+        for client in clients:
+            client.join()
+
+    failures = [error for *_, error in outcomes if error]
+    if failures:
+        raise RuntimeError(f"{len(failures)} live feed reader(s) failed:\n{failures[0]}")
+    if not started:
+        raise RuntimeError(f"The live feed readers did not start within {START_TIMEOUT}s")
+    if probe.error:
+        raise RuntimeError(f"The freshness probe failed:\n{probe.error}")
+
+    reads = LatencyHistogram()
+    misses = LatencyHistogram()
+    errors = collections.Counter()
+    for _, histogram, reader_errors, reader_misses, _ in outcomes:
+        reads.merge(histogram)
+        misses.merge(reader_misses)
+        errors.update(reader_errors)
+    return {
+        "mode": mode,
+        "readers": readers,
+        "interval_s": interval,
+        "documents": write_phase.histogram.count,
+        "write": write_phase.histogram.summary(),
+        "behind_schedule": behind.summary(),
+        # Reads that returned the snapshot
+        "read": {**reads.summary(), "ops_per_s": reads.count / elapsed},
+        # Reads that raised, by exception type, and reads that returned no features
+        "read_errors": dict(errors),
+        "empty_reads": misses.count,
+        "empty_read_rate": misses.count / (misses.count + reads.count) if misses.count else 0,
+        "empty_read": misses.summary(),
+        "freshness": probe.lag.summary(),
+        # Written snapshots still not readable FRESHNESS_TIMEOUT after the last write
+        "unreadable": probe.unreadable,
+    }
+
+
+def describe(result):
+    read, lag = result["read"], result["freshness"]
+    text = (
+        f"{result['readers']} {result['mode']} readers: {read['ops_per_s']:.1f} reads/s, "
+        f"p50={read['p50_ms']:.3f}ms p99={read['p99_ms']:.3f}ms under a write every {result['interval_s']}s; "
+        f"freshness lag p50={lag['p50_ms']:.3f}ms max={lag['max_ms']:.3f}ms"
+    )
+    if result["empty_reads"]:
+        text += f", {result['empty_read_rate']:.1%} of the reads returned no features"
+    if result["unreadable"]:
+        text += f", {result['unreadable']} snapshots not readable {FRESHNESS_TIMEOUT}s after the feed"
+    if result["read_errors"]:
+        text += ", read errors " + ", ".join(f"{name} x{count}" for name, count in result["read_errors"].items())
+    return text
@@ -0,0 +1,128 @@
+import os
+import resource
+import threading
+import tracemalloc
+
+# Interval between two reads of the resident set size
+RSS_SAMPLE_INTERVAL = 0.01
+TOP_ALLOCATIONS = 10
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss():
+    # Resident set size in bytes, None where /proc is not available
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return None
+
+
+class MemoryProfiler:
+    """
+    Memory used during one benchmark phase: resident set size sampled by a
+    background thread, page faults from getrusage and, with trace_allocations,
+    the Python heap peak and the lines that allocated the most with tracemalloc.
+
+    tracemalloc slows every Python allocation down, so latencies measured
+    while tracing allocations are not comparable to untraced runs.
+
+    The reads of the sampler show in /proc/self/io; sampler_io counts them
+    (rchar and syscr) for harness.io_accounting.IOProfiler to subtract.
+    """
+
+    def __init__(self, name: str, trace_allocations=False):
+        self.name = name
+        self.trace_allocations = trace_allocations
+        self.rss_start = self.rss_peak = self.rss_end = None
+        self.stop = threading.Event()
+        self.sampler = None
+        self.sampler_io = {"rchar": 0, "syscr": 0}
+        # Held while sampling, so that sampler_io matches the kernel counters
+        self.sampler_lock = threading.Lock()
+        self.usage_start = self.usage_end = None
+        self.snapshot_start = None
+        self.heap_start = self.heap_peak = self.heap_end = None
+        self.top_allocations = []
+
+    def sample(self):
+        try:
+            fd = os.open("/proc/self/statm", os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            while not self.stop.wait(RSS_SAMPLE_INTERVAL):
+                with self.sampler_lock:
+                    data = os.pread(fd, 4096, 0)
+                    self.sampler_io["rchar"] += len(data)
+                    self.sampler_io["syscr"] += 1
+                self.rss_peak = max(self.rss_peak or 0, int(data.split()[1]) * PAGE_SIZE)
+        finally:
+            os.close(fd)
+
+    def __enter__(self):
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.heap_start = tracemalloc.get_traced_memory()[0]
+            self.snapshot_start = tracemalloc.take_snapshot()
+        self.usage_start = resource.getrusage(resource.RUSAGE_SELF)
+        self.rss_start = self.rss_peak = current_rss()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop.set()
+        self.sampler.join()
+        self.rss_end = current_rss()
+        if self.rss_end is not None:
+            self.rss_peak = max(self.rss_peak or 0, self.rss_end)
+        self.usage_end = resource.getrusage(resource.RUSAGE_SELF)
+        if self.trace_allocations:
+            self.heap_end, self.heap_peak = tracemalloc.get_traced_memory()
+            statistics = tracemalloc.take_snapshot().compare_to(self.snapshot_start, "lineno")
+            self.top_allocations = [
+                {
+                    "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_diff_kb": stat.size_diff / 1024,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in statistics[:TOP_ALLOCATIONS]
+            ]
+            self.snapshot_start = None
+
+    def summary(self):
+        # All sizes are reported in megabytes
+        def mb(value):
+            return value / 1024 / 1024 if value is not None else None
+
+        rss_known = self.rss_start is not None and self.rss_end is not None
+        return {
+            "rss_start_mb": mb(self.rss_start),
+            "rss_peak_mb": mb(self.rss_peak),
+            "rss_end_mb": mb(self.rss_end),
+            # Memory still held at the end of the phase, e.g. data kept in memory
+            "rss_retained_mb": mb(self.rss_end - self.rss_start) if rss_known else None,
+            "rss_peak_growth_mb": mb(self.rss_peak - self.rss_start) if rss_known else None,
+            "max_rss_mb": self.usage_end.ru_maxrss / 1024,
+            "minor_faults": self.usage_end.ru_minflt - self.usage_start.ru_minflt,
+            "major_faults": self.usage_end.ru_majflt - self.usage_start.ru_majflt,
+            "heap_peak_mb": mb(self.heap_peak),
+            "heap_peak_growth_mb": mb(self.heap_peak - self.heap_start) if self.heap_peak is not None else None,
+            "heap_end_mb": mb(self.heap_end),
+            "top_allocations": self.top_allocations,
+        }
+
+    def describe(self):
+        stats = self.summary()
+        if stats["rss_peak_mb"] is None:
+            return f"max RSS {stats['max_rss_mb']:.1f}MB"
+        text = (
+            f"RSS peak {stats['rss_peak_mb']:.1f}MB (+{stats['rss_peak_growth_mb']:.1f}MB), "
+            f"retained {stats['rss_retained_mb']:+.1f}MB"
+        )
+        if stats["heap_peak_mb"] is not None:
+            text += f", Python heap peak {stats['heap_peak_mb']:.1f}MB"
+        return text
@@ -0,0 +1,29 @@
+import os
+
+
+def files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                yield from (os.path.join(root, name) for name in names)
+        elif os.path.isfile(path):
+            yield path
+
+
+def evict(paths):
+    # Drops the pages of every file under paths from the OS page cache, so the
+    # next read goes to the disk. Returns False where posix_fadvise is missing.
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in files(paths):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            # Dirty pages are not dropped, write them back first
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
@@ -0,0 +1,163 @@
+import collections
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+
+from harness.flamegraph import render
+
+# "sample": a background thread records the stack of the profiled thread every
+# SAMPLE_INTERVAL, which costs little and keeps latencies comparable.
+# "cprofile": deterministic, sees C functions (pyarrow, zlib, drivers) as frames
+# of their own, but slows down every Python call. Used where the interpreter
+# cannot read the stacks of other threads.
+PROFILER = "sample"
+SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 15
+
+
+def file_name(name):
+    # Store names contain parameters, e.g. ApacheParquetStore(compression=zstd, ...)
+    return re.sub(r"[^\w.=-]+", "_", name).strip("_")
+
+
+def function_label(function):
+    # pstats key (filename, line, function), built-ins have the filename "~"
+    filename, line, name = function
+    if filename == "~":
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def cprofile_stacks(stats):
+    # pstats only knows the time spent between every caller and callee, so the
+    # stacks are rebuilt from the entry points, splitting the time of a function
+    # between its callers in proportion to the time every caller spent in it
+    callees = collections.defaultdict(dict)
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller][function] = edge[3]
+    stacks = collections.Counter()
+
+    def walk(function, path, share):
+        _, _, self_time, total_time, _ = stats[function]
+        path = path + (function,)
+        weight = round(self_time * share * 1e6)
+        if weight:
+            stacks[";".join(map(function_label, path))] += weight
+        for callee, time_in_callee in callees[function].items():
+            # Recursion is folded into the first frame of the function
+            if callee in path or time_in_callee * share < 1e-6:
+                continue
+            walk(callee, path, time_in_callee * share / stats[callee][3])
+
+    for function, entry in stats.items():
+        if not entry[4] and entry[3]:
+            walk(function, (), 1)
+    return stacks
+
+
+class Profiler:
+    """
+    CPU profile of one benchmark phase on the thread that runs it, as collapsed
+    stacks ("outer;inner;leaf" -> microseconds) for flame graphs.
+
+    The sampling profiler labels every frame with the line it is executing, so
+    time spent in C code (pyarrow.concat_tables, json.loads, ...) shows as the
+    self time of the line that calls it.
+    """
+
+    def __init__(self, name: str, mode=PROFILER):
+        self.name = name
+        self.mode = mode if mode != "sample" or hasattr(sys, "_current_frames") else "cprofile"
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.thread_id = None
+        self.stop = threading.Event()
+        self.sampler = None
+        self.profile = None
+        self.labels = {}
+
+    def label(self, frame):
+        key = (frame.f_code, frame.f_lineno)
+        if key not in self.labels:
+            code = frame.f_code
+            self.labels[key] = f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        return self.labels[key]
+
+    def sample(self):
+        last = time.perf_counter_ns()
+        while not self.stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter_ns()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self.label(frame))
+                frame = frame.f_back
+            # The time since the previous sample, the sampler is not woken up
+            # exactly every SAMPLE_INTERVAL while the profiled thread holds the GIL
+            self.stacks[";".join(reversed(stack))] += (now - last) // 1000
+            self.samples += 1
+            last = now
+
+    def __enter__(self):
+        if self.mode == "sample":
+            self.thread_id = threading.get_ident()
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+        else:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.mode == "sample":
+            self.stop.set()
+            self.sampler.join()
+        else:
+            self.profile.disable()
+            self.stacks = cprofile_stacks(pstats.Stats(self.profile).stats)
+            self.profile = None
+
+    def self_times(self):
+        # Functions (or lines when sampling) by time spent in them, callees excluded
+        times = collections.Counter()
+        for stack, weight in self.stacks.items():
+            times[stack.rpartition(";")[2]] += weight
+        return times.most_common(TOP_FUNCTIONS)
+
+    def write(self, directory: str, store_name: str):
+        # Collapsed stacks (for flamegraph.pl, speedscope, ...) and an SVG flame graph
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"{file_name(store_name)}_{self.name}")
+        with open(f"{prefix}.collapsed", "w") as file:
+            file.writelines(f"{stack} {weight}\n" for stack, weight in sorted(self.stacks.items()))
+        with open(f"{prefix}.svg", "w") as file:
+            file.write(render(self.stacks, f"{store_name} {self.name} ({self.mode})"))
+        return prefix
+
+    def summary(self):
+        total = sum(self.stacks.values())
+        return {
+            "mode": self.mode,
+            "total_ms": total / 1000,
+            "samples": self.samples if self.mode == "sample" else None,
+            "top_self_time": [
+                {"function": function, "self_ms": weight / 1000, "share": weight / total}
+                for function, weight in self.self_times()
+            ],
+        }
+
+    def describe(self):
+        stats = self.summary()
+        lines = [f"{'self ms':>10} {'share':>7}  function ({stats['mode']}, {stats['total_ms']:.0f}ms)"]
+        lines += [
+            f"{row['self_ms']:10.1f} {row['share']:7.1%}  {row['function']}"
+            for row in stats["top_self_time"]
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,97 @@
+import dataclasses
+import fnmatch
+import importlib
+import itertools
+import tomllib
+
+# Every store of the benchmark, as "module:Class". Modules are only imported
+# when one of their stores is selected, so unused drivers (pyspark, pymongo, ...)
+# never slow the harness down.
+STORES = {
+    "file": "stores.file_store:FileStore",
+    "gzip-file": "stores.gzip_file_store:GZipFileStore",
+    "all-in-one-gzip": "stores.all_in_one_gzip_file_store:AllInOneGZipFileStore",
+    "zstd-dictionary-file": "stores.zstd_dictionary_file_store:ZstdDictionaryFileStore",
+    "segment": "stores.segment_store:SegmentStore",
+    "delta-encoded": "stores.delta_encoded_store:DeltaEncodedStore",
+    "parquet": "stores.apache_parquet:ApacheParquetStore",
+    "memmap-columnar": "stores.memmap_columnar_store:MemmapColumnarStore",
+    "parquet-cantor": "stores.apache_parquet_cantor:ApacheParquetCantorStore",
+    "parquet-velocity": "stores.apache_parquet_velocity:ApacheParquetVelocityStore",
+    "delta-lake": "stores.delta_lake:DeltaLakeStore",
+    "mongo": "stores.mongo_store:MongoStore",
+    "mongo-timeseries": "stores.mongo_timeseries_store:MongoTimeSeriesStore",
+    "postgresql-python-conv": "stores.postgresql_python_conv:PostgreSQLPythonReadStore",
+    "postgresql-better-write": "stores.postgresql_better_write:PostgreSQLPythonBetterWriteStore",
+    "postgresql-sql-text-conv": "stores.postgresql_sql_text_conv:PostgreSQLTextConvStore",
+    "postgresql-json-agg": "stores.postgresql_json_agg_store:PostgreJSONAggSQLStore",
+    "postgresql-compressed-snappy": "stores.postgresql_compressed_snappy:PostgreSQLCompressedSnappy",
+    "postgresql-velocity": "stores.postgresql_velocity:PostgreSQLVelocityStore",
+    "postgresql-velocity-2levels": "stores.postgresql_velocity_2levels:PostgreSQLVelocity2Store",
+    "postgresql-velocity-inline": "stores.postgresql_velocity_inline:PostgreSQLVelocityInlineStore",
+    "postgresql-velocity-split": "stores.postgresql_velocity_split:PostgreSQLVelocitySplitStore",
+    "citus": "stores.citus_store:CitusStore",
+    "timescaledb": "stores.timescaledb_store:TimeScaleDBTimeSeriesStore",
+    "mobilitydb": "stores.mobility_db:MobilityDBStore",
+    "mobilitydb-batch": "stores.mobility_db_batch:MobilityDBBatchStore",
+    "mobilitydb-batch-gzip": "stores.mobility_db_batch_gzip:MobilityDBBatchCompressedGZIPStore",
+    "mobilitydb-batch-snappy": "stores.mobility_db_batch_snappy:MobilityDBBatchCompressedSnappyStore",
+    "mobilitydb-snappy": "stores.mobility_db_snappy:MobilityDBBatchCompressedSnappyStore",
+    "motion-lake": "stores.motion_lake:MotionLakeStore",
+}
+
+
+def load_class(name: str):
+    # A registered name, or any "module:Class" string
+    target = STORES.get(name, name)
+    module, _, class_name = target.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown store {name}, expected one of {', '.join(STORES)} or module:Class")
+    return getattr(importlib.import_module(module), class_name)
+
+
+@dataclasses.dataclass
+class StoreEntry:
+    """One store configuration to benchmark, opened only when it runs."""
+
+    name: str
+    params: dict = dataclasses.field(default_factory=dict)
+    # Whether to run the read benchmarks
+    read: bool = True
+
+    def open(self):
+        return load_class(self.name)(**self.params)
+
+    def __str__(self):
+        params = ", ".join(f"{key}={value!r}" for key, value in self.params.items())
+        return f"{self.name}({params})"
+
+
+def expand(store: dict):
+    # One entry per combination of the values listed in the sweep table
+    sweep = store.get("sweep", {})
+    for values in itertools.product(*sweep.values()):
+        params = {**store.get("params", {}), **dict(zip(sweep, values))}
+        yield StoreEntry(store["name"], params, store.get("read", True))
+
+
+def load_config(path: str):
+    # [[store]] tables of a TOML file: name, params, sweep and read
+    with open(path, "rb") as file:
+        config = tomllib.load(file)
+    return [entry for store in config.get("store", []) for entry in expand(store)]
+
+
+def select(entries, patterns):
+    # Configured entries whose name matches one of the glob patterns, then any
+    # other registered store matching them, with its default parameters
+    if not patterns:
+        return entries
+    selected = [entry for entry in entries if any(fnmatch.fnmatch(entry.name, p) for p in patterns)]
+    configured = {entry.name for entry in entries}
+    selected += [
+        StoreEntry(name)
+        for name in STORES
+        if name not in configured and any(fnmatch.fnmatch(name, p) for p in patterns)
+    ]
+    return selected
@@ -0,0 +1,71 @@
+import math
+
+import numpy
+
+SCALING_SIZES = (100, 1000, 10000, 100000, 1000000)
+# Exponent of the cost per operation above which a store no longer scales: with
+# 0 every operation costs the same whatever the size, with 1 the cost of an
+# operation grows linearly with the number of documents stored (quadratic ingest)
+SCALING_LIMIT = 0.5
+
+
+def growth_exponent(sizes, values):
+    # Slope of the least squares fit of log(value) against log(size)
+    points = [(math.log(s), math.log(v)) for s, v in zip(sizes, values) if v > 0]
+    if len(points) < 2:
+        return None
+    x, y = zip(*points)
+    return float(numpy.polyfit(x, y, 1)[0])
+
+
+def local_exponents(sizes, values):
+    # Exponent between every two consecutive sizes, keyed by the larger one
+    return {
+        b: math.log(vb / va) / math.log(b / a)
+        for (a, va), (b, vb) in zip(zip(sizes, values), zip(sizes[1:], values[1:]))
+        if va > 0 and vb > 0
+    }
+
+
+class ScalingCurve:
+    """Cost per operation of every phase of one store at increasing data sizes."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.points = {}
+        self.stopped_at = None
+
+    def add(self, phase: str, size: int, value: float):
+        self.points.setdefault(phase, []).append((size, value))
+
+    def phase_summary(self, phase):
+        sizes, values = zip(*self.points[phase])
+        local = local_exponents(sizes, values)
+        return {
+            "sizes": list(sizes),
+            "mean_ms": list(values),
+            "exponent": growth_exponent(sizes, values),
+            "local_exponents": {str(size): exponent for size, exponent in local.items()},
+            # First size at which the cost per operation grew faster than allowed
+            "stops_scaling_at": next((size for size, e in local.items() if e > SCALING_LIMIT), None),
+        }
+
+    def summary(self):
+        return {
+            "phases": {phase: self.phase_summary(phase) for phase in self.points},
+            # Size the sweep did not reach because a step took too long
+            "stopped_at": self.stopped_at,
+        }
+
+    def describe(self):
+        lines = []
+        for phase, stats in self.summary()["phases"].items():
+            exponent = "n/a" if stats["exponent"] is None else f"{stats['exponent']:+.2f}"
+            verdict = (
+                f"stops scaling at {stats['stops_scaling_at']} documents"
+                if stats["stops_scaling_at"] else "scales"
+            )
+            lines.append(f"{self.name} {phase}: cost per operation ~ N^{exponent}, {verdict}")
+        if self.stopped_at:
+            lines.append(f"{self.name}: sweep stopped before {self.stopped_at} documents")
+        return "\n".join(lines)
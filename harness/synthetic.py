@@ -0,0 +1,264 @@
+import datetime
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import uuid
+
+import numpy
+
+from harness.input_pack import InputPack, pack_row, write_pack
+
+# Bumped whenever the generated data changes for the same parameters
+GENERATOR_VERSION = 1
+START = "2024-03-20T00:00:00"
+
+# Brussels, around which the lines are laid out
+CENTER = (4.3517, 50.8466)
+METERS_PER_DEGREE = 111320
+
+# Per kind of line: number of lines, route length (m), distance between stops
+# (m), speed range (m/s), headway at peak (s) and vehicle numbers, close to the
+# STIB network (about 700 vehicles at peak)
+LINE_KINDS = {
+    "metro": dict(lines=4, length=(12000, 20000), stop_spacing=800, speed=(8, 11), headway=300, fleet=(1000, 1999)),
+    "tram": dict(lines=17, length=(8000, 15000), stop_spacing=400, speed=(4.5, 6.5), headway=480, fleet=(2000, 3999)),
+    "bus": dict(lines=55, length=(6000, 14000), stop_spacing=350, speed=(3.5, 5.5), headway=600, fleet=(5000, 9999)),
+}
+
+# Share of the trips of the timetable that run, by hour of the day
+SERVICE_LEVELS = (
+    0.05, 0.05, 0.05, 0.05, 0.05, 0.4, 0.8, 1.0, 1.0, 0.8, 0.8, 0.8,
+    0.8, 0.8, 0.8, 0.8, 1.0, 1.0, 1.0, 0.7, 0.7, 0.45, 0.45, 0.45,
+)
+
+COLORS = (
+    "#C4008F", "#F57000", "#0078AD", "#E6B012", "#ED6E86", "#9EBE24", "#5BC2E7", "#DE3B21",
+    "#95C11F", "#B0549F", "#5E5E5E", "#00A551", "#F4A6B7", "#005CA9", "#FFD500", "#8C6E4B",
+)
+
+def mix(*values):
+    # splitmix64 over a sequence of integers (or uint64 arrays), so every random
+    # draw is a pure function of the seed and of what it is drawn for
+    h = numpy.uint64(0x9E3779B97F4A7C15)
+    with numpy.errstate(over="ignore"):
+        for value in values:
+            h = h ^ numpy.asarray(value, dtype=numpy.uint64)
+            h = h + numpy.uint64(0x9E3779B97F4A7C15)
+            h = (h ^ (h >> numpy.uint64(30))) * numpy.uint64(0xBF58476D1CE4E5B9)
+            h = (h ^ (h >> numpy.uint64(27))) * numpy.uint64(0x94D049BB133111EB)
+            h = h ^ (h >> numpy.uint64(31))
+    return h
+
+
+def uniform(h):
+    return (numpy.asarray(h, dtype=numpy.uint64) >> numpy.uint64(11)).astype(numpy.float64) / (1 << 53)
+
+
+class SyntheticNetwork:
+    """
+    Deterministic STIB-like network: lines are polylines of stops around
+    Brussels, and vehicles run scheduled trips along them in both directions.
+
+    The position of every vehicle is a function of the time only (departure of
+    its trip and its speed), so any snapshot can be generated independently of
+    the previous ones, in any order and in parallel.
+    """
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        rng = numpy.random.default_rng(seed)
+        routes = []
+        point_ids = iter(rng.permutation(9000) + 1000)
+        number = itertools.count(1)
+        for kind, params in LINE_KINDS.items():
+            for _ in range(params["lines"]):
+                line_id = str(next(number))
+                color = COLORS[rng.integers(len(COLORS))]
+                stops = self.layout(rng, params)
+                for direction, route_stops in ((1, stops), (2, stops[::-1])):
+                    routes.append(
+                        dict(
+                            line_id=line_id,
+                            color=color,
+                            direction=direction,
+                            stops=route_stops,
+                            point_ids=[str(next(point_ids)) for _ in route_stops],
+                            speed=params["speed"],
+                            headway=params["headway"],
+                            offset=rng.uniform(0, params["headway"]),
+                            fleet=params["fleet"],
+                        )
+                    )
+        self.routes = routes
+
+        # All the stops of all the routes concatenated
+        self.stops = numpy.concatenate([route["stops"] for route in routes])
+        self.point_ids = [point_id for route in routes for point_id in route["point_ids"]]
+        stop_distances = [self.distances(route["stops"]) for route in routes]
+        self.lengths = numpy.array([distances[-1] for distances in stop_distances])
+        # Routes laid end to end (1 m apart) on a single axis, so the last stop
+        # passed by every vehicle is found with one searchsorted
+        self.route_starts = numpy.cumsum(numpy.concatenate([[0], self.lengths[:-1] + 1]))
+        self.stop_positions = numpy.concatenate(
+            [distances + start for distances, start in zip(stop_distances, self.route_starts)]
+        )
+
+        # Candidate trips: the last max_trips trips of a route may still be running
+        self.headways = numpy.array([route["headway"] for route in routes], dtype=numpy.float64)
+        self.offsets = numpy.array([route["offset"] for route in routes])
+        self.min_speeds = numpy.array([route["speed"][0] for route in routes])
+        self.max_speeds = numpy.array([route["speed"][1] for route in routes])
+        max_trips = numpy.ceil(self.lengths / self.min_speeds / self.headways).astype(numpy.int64) + 1
+        self.candidate_routes = numpy.repeat(numpy.arange(len(routes)), max_trips)
+        self.candidate_rank = numpy.concatenate([numpy.arange(n) for n in max_trips])
+
+        self.trips = {}
+
+    @staticmethod
+    def layout(rng, params):
+        # Random walk from near the center, turning a little at every stop
+        length = rng.uniform(*params["length"])
+        count = max(int(length / params["stop_spacing"]), 2) + 1
+        heading = rng.uniform(0, 2 * math.pi)
+        x, y = rng.normal(0, 2500, 2)
+        points = [(x, y)]
+        for _ in range(count - 1):
+            heading += rng.normal(0, 0.3)
+            step = params["stop_spacing"] * rng.uniform(0.6, 1.4)
+            x, y = x + step * math.cos(heading), y + step * math.sin(heading)
+            points.append((x, y))
+        points = numpy.array(points)
+        # Metres around the center to longitude / latitude
+        latitude = CENTER[1] + points[:, 1] / METERS_PER_DEGREE
+        longitude = CENTER[0] + points[:, 0] / (METERS_PER_DEGREE * math.cos(math.radians(CENTER[1])))
+        return numpy.column_stack([longitude, latitude])
+
+    @staticmethod
+    def distances(stops):
+        dx = numpy.diff(stops[:, 0]) * METERS_PER_DEGREE * math.cos(math.radians(CENTER[1]))
+        dy = numpy.diff(stops[:, 1]) * METERS_PER_DEGREE
+        return numpy.concatenate([[0], numpy.cumsum(numpy.hypot(dx, dy))])
+
+    def trip(self, route, number, h):
+        # uuid and vehicle number of a trip, cached while the trip is running
+        key = (route, number)
+        trip = self.trips.get(key)
+        if trip is None:
+            if len(self.trips) > 100000:
+                self.trips.clear()
+            low, high = self.routes[route]["fleet"]
+            trip_uuid = uuid.UUID(int=int(mix(h, 1)) << 64 | int(mix(h, 2)), version=4)
+            trip = self.trips[key] = (str(trip_uuid), low + int(mix(h, 3)) % (high - low + 1))
+        return trip
+
+    def snapshot(self, moment: float):
+        # FeatureCollection of the vehicles running at the given unix timestamp
+        routes, rank = self.candidate_routes, self.candidate_rank
+        headways = self.headways[routes]
+        numbers = numpy.floor((moment - self.offsets[routes]) / headways).astype(numpy.int64) - rank
+        departures = self.offsets[routes] + numbers * headways
+
+        h = mix(self.seed, routes, numbers.view(numpy.uint64))
+        hours = ((departures // 3600) % 24).astype(numpy.int64)
+        speeds = self.min_speeds[routes] + (self.max_speeds[routes] - self.min_speeds[routes]) * uniform(mix(h, 4))
+        travelled = (moment - departures) * speeds
+
+        running = (uniform(h) < numpy.array(SERVICE_LEVELS)[hours]) & (travelled < self.lengths[routes])
+        routes, numbers, h, travelled = routes[running], numbers[running], h[running], travelled[running]
+
+        positions = self.route_starts[routes] + travelled
+        stops = numpy.searchsorted(self.stop_positions, positions, side="right") - 1
+        from_stop = positions - self.stop_positions[stops]
+        fractions = from_stop / (self.stop_positions[stops + 1] - self.stop_positions[stops])
+        coordinates = self.stops[stops] + fractions[:, None] * (self.stops[stops + 1] - self.stops[stops])
+
+        features = []
+        for route, number, trip_hash, distance, stop, from_point, (longitude, latitude) in zip(
+            routes.tolist(), numbers.tolist(), h.tolist(), travelled.tolist(), stops.tolist(),
+            from_stop.astype(numpy.int64).tolist(), coordinates.tolist(),
+        ):
+            trip_uuid, vehicle = self.trip(route, number, trip_hash)
+            info = self.routes[route]
+            features.append(
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [longitude, latitude]},
+                    "id": trip_uuid,
+                    "properties": {
+                        "uuid": trip_uuid,
+                        "id": vehicle,
+                        "color": info["color"],
+                        "direction": info["direction"],
+                        "distance": distance,
+                        "distanceFromPoint": from_point,
+                        "lineId": info["line_id"],
+                        "pointId": self.point_ids[stop],
+                    },
+                }
+            )
+        return {"type": "FeatureCollection", "features": features}
+
+
+def timestamps(start, count, interval):
+    # ISO timestamps of the snapshots, as in the file names of data/
+    start = datetime.datetime.fromisoformat(start)
+    for i in range(count):
+        yield (start + datetime.timedelta(seconds=i * interval)).isoformat()
+
+
+def generate(seed=0, start=START, count=1000, interval=20):
+    # yield (document, timestamp) for count snapshots every interval seconds
+    network = SyntheticNetwork(seed)
+    for timestamp in timestamps(start, count, interval):
+        moment = datetime.datetime.fromisoformat(timestamp).replace(tzinfo=datetime.timezone.utc)
+        yield network.snapshot(moment.timestamp()), timestamp
+
+
+def generate_chunk(args):
+    seed, start, count, interval, encode = args
+    return [encode(document, timestamp) for document, timestamp in generate(seed, start, count, interval)]
+
+
+def keep_document(document, timestamp):
+    return document, timestamp
+
+
+def encode_json(document, timestamp):
+    return json.dumps(document).encode(), timestamp
+
+
+def generate_parallel(
+    seed=0, start=START, count=1000, interval=20, encode=encode_json, workers=None, chunk_size=200
+):
+    # yield encode(document, timestamp) in timestamp order, generated by a pool
+    # of processes working on chunks of consecutive snapshots
+    first_moment = datetime.datetime.fromisoformat(start)
+    chunks = [
+        (seed, (first_moment + datetime.timedelta(seconds=first * interval)).isoformat(),
+         min(chunk_size, count - first), interval, encode)
+        for first in range(0, count, chunk_size)
+    ]
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        for chunk in chunks:
+            yield from generate_chunk(chunk)
+        return
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        for rows in pool.imap(generate_chunk, chunks):
+            yield from rows
+
+
+def load_pack(seed=0, start=START, count=1000, interval=20, path="synthetic.arrow", workers=None):
+    # Input pack of generated snapshots, only generated again when the
+    # parameters (or the generator) change
+    parameters = f"{GENERATOR_VERSION}:{seed}:{start}:{count}:{interval}"
+    fingerprint = hashlib.sha1(parameters.encode()).hexdigest()
+
+    def build():
+        print(f"Generating {count} synthetic snapshots into {path}")
+        write_pack(path, generate_parallel(seed, start, count, interval, pack_row, workers), fingerprint)
+
+    return InputPack.open(path, fingerprint, build)
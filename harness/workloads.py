@@ -0,0 +1,60 @@
+import itertools
+import random
+
+# Every workload is an endless generator of the timestamps to read, drawn from
+# timestamps (sorted ascending, so the latest snapshot is the last one)
+
+
+def uniform(timestamps, rng):
+    # Every snapshot is equally likely
+    while True:
+        yield from rng.choices(timestamps, k=1024)
+
+
+def zipf(timestamps, rng, skew=1.1):
+    # The k-th most recent snapshot is read with a probability proportional to
+    # 1 / k^skew: the higher the skew, the more reads hit the latest snapshots
+    weights = itertools.accumulate(1 / rank ** skew for rank in range(1, len(timestamps) + 1))
+    cum_weights = list(weights)
+    newest_first = timestamps[::-1]
+    while True:
+        yield from rng.choices(newest_first, cum_weights=cum_weights, k=1024)
+
+
+def latest(timestamps, rng, n=100):
+    # Uniform over the n latest snapshots only, as dashboards polling recent data
+    yield from uniform(timestamps[-n:], rng)
+
+
+def sequential(timestamps, rng):
+    # Playback of the whole history from a random snapshot, wrapping around
+    start = rng.randrange(len(timestamps))
+    yield from itertools.cycle(timestamps[start:] + timestamps[:start])
+
+
+def burst(timestamps, rng, length=50):
+    # Replays of length consecutive snapshots from random points in the history
+    while True:
+        start = rng.randrange(max(len(timestamps) - length, 1))
+        yield from timestamps[start:start + length]
+
+
+WORKLOADS = {
+    "uniform": uniform,
+    "zipf": zipf,
+    "latest": latest,
+    "sequential": sequential,
+    "burst": burst,
+}
+
+
+def workload(timestamps, name="uniform", params=None, seed=None):
+    # Endless timestamps of the named workload, reproducible for a given seed
+    if name not in WORKLOADS:
+        raise ValueError(f"Unknown workload {name}, expected one of {', '.join(WORKLOADS)}")
+    return WORKLOADS[name](list(timestamps), random.Random(seed), **(params or {}))
+
+
+def draw(reads, k):
+    # The next k timestamps of a workload
+    return list(itertools.islice(reads, k))
@@ -1,37 +1,191 @@
 import json
+import mmap
 import os
 import shutil
+import struct
 
 from stores.base_store import BaseStore
 import gzip
 
+# Single file container of gzip blocks, each holding block_snapshots snapshots,
+# appended one after the other and followed by an index once finalized:
+#
+#   block:   b"BLK1" | header length | payload length | header | payload
+#   header:  JSON [[timestamp, length of its JSON in the payload], ...]
+#   payload: gzip of the JSON of the snapshots of the block, concatenated
+#   footer:  b"IDX1" | index length | 0 | index | footer offset | b"END1"
+#   index:   gzip of the JSON {timestamp: [block offset, block length]}
+#
+# Appending after finalize only truncates the footer, blocks are never
+# rewritten. A reader of a file without footer (still being written) indexes
+# the block headers instead.
+PATH = 'tmp/all.blocks'
+RECORD = struct.Struct('<4sII')
+TRAILER = struct.Struct('<Q4s')
+
 
 class AllInOneGZipFileStore(BaseStore):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Create tmp directory if it doesn't exist
         os.makedirs('tmp', exist_ok=True)
-        self.memory = []
+        self.block_snapshots = kwargs.get('block_snapshots', 10)
+        self.pending = []
+        self.clear_index()
+
+    def clear_index(self):
+        # timestamp -> (offset, length) of its block
+        self.index = {}
+        # Size of the file when last mapped, and offset up to which it is indexed
+        self.size = 0
+        self.scanned = 0
+        # Offset of the footer when the file ends with one
+        self.footer = None
+        self.map = None
+        self.block = (None, None)
 
     def reset(self):
+        if self.map is not None:
+            self.map.close()
         shutil.rmtree('tmp')
         os.makedirs('tmp', exist_ok=False)
-        self.memory = []
+        self.pending = []
+        self.clear_index()
 
     def store_document(self, data: dict, timestamp: str):
-        self.memory.append({'timestamp': timestamp, 'data': data})
+        self.store_raw(json.dumps(data).encode(), timestamp)
+
+    def store_raw(self, raw: bytes, timestamp: str):
+        # Blocks hold the JSON of the snapshots, the original file is kept as is
+        self.pending.append((timestamp, raw))
+        if len(self.pending) >= self.block_snapshots:
+            self.write_block()
+
+    def write_block(self):
+        if not self.pending:
+            return
+        self.refresh()
+        header = json.dumps([[timestamp, len(raw)] for timestamp, raw in self.pending]).encode()
+        payload = gzip.compress(b''.join(raw for _, raw in self.pending))
+        record = RECORD.pack(b'BLK1', len(header), len(payload)) + header + payload
+        with open(PATH, 'ab') as file:
+            if self.footer is not None:
+                file.truncate(self.footer)
+                self.footer = None
+            file.seek(0, os.SEEK_END)
+            offset = file.tell()
+            file.write(record)
+        for timestamp, _ in self.pending:
+            self.index[timestamp] = (offset, len(record))
+        self.scanned = offset + len(record)
+        self.pending = []
+
+    def refresh(self):
+        # Index the blocks appended to the file since the last call
+        try:
+            size = os.path.getsize(PATH)
+        except FileNotFoundError:
+            return
+        if size == self.size:
+            return
+        if self.map is not None:
+            self.map.close()
+        with open(PATH, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = size
+        self.block = (None, None)
+
+        if not self.scanned and size >= TRAILER.size:
+            footer, magic = TRAILER.unpack_from(self.map, size - TRAILER.size)
+            if magic == b'END1':
+                self.read_footer(footer)
+                return
+
+        offset = self.scanned
+        while offset + RECORD.size <= size:
+            magic, header_length, payload_length = RECORD.unpack_from(self.map, offset)
+            end = offset + RECORD.size + header_length + payload_length
+            if end > size:
+                # The block is still being written
+                break
+            if magic == b'IDX1':
+                self.read_footer(offset)
+                return
+            header = json.loads(self.map[offset + RECORD.size:offset + RECORD.size + header_length])
+            for timestamp, _ in header:
+                self.index[timestamp] = (offset, end - offset)
+            offset = end
+        self.scanned = offset
+
+    def read_footer(self, offset):
+        _, index_length, _ = RECORD.unpack_from(self.map, offset)
+        start = offset + RECORD.size
+        index = json.loads(gzip.decompress(self.map[start:start + index_length]))
+        self.index.update((timestamp, tuple(location)) for timestamp, location in index.items())
+        self.footer = self.scanned = offset
+
+    def locate(self, timestamp: str):
+        if timestamp not in self.index:
+            self.refresh()
+        return self.index.get(timestamp)
+
+    def read_block(self, location):
+        # {timestamp: JSON} of one block, the last block read is kept decompressed
+        # so that sequential reads decompress every block once
+        if self.block[0] == location:
+            return self.block[1]
+        offset, length = location
+        if offset + length > self.size:
+            # Written by this instance since the file was last mapped
+            self.refresh()
+        _, header_length, payload_length = RECORD.unpack_from(self.map, offset)
+        start = offset + RECORD.size
+        header = json.loads(self.map[start:start + header_length])
+        payload = gzip.decompress(self.map[start + header_length:start + header_length + payload_length])
+        documents = {}
+        position = 0
+        for timestamp, length in header:
+            documents[timestamp] = payload[position:position + length]
+            position += length
+        self.block = (location, documents)
+        return documents
 
     def get_document(self, timestamp: str):
-        with gzip.open(f'tmp/all.json.gz', 'rt') as file:
-            data = json.load(file)
-            return next((doc['data'] for doc in data if doc['timestamp'] == timestamp), None)
+        for pending_timestamp, raw in self.pending:
+            if pending_timestamp == timestamp:
+                return json.loads(raw)
+        location = self.locate(timestamp)
+        if location is None:
+            return None
+        return json.loads(self.read_block(location)[timestamp])
+
+    def get_documents(self, timestamps: list):
+        # Read in file order, so that every block is decompressed once for the batch
+        documents = {}
+        for timestamp in sorted(set(timestamps), key=lambda t: self.locate(t) or (-1, 0)):
+            documents[timestamp] = self.get_document(timestamp)
+        return [documents[timestamp] for timestamp in timestamps]
+
+    def list_timestamps(self):
+        self.refresh()
+        return list(self.index) + [timestamp for timestamp, _ in self.pending]
+
+    def finalize(self):
+        self.write_block()
+        if self.footer is not None or not self.index:
+            return
+        index = gzip.compress(json.dumps(self.index).encode())
+        with open(PATH, 'ab') as file:
+            file.seek(0, os.SEEK_END)
+            offset = file.tell()
+            file.write(RECORD.pack(b'IDX1', len(index), 0) + index + TRAILER.pack(offset, b'END1'))
+        self.footer = self.scanned = offset
 
-    def flush(self):
-        # Store all document in one file
-        with gzip.open(f'tmp/all.json.gz', 'wt') as file:
-            file.write(json.dumps(self.memory))
+    def storage_paths(self):
+        return ['tmp']
 
     def get_total_size(self):
-        self.flush()
+        return os.path.getsize(PATH) if os.path.exists(PATH) else 0
 
-        return os.path.getsize(f'tmp/all.json.gz') if os.path.exists(f'tmp/all.json.gz') else 0
+    def name(self):
+        return f'AllInOneGZipFileStore(block_snapshots={self.block_snapshots})'
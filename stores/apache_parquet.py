@@ -2,10 +2,34 @@ import os
 import shutil
 
 import pyarrow
+import pyarrow.compute
 import pyarrow.parquet
 
+from stores import columnar
 from stores.base_store import BaseStore
 
+SCHEMA = pyarrow.schema(
+    [
+        ("timestamp", pyarrow.string()),
+        ("uuid", pyarrow.string()),
+        ("id", pyarrow.int64()),
+        ("color", pyarrow.string()),
+        ("direction", pyarrow.bool_()),
+        ("distance", pyarrow.float32()),
+        ("distanceFromPoint", pyarrow.uint16()),
+        ("lineId", pyarrow.string()),
+        ("coordinates_0", pyarrow.float32()),
+        ("coordinates_1", pyarrow.float32()),
+        ("uuidx", pyarrow.string()),
+    ]
+)
+
+
+def in_progress(path: str):
+    # Name of a part file while it is written
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.inprogress")
+
 
 class ApacheParquetStore(BaseStore):
 
@@ -15,92 +39,53 @@ class ApacheParquetStore(BaseStore):
         self.last_timestamp = None
         self.compression = kwargs.get("compression", "SNAPPY")
         self.timestamp_group = kwargs.get("timestamp_group", 13)
+        # In streaming mode a ParquetWriter is kept open per partition and every
+        # batch of snapshots is appended as a new row group instead of rewriting
+        # the whole partition file.
+        self.streaming = kwargs.get("streaming", False)
+        self.row_group_snapshots = kwargs.get("row_group_snapshots", 1)
+        self.writer = None
+        self.writer_path = None
+        self.writer_group = None
+        self.writer_part = {}
+        self.pending = []
 
     def reset(self):
+        self.close_writer()
         # Rm tmp folder if exists
         shutil.rmtree("tmp", ignore_errors=True)
         os.mkdir("tmp")
         self.table = None
         self.last_timestamp = None
+        self.writer_part = {}
+
+    def to_table(self, data: dict, timestamp: str):
+        return self.columns_to_table(columnar.flatten([(data, timestamp)]))
+
+    def columns_to_table(self, columns: dict):
+        columns["uuidx"] = columns["uuid"]
+        return columnar.table_from_columns(columns, SCHEMA)
 
     def store_document(self, data: dict, timestamp: str):
+        self.store_table(self.to_table(data, timestamp), timestamp)
+
+    def store_raw(self, raw: bytes, timestamp: str):
+        try:
+            columns = columnar.decode_raw(raw, timestamp)
+        except pyarrow.ArrowInvalid:
+            super().store_raw(raw, timestamp)
+            return
+        self.store_table(self.columns_to_table(columns), timestamp)
+
+    def store_table(self, table, timestamp: str):
+        if self.streaming:
+            self.append_table(table, timestamp)
+            return
+
         if not self.table or self.last_timestamp[:self.timestamp_group] != timestamp[:self.timestamp_group]:
-            self.table = pyarrow.Table.from_pylist(
-                [
-                    {
-                        "timestamp": timestamp,
-                        "uuid": feature["properties"]["uuid"],
-                        "id": feature["properties"]["id"],
-                        "color": feature["properties"]["color"],
-                        "direction": bool(feature["properties"]["direction"] - 1),
-                        "distance": feature["properties"]["distance"],
-                        "distanceFromPoint": feature["properties"]["distanceFromPoint"],
-                        "lineId": feature["properties"]["lineId"],
-                        "coordinates_0": feature["geometry"]["coordinates"][0],
-                        "coordinates_1": feature["geometry"]["coordinates"][1],
-                        "uuidx": feature["properties"]["uuid"],
-                    }
-                    for feature in data["features"]
-                ],
-                schema=pyarrow.schema(
-                    [
-                        ("timestamp", pyarrow.string()),
-                        ("uuid", pyarrow.string()),
-                        ("id", pyarrow.int64()),
-                        ("color", pyarrow.string()),
-                        ("direction", pyarrow.bool_()),
-                        ("distance", pyarrow.float32()),
-                        ("distanceFromPoint", pyarrow.uint16()),
-                        ("lineId", pyarrow.string()),
-                        ("coordinates_0", pyarrow.float32()),
-                        ("coordinates_1", pyarrow.float32()),
-                        ("uuidx", pyarrow.string()),
-                    ]
-                ),
-            )
+            self.table = table
         else:
-            self.table = pyarrow.concat_tables(
-                [
-                    self.table,
-                    pyarrow.Table.from_pylist(
-                        [
-                            {
-                                "timestamp": timestamp,
-                                "uuid": feature["properties"]["uuid"],
-                                "id": feature["properties"]["id"],
-                                "color": feature["properties"]["color"],
-                                "direction": bool(
-                                    feature["properties"]["direction"] - 1
-                                ),
-                                "distance": feature["properties"]["distance"],
-                                "distanceFromPoint": feature["properties"][
-                                    "distanceFromPoint"
-                                ],
-                                "lineId": feature["properties"]["lineId"],
-                                "coordinates_0": feature["geometry"]["coordinates"][0],
-                                "coordinates_1": feature["geometry"]["coordinates"][1],
-                                "uuidx": feature["properties"]["uuid"],
-                            }
-                            for feature in data["features"]
-                        ],
-                        schema=pyarrow.schema(
-                            [
-                                ("timestamp", pyarrow.string()),
-                                ("uuid", pyarrow.string()),
-                                ("id", pyarrow.int64()),
-                                ("color", pyarrow.string()),
-                                ("direction", pyarrow.bool_()),
-                                ("distance", pyarrow.float32()),
-                                ("distanceFromPoint", pyarrow.uint16()),
-                                ("lineId", pyarrow.string()),
-                                ("coordinates_0", pyarrow.float32()),
-                                ("coordinates_1", pyarrow.float32()),
-                                ("uuidx", pyarrow.string()),
-                            ]
-                        ),
-                    ),
-                ]
-            )
+            self.table = pyarrow.concat_tables([self.table, table])
 
         pyarrow.parquet.write_table(
             self.table,
@@ -110,37 +95,258 @@ class ApacheParquetStore(BaseStore):
 
         self.last_timestamp = timestamp
 
-    def get_document(self, timestamp: str):
-        table = pyarrow.parquet.read_table(
-            f"tmp/table_{timestamp[:self.timestamp_group]}.parquet",
-            filters=[("timestamp", "==", timestamp)],
+    def store_documents(self, documents):
+        if self.streaming:
+            super().store_documents(documents)
+            return
+
+        # Concatenate consecutive documents of the same partition and write it once
+        batch = []
+        for data, timestamp in documents:
+            group = timestamp[:self.timestamp_group]
+            if self.last_timestamp is None or self.last_timestamp[:self.timestamp_group] != group:
+                self.write_batch(batch)
+                batch = []
+                self.table = None
+            batch.append(self.to_table(data, timestamp))
+            self.last_timestamp = timestamp
+        self.write_batch(batch)
+
+    def write_batch(self, batch):
+        if not batch:
+            return
+        self.table = pyarrow.concat_tables(([self.table] if self.table else []) + batch)
+        pyarrow.parquet.write_table(
+            self.table,
+            f"tmp/table_{self.last_timestamp[:self.timestamp_group]}.parquet",
+            compression=self.compression,
+        )
+
+    def append_table(self, table, timestamp: str):
+        group = timestamp[:self.timestamp_group]
+        if self.writer_group is not None and self.writer_group != group:
+            self.close_writer()
+
+        if self.writer is None:
+            # A partition is a directory of part files: a partition that was
+            # closed early (e.g. to serve a read) is continued in a new part.
+            # The open part has no footer yet, it is written under a name that
+            # readers skip (leading dot) and renamed when closed.
+            os.makedirs(f"tmp/table_{group}", exist_ok=True)
+            part = self.writer_part.get(group, 0)
+            self.writer_part[group] = part + 1
+            self.writer_path = f"tmp/table_{group}/part_{part}.parquet"
+            self.writer = pyarrow.parquet.ParquetWriter(
+                in_progress(self.writer_path),
+                SCHEMA,
+                compression=self.compression,
+            )
+            self.writer_group = group
+
+        self.pending.append(table)
+        if len(self.pending) >= self.row_group_snapshots:
+            self.write_pending()
+
+        self.last_timestamp = timestamp
+
+    def write_pending(self):
+        if not self.pending:
+            return
+        table = pyarrow.concat_tables(self.pending)
+        self.writer.write_table(table, row_group_size=table.num_rows)
+        self.pending = []
+
+    def close_writer(self):
+        if self.writer is None:
+            return
+        self.write_pending()
+        self.writer.close()
+        os.replace(in_progress(self.writer_path), self.writer_path)
+        self.writer = None
+        self.writer_group = None
+
+    def flush(self):
+        self.close_writer()
+
+    def partition_source(self, group: str):
+        if self.streaming:
+            # The footer of the open part is only written on close
+            if self.writer_group == group:
+                self.close_writer()
+            return f"tmp/table_{group}"
+        return f"tmp/table_{group}.parquet"
+
+    def partition_files(self, group: str):
+        source = self.partition_source(group)
+        if not self.streaming:
+            return [source]
+        # Parts are named part_<n>.parquet and must be read in write order,
+        # the part still being written is skipped
+        return [
+            f"{source}/{part}"
+            for part in sorted(
+                (part for part in os.listdir(source) if part.startswith("part_") and part.endswith(".parquet")),
+                key=lambda part: int(part[5:-8]),
+            )
+        ]
+
+    def groups(self):
+        return sorted(
+            name[6:].removesuffix(".parquet")
+            for name in os.listdir("tmp")
+            if name.startswith("table_")
         )
 
+    def to_document(self, table):
         return {
             "type": "FeatureCollection",
             "features": [
                 {
                     "type": "Feature",
                     "properties": {
-                        "uuid": row[1],
-                        "id": row[2],
-                        "color": row[3],
-                        "direction": row[4],
-                        "distance": row[5],
-                        "distanceFromPoint": row[6],
-                        "lineId": row[7],
+                        "uuid": row["uuid"],
+                        "id": row["id"],
+                        "color": row["color"],
+                        "direction": int(row["direction"]) + 1,
+                        "distance": row["distance"],
+                        "distanceFromPoint": row["distanceFromPoint"],
+                        "lineId": row["lineId"],
                     },
-                    "geometry": {"type": "Point", "coordinates": [row[8], row[9]]},
+                    "geometry": {"type": "Point", "coordinates": [row["coordinates_0"], row["coordinates_1"]]},
                 }
-                for row in table.to_pydict().values()
+                for row in table.to_pylist()
             ],
         }
 
+    def get_document(self, timestamp: str):
+        table = pyarrow.parquet.read_table(
+            self.partition_source(timestamp[:self.timestamp_group]),
+            schema=SCHEMA,
+            filters=[("timestamp", "==", timestamp)],
+        )
+
+        return self.to_document(table)
+
+    def get_documents(self, timestamps: list):
+        groups = {}
+        for timestamp in timestamps:
+            groups.setdefault(timestamp[:self.timestamp_group], set()).add(timestamp)
+
+        # One scan per partition for all the requested timestamps
+        documents = {}
+        for group, group_timestamps in groups.items():
+            table = pyarrow.parquet.read_table(
+                self.partition_source(group),
+                schema=SCHEMA,
+                filters=[("timestamp", "in", group_timestamps)],
+            )
+            column = table.column("timestamp")
+            for timestamp in group_timestamps:
+                documents[timestamp] = self.to_document(
+                    table.filter(pyarrow.compute.equal(column, timestamp))
+                )
+
+        return [documents[timestamp] for timestamp in timestamps]
+
+    def to_canonical(self, table):
+        # Only the schema changes, the column buffers are shared with the read table
+        return columnar.table_from_columns(
+            {name: table.column(name) for name in table.column_names if name in columnar.SCHEMA.names}
+        )
+
+    def get_document_arrow(self, timestamp: str):
+        return self.to_canonical(
+            pyarrow.parquet.read_table(
+                self.partition_source(timestamp[:self.timestamp_group]),
+                schema=SCHEMA,
+                filters=[("timestamp", "==", timestamp)],
+            )
+        )
+
+    def get_documents_arrow(self, timestamps: list):
+        groups = {}
+        for timestamp in timestamps:
+            groups.setdefault(timestamp[:self.timestamp_group], set()).add(timestamp)
+
+        tables = [
+            pyarrow.parquet.read_table(
+                self.partition_source(group),
+                schema=SCHEMA,
+                filters=[("timestamp", "in", group_timestamps)],
+            )
+            for group, group_timestamps in groups.items()
+        ]
+        if not tables:
+            return columnar.table_from_columns({})
+        return pyarrow.concat_tables([self.to_canonical(table) for table in tables])
+
+    def list_timestamps(self):
+        timestamps = set()
+        for group in self.groups():
+            for path in self.partition_files(group):
+                table = pyarrow.parquet.read_table(path, columns=["timestamp"])
+                timestamps.update(pyarrow.compute.unique(table.column("timestamp")).to_pylist())
+        return sorted(timestamps)
+
+    def iter_runs(self, path: str, start: str, end: str):
+        # Yields (timestamp, table) for each run of rows sharing a timestamp, one
+        # row group at a time so that memory stays bounded by the row group size
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        index = parquet_file.schema_arrow.get_field_index("timestamp")
+        for i in range(parquet_file.num_row_groups):
+            statistics = parquet_file.metadata.row_group(i).column(index).statistics
+            if statistics is not None and statistics.has_min_max:
+                if statistics.max < start or statistics.min >= end:
+                    continue
+
+            table = parquet_file.read_row_group(i)
+            column = table.column("timestamp")
+            table = table.filter(
+                pyarrow.compute.and_(
+                    pyarrow.compute.greater_equal(column, start),
+                    pyarrow.compute.less(column, end),
+                )
+            )
+            runs = pyarrow.compute.run_end_encode(table.column("timestamp").combine_chunks())
+            offset = 0
+            for timestamp, run_end in zip(runs.values.to_pylist(), runs.run_ends.to_pylist()):
+                yield timestamp, table.slice(offset, run_end - offset)
+                offset = run_end
+
+    def iter_documents(self, start: str, end: str):
+        pending = None
+        for group in self.groups():
+            if group < start[:self.timestamp_group] or group > end[:self.timestamp_group]:
+                continue
+            for path in self.partition_files(group):
+                for timestamp, table in self.iter_runs(path, start, end):
+                    # A snapshot can be split across two row groups
+                    if pending is not None and pending[0] == timestamp:
+                        pending = (timestamp, pyarrow.concat_tables([pending[1], table]))
+                        continue
+                    if pending is not None:
+                        yield self.to_document(pending[1]), pending[0]
+                    pending = (timestamp, table)
+
+        if pending is not None:
+            yield self.to_document(pending[1]), pending[0]
+
+    def storage_paths(self):
+        return ["tmp"]
+
+    def finalize(self):
+        self.flush()
+
     def get_total_size(self):
-        return sum(os.path.getsize(f"tmp/{f}") for f in os.listdir("tmp"))
+        return sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk("tmp")
+            for f in files
+        )
 
     def name(self):
-        return f"ApacheParquetStore(compression={self.compression}, timestamp_group={self.timestamp_group})"
+        streaming = f", streaming=True, row_group_snapshots={self.row_group_snapshots}" if self.streaming else ""
+        return f"ApacheParquetStore(compression={self.compression}, timestamp_group={self.timestamp_group}{streaming})"
 
     def __str__(self):
-        return f"ApacheParquetStore(compression={self.compression}, timestamp_group={self.timestamp_group})"
+        return self.name()
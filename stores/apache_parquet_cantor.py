@@ -6,6 +6,7 @@ import shutil
 import pyarrow
 import pyarrow.parquet
 
+from stores import columnar
 from stores.base_store import BaseStore
 
 MIN_X = 0
@@ -14,6 +15,21 @@ PRECISION = 16
 BYTES_FOR_COORDINATES = 15
 ORDER = 10**PRECISION
 
+SCHEMA = pyarrow.schema(
+    [
+        ("timestamp", pyarrow.string()),
+        ("uuid", pyarrow.string()),
+        ("id", pyarrow.int64()),
+        ("color", pyarrow.string()),
+        ("direction", pyarrow.bool_()),
+        ("distance", pyarrow.float32()),
+        ("distanceFromPoint", pyarrow.uint16()),
+        ("lineId", pyarrow.string()),
+        ("coordinates", pyarrow.binary(BYTES_FOR_COORDINATES)),
+        ("uuidx", pyarrow.string()),
+    ]
+)
+
 
 def cantor(x, y):
     x = round((x - MIN_X) * ORDER)
@@ -70,86 +86,20 @@ class ApacheParquetCantorStore(BaseStore):
         self.table = None
         self.last_timestamp = None
 
+    def to_table(self, data: dict, timestamp: str):
+        columns = columnar.flatten([(data, timestamp)])
+        columns["coordinates"] = [
+            elegant_pair(x, y).to_bytes(BYTES_FOR_COORDINATES, "little")
+            for x, y in zip(columns["coordinates_0"].tolist(), columns["coordinates_1"].tolist())
+        ]
+        columns["uuidx"] = columns["uuid"]
+        return columnar.table_from_columns(columns, SCHEMA)
+
     def store_document(self, data: dict, timestamp: str):
         if not self.table or self.last_timestamp[:13] != timestamp[:13]:
-            self.table = pyarrow.Table.from_pylist(
-                [
-                    {
-                        "timestamp": timestamp,
-                        "uuid": feature["properties"]["uuid"],
-                        "id": feature["properties"]["id"],
-                        "color": feature["properties"]["color"],
-                        "direction": bool(feature["properties"]["direction"] - 1),
-                        "distance": feature["properties"]["distance"],
-                        "distanceFromPoint": feature["properties"]["distanceFromPoint"],
-                        "lineId": feature["properties"]["lineId"],
-                        "coordinates": elegant_pair(
-                            feature["geometry"]["coordinates"][0],
-                            feature["geometry"]["coordinates"][1],
-                        ).to_bytes(BYTES_FOR_COORDINATES, "little"),
-                        "uuidx": feature["properties"]["uuid"],
-                    }
-                    for feature in data["features"]
-                ],
-                schema=pyarrow.schema(
-                    [
-                        ("timestamp", pyarrow.string()),
-                        ("uuid", pyarrow.string()),
-                        ("id", pyarrow.int64()),
-                        ("color", pyarrow.string()),
-                        ("direction", pyarrow.bool_()),
-                        ("distance", pyarrow.float32()),
-                        ("distanceFromPoint", pyarrow.uint16()),
-                        ("lineId", pyarrow.string()),
-                        ("coordinates", pyarrow.binary(BYTES_FOR_COORDINATES)),
-                        ("uuidx", pyarrow.string()),
-                    ]
-                ),
-            )
+            self.table = self.to_table(data, timestamp)
         else:
-            self.table = pyarrow.concat_tables(
-                [
-                    self.table,
-                    pyarrow.Table.from_pylist(
-                        [
-                            {
-                                "timestamp": timestamp,
-                                "uuid": feature["properties"]["uuid"],
-                                "id": feature["properties"]["id"],
-                                "color": feature["properties"]["color"],
-                                "direction": bool(
-                                    feature["properties"]["direction"] - 1
-                                ),
-                                "distance": feature["properties"]["distance"],
-                                "distanceFromPoint": feature["properties"][
-                                    "distanceFromPoint"
-                                ],
-                                "lineId": feature["properties"]["lineId"],
-                                "coordinates": elegant_pair(
-                                    feature["geometry"]["coordinates"][0],
-                                    feature["geometry"]["coordinates"][1],
-                                ).to_bytes(BYTES_FOR_COORDINATES, "little"),
-                                "uuidx": feature["properties"]["uuid"],
-                            }
-                            for feature in data["features"]
-                        ],
-                        schema=pyarrow.schema(
-                            [
-                                ("timestamp", pyarrow.string()),
-                                ("uuid", pyarrow.string()),
-                                ("id", pyarrow.int64()),
-                                ("color", pyarrow.string()),
-                                ("direction", pyarrow.bool_()),
-                                ("distance", pyarrow.float32()),
-                                ("distanceFromPoint", pyarrow.uint16()),
-                                ("lineId", pyarrow.string()),
-                                ("coordinates", pyarrow.binary(BYTES_FOR_COORDINATES)),
-                                ("uuidx", pyarrow.string()),
-                            ]
-                        ),
-                    ),
-                ]
-            )
+            self.table = pyarrow.concat_tables([self.table, self.to_table(data, timestamp)])
 
         pyarrow.parquet.write_table(
             self.table,
@@ -195,6 +145,9 @@ class ApacheParquetCantorStore(BaseStore):
 
         return data
 
+    def storage_paths(self):
+        return ["tmp"]
+
     def get_total_size(self):
         return sum(os.path.getsize(f"tmp/{f}") for f in os.listdir("tmp"))
 
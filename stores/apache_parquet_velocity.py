@@ -4,6 +4,7 @@ import shutil
 import pyarrow
 import pyarrow.parquet
 
+from stores import columnar
 from stores.base_store import BaseStore
 
 
@@ -248,6 +249,45 @@ class ApacheParquetVelocityStore(BaseStore):
 
         return {"type": "FeatureCollection", "features": features}
 
+    def get_document_arrow(self, timestamp: str):
+        main_table = pyarrow.parquet.read_table(
+            f"tmp/main_{timestamp[:13]}.parquet", filters=[("timestamp", "==", timestamp)]
+        )
+        doc_id = main_table.column("doc_id")[0].as_py()
+        l2_table = pyarrow.parquet.read_table(
+            f"tmp/l2_{timestamp[:13]}.parquet", filters=[("id", "==", doc_id)]
+        ).drop_columns(["id"])
+        l1_table = pyarrow.parquet.read_table(f"tmp/l1_{timestamp[:13]}.parquet")
+        l1_table = l1_table.rename_columns(
+            ["l1_id" if name == "id" else name for name in l1_table.column_names]
+        )
+
+        # Vectorized join of the per-document values with the per-vehicle values
+        table = l2_table.join(l1_table, "l1_id")
+        return columnar.table_from_columns(
+            {
+                "timestamp": pyarrow.repeat(timestamp, table.num_rows),
+                "uuid": table.column("properties.uuid"),
+                "id": table.column("properties.id"),
+                "color": table.column("properties.color"),
+                "direction": table.column("properties.direction"),
+                "distance": table.column("properties.distance"),
+                "distanceFromPoint": table.column("properties.distanceFromPoint"),
+                "lineId": table.column("properties.lineId"),
+                "pointId": table.column("properties.pointId"),
+                "coordinates_0": table.column("geometry.coordinates_0"),
+                "coordinates_1": table.column("geometry.coordinates_1"),
+            }
+        )
+
+    def get_documents_arrow(self, timestamps: list):
+        return pyarrow.concat_tables(
+            [self.get_document_arrow(timestamp) for timestamp in dict.fromkeys(timestamps)]
+        )
+
+    def storage_paths(self):
+        return ["tmp"]
+
     def get_total_size(self):
         return sum(os.path.getsize(f"tmp/{f}") for f in os.listdir("tmp"))
 
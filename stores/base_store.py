@@ -1,9 +1,16 @@
 import abc
+import json
 
 
 class BaseStore(abc.ABC):
     def __init__(self, *args, **kwargs):
-        pass
+        # Kept so that the benchmark can open independent instances of a store
+        # (e.g. one per concurrent client, possibly in another process)
+        self.init_args = args
+        self.init_kwargs = kwargs
+
+    def spec(self):
+        return self.__class__, self.init_args, self.init_kwargs
 
     @abc.abstractmethod
     def reset(self):
@@ -19,4 +26,54 @@ class BaseStore(abc.ABC):
 
     @abc.abstractmethod
     def get_total_size(self):
+        # Size of the stored data; must not change the store, see finalize
+        pass
+
+    def finalize(self):
+        # Ends the ingest: writes what the store still buffers and runs its
+        # compression or compaction. Timed by the benchmark as its own phase.
         pass
+
+    def store_raw(self, raw: bytes, timestamp: str):
+        # Ingests the undecoded JSON of a snapshot. Stores that only need columns
+        # override this to skip building the dict tree.
+        self.store_document(json.loads(raw), timestamp)
+
+    def store_documents(self, documents):
+        # Stores that can write several documents in one round trip override this
+        for data, timestamp in documents:
+            self.store_document(data, timestamp)
+
+    def get_documents(self, timestamps: list):
+        # Returns the documents in the order of the given timestamps
+        return [self.get_document(timestamp) for timestamp in timestamps]
+
+    def get_document_arrow(self, timestamp: str):
+        # Returns the document as a pyarrow.Table following stores.columnar.SCHEMA.
+        # Stores holding columnar data override this to skip the dict round trip.
+        from stores.columnar import documents_to_table
+
+        return documents_to_table([(self.get_document(timestamp), timestamp)])
+
+    def get_documents_arrow(self, timestamps: list):
+        # Returns the rows of every distinct requested timestamp in one table
+        from stores.columnar import documents_to_table
+
+        timestamps = list(dict.fromkeys(timestamps))
+        return documents_to_table(zip(self.get_documents(timestamps), timestamps))
+
+    def storage_paths(self):
+        # Local files or directories holding the data of the store, evicted from
+        # the page cache before cold reads. Server-backed stores have none.
+        return []
+
+    def list_timestamps(self):
+        # Stores that can enumerate the documents they hold override this
+        raise NotImplementedError
+
+    def iter_documents(self, start: str, end: str):
+        # Lazily yields (data, timestamp) for every document in [start, end), in
+        # timestamp order. Stores that can stream a time range natively override this.
+        for timestamp in sorted(self.list_timestamps()):
+            if start <= timestamp < end:
+                yield self.get_document(timestamp), timestamp
@@ -49,22 +49,22 @@ class CitusStore(BaseStore):
             )
 
     def store_document(self, data: Dict, timestamp: str):
-        documents = []
-        for feature in data["features"]:
-            documents.append(
-                {
-                    "timestamp": datetime.fromisoformat(timestamp),
-                    "uuid": feature["properties"]["uuid"],
-                    "id": feature["properties"]["id"],
-                    "color": feature["properties"]["color"],
-                    "direction": bool(feature["properties"]["direction"] - 1),
-                    "distance": feature["properties"]["distance"],
-                    "distance_from_point": feature["properties"]["distanceFromPoint"],
-                    "line_id": feature["properties"]["lineId"],
-                    "coordinates_0": feature["geometry"]["coordinates"][0],
-                    "coordinates_1": feature["geometry"]["coordinates"][1],
-                }
-            )
+        moment = datetime.fromisoformat(timestamp)
+        documents = [
+            {
+                "timestamp": moment,
+                "uuid": feature["properties"]["uuid"],
+                "id": feature["properties"]["id"],
+                "color": feature["properties"]["color"],
+                "direction": bool(feature["properties"]["direction"] - 1),
+                "distance": feature["properties"]["distance"],
+                "distance_from_point": feature["properties"]["distanceFromPoint"],
+                "line_id": feature["properties"]["lineId"],
+                "coordinates_0": feature["geometry"]["coordinates"][0],
+                "coordinates_1": feature["geometry"]["coordinates"][1],
+            }
+            for feature in data["features"]
+        ]
         with self.engine.connect() as connection:
             connection.execute(
                 text(
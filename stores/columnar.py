@@ -0,0 +1,204 @@
+import numpy
+import pyarrow
+import pyarrow.compute
+import pyarrow.json
+
+# Canonical columnar layout of snapshots, one row per feature. It follows the
+# layout of ApacheParquetStore so that Parquet-backed stores can return it as is.
+SCHEMA = pyarrow.schema(
+    [
+        ("timestamp", pyarrow.string()),
+        ("uuid", pyarrow.string()),
+        ("id", pyarrow.int64()),
+        ("color", pyarrow.string()),
+        ("direction", pyarrow.bool_()),
+        ("distance", pyarrow.float32()),
+        ("distanceFromPoint", pyarrow.uint16()),
+        ("lineId", pyarrow.string()),
+        ("pointId", pyarrow.string()),
+        ("coordinates_0", pyarrow.float32()),
+        ("coordinates_1", pyarrow.float32()),
+    ]
+)
+
+
+def flatten(documents):
+    """Flattens (data, timestamp) FeatureCollections into one column per attribute.
+
+    All the features of the batch are visited once and written into pre-sized
+    buffers. Numeric columns are then converted in one call each to NumPy arrays
+    (direction as a bool, True for direction 2), text columns stay Python lists.
+    """
+    documents = list(documents)
+    count = sum(len(data["features"]) for data, _ in documents)
+
+    timestamps = [None] * count
+    uuids = [None] * count
+    ids = [None] * count
+    colors = [None] * count
+    directions = [None] * count
+    distances = [None] * count
+    distances_from_point = [None] * count
+    line_ids = [None] * count
+    point_ids = [None] * count
+    coordinates_0 = [None] * count
+    coordinates_1 = [None] * count
+
+    i = 0
+    for data, timestamp in documents:
+        for feature in data["features"]:
+            properties = feature["properties"]
+            coordinates = feature["geometry"]["coordinates"]
+            timestamps[i] = timestamp
+            uuids[i] = properties["uuid"]
+            ids[i] = properties["id"]
+            colors[i] = properties["color"]
+            directions[i] = properties["direction"]
+            distances[i] = properties["distance"]
+            distances_from_point[i] = properties["distanceFromPoint"]
+            line_ids[i] = properties["lineId"]
+            point_ids[i] = properties.get("pointId")
+            coordinates_0[i] = coordinates[0]
+            coordinates_1[i] = coordinates[1]
+            i += 1
+
+    return {
+        "timestamp": timestamps,
+        "uuid": uuids,
+        "id": numpy.array(ids, dtype=numpy.int64),
+        "color": colors,
+        "direction": numpy.array(directions, dtype=numpy.int8) == 2,
+        "distance": numpy.array(distances, dtype=numpy.float64),
+        "distanceFromPoint": numpy.array(distances_from_point, dtype=numpy.int64),
+        "lineId": line_ids,
+        "pointId": point_ids,
+        "coordinates_0": numpy.array(coordinates_0, dtype=numpy.float64),
+        "coordinates_1": numpy.array(coordinates_1, dtype=numpy.float64),
+    }
+
+
+def raw_schema(point_id_type):
+    # Only the attributes the stores keep are parsed, other fields are skipped
+    properties = pyarrow.struct(
+        [
+            ("uuid", pyarrow.string()),
+            ("id", pyarrow.int64()),
+            ("color", pyarrow.string()),
+            ("direction", pyarrow.int64()),
+            ("distance", pyarrow.float64()),
+            ("distanceFromPoint", pyarrow.int64()),
+            ("lineId", pyarrow.string()),
+            ("pointId", point_id_type),
+        ]
+    )
+    geometry = pyarrow.struct([("coordinates", pyarrow.list_(pyarrow.float64()))])
+    feature = pyarrow.struct([("geometry", geometry), ("properties", properties)])
+    return pyarrow.schema([("features", pyarrow.list_(feature))])
+
+
+# pointId is a string in some feeds and a number in others, the schema that
+# parsed last is tried first
+RAW_SCHEMAS = [raw_schema(pyarrow.string()), raw_schema(pyarrow.int64())]
+last_raw_schema = RAW_SCHEMAS[0]
+
+
+def decode_raw(raw: bytes, timestamp: str):
+    """Decodes a raw GeoJSON FeatureCollection into the columns of flatten.
+
+    The document is parsed by the pyarrow JSON reader straight into nested
+    Arrow arrays, no Python object is created per feature. Columns are
+    pyarrow arrays. Raises pyarrow.ArrowInvalid if the document does not
+    follow the expected layout, callers then fall back to the dict path.
+
+    The reader expects one JSON value per line: line breaks of pretty-printed
+    documents are removed first. They can only be whitespace between tokens,
+    line breaks in strings are escaped.
+    """
+    global last_raw_schema
+    if b"\n" in raw.rstrip():
+        raw = raw.translate(None, b"\r\n")
+    read_options = pyarrow.json.ReadOptions(block_size=len(raw) + 1, use_threads=False)
+    schemas = [last_raw_schema] + [schema for schema in RAW_SCHEMAS if schema is not last_raw_schema]
+    for schema in schemas:
+        try:
+            table = pyarrow.json.read_json(
+                pyarrow.py_buffer(raw),
+                read_options=read_options,
+                parse_options=pyarrow.json.ParseOptions(
+                    explicit_schema=schema, unexpected_field_behavior="ignore"
+                ),
+            )
+        except pyarrow.ArrowInvalid:
+            if schema is schemas[-1]:
+                raise
+            continue
+        last_raw_schema = schema
+        break
+
+    features = table.column("features").combine_chunks().flatten()
+    properties = features.field("properties")
+    coordinates = features.field("geometry").field("coordinates")
+    return {
+        "timestamp": pyarrow.repeat(timestamp, len(features)),
+        "uuid": properties.field("uuid"),
+        "id": properties.field("id"),
+        "color": properties.field("color"),
+        "direction": pyarrow.compute.equal(properties.field("direction"), 2),
+        "distance": properties.field("distance"),
+        "distanceFromPoint": properties.field("distanceFromPoint"),
+        "lineId": properties.field("lineId"),
+        "pointId": properties.field("pointId").cast(pyarrow.string()),
+        "coordinates_0": pyarrow.compute.list_element(coordinates, 0),
+        "coordinates_1": pyarrow.compute.list_element(coordinates, 1),
+    }
+
+
+def to_python(columns: dict, names=None, rows=None):
+    # Plain Python lists per column (database drivers do not accept NumPy
+    # scalars), optionally restricted to the given row indices
+    result = {}
+    for name in names or columns:
+        column = columns[name]
+        if isinstance(column, numpy.ndarray):
+            column = (column if rows is None else column[rows]).tolist()
+        elif isinstance(column, pyarrow.Array):
+            column = (column if rows is None else column.take(rows)).to_pylist()
+        elif rows is not None:
+            column = [column[i] for i in rows]
+        result[name] = column
+    return result
+
+
+def records(columns: dict, names):
+    # One tuple of plain Python values per row
+    values = to_python(columns, names)
+    return zip(*(values[name] for name in names))
+
+
+def group_by(columns: dict, key: str = "uuid"):
+    # Returns {key value: row indices}, in the order rows were flattened
+    groups = {}
+    for i, value in enumerate(columns[key]):
+        groups.setdefault(value, []).append(i)
+    return groups
+
+
+def table_from_columns(columns: dict, schema=SCHEMA):
+    # Columns missing from the store (e.g. pointId in ApacheParquetStore) are
+    # filled with nulls, the others are cast to the schema type when needed
+    length = len(next(iter(columns.values()))) if columns else 0
+    arrays = []
+    for field in schema:
+        column = columns.get(field.name)
+        if column is None:
+            arrays.append(pyarrow.nulls(length, field.type))
+            continue
+        if not isinstance(column, (pyarrow.Array, pyarrow.ChunkedArray)):
+            column = pyarrow.array(column)
+        arrays.append(column if column.type == field.type else column.cast(field.type))
+    return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+
+def documents_to_table(documents, schema=SCHEMA):
+    # documents is an iterable of (data, timestamp) GeoJSON FeatureCollections
+    return table_from_columns(flatten(documents), schema)
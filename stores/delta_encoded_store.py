@@ -0,0 +1,305 @@
+import json
+import os
+import shutil
+import struct
+
+import numpy
+import pyarrow
+import zstandard
+
+from stores import columnar
+from stores.base_store import BaseStore
+
+# Attributes kept per vehicle; coordinates are kept apart, quantized
+COLUMNS = ['uuid', 'id', 'color', 'direction', 'distance', 'distanceFromPoint', 'lineId', 'pointId']
+# Kept as UTF-8 bytes, 4 times smaller than NumPy unicode arrays
+TEXT_COLUMNS = ['uuid', 'color', 'lineId', 'pointId']
+# Whether the value of a text attribute is missing (e.g. pointId)
+NULLS = [f'{name}_null' for name in TEXT_COLUMNS]
+HEADER = struct.Struct('<I')
+COORDINATES = ['coordinates_0', 'coordinates_1']
+
+
+def narrow(values):
+    # Smallest integer type holding the values, zstd then sees fewer bytes
+    low, high = (values.min(), values.max()) if len(values) else (0, 0)
+    for dtype in (numpy.int8, numpy.int16, numpy.int32):
+        if numpy.iinfo(dtype).min <= low and high <= numpy.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(numpy.int64)
+
+
+def shuffled(dtype: numpy.dtype):
+    # Numbers are stored byte plane after byte plane: the high bytes of small
+    # deltas and of nearby floats repeat, and zstd then finds them (-15% size)
+    return dtype.kind in 'iuf' and dtype.itemsize > 1
+
+
+def pack(frame: dict):
+    # JSON header [[name, dtype, shape], ...] then the buffers of the arrays,
+    # leaner than npz for the few hundred rows of a snapshot
+    header = json.dumps([[name, array.dtype.str, array.shape] for name, array in frame.items()]).encode()
+    buffers = [
+        array.reshape(-1).view(numpy.uint8).reshape(-1, array.dtype.itemsize).T.tobytes()
+        if shuffled(array.dtype) else array.tobytes()
+        for array in frame.values()
+    ]
+    return b''.join([HEADER.pack(len(header)), header] + buffers)
+
+
+def unpack(data: bytes):
+    (length,) = HEADER.unpack_from(data)
+    offset = HEADER.size + length
+    frame = {}
+    for name, dtype, shape in json.loads(data[HEADER.size:offset]):
+        dtype = numpy.dtype(dtype)
+        count = int(numpy.prod(shape))
+        if shuffled(dtype):
+            planes = numpy.frombuffer(data, numpy.uint8, count * dtype.itemsize, offset)
+            frame[name] = planes.reshape(dtype.itemsize, count).T.copy().view(dtype).reshape(shape)
+        else:
+            frame[name] = numpy.frombuffer(data, dtype, count, offset).reshape(shape)
+        offset += count * dtype.itemsize
+    return frame
+
+
+def column(state: dict, name: str):
+    if name not in TEXT_COLUMNS:
+        return state[name]
+    values = numpy.char.decode(state[name], 'utf-8')
+    missing = state[f'{name}_null']
+    if missing.any():
+        values = values.astype(object)
+        values[missing] = None
+    return values
+
+
+class DeltaEncodedStore(BaseStore):
+    # One zstd compressed frame of NumPy arrays per snapshot (see pack). Every
+    # keyframe_interval snapshots the frame is a keyframe holding every column,
+    # the frames in between hold the delta to the previous snapshot:
+    #
+    #   removed:   rows of the previous snapshot whose uuid is gone
+    #   added_*:   columns of the vehicles that appeared
+    #   *_changed: bitmap of the rows whose attribute changed, and
+    #   *_values:  their new value
+    #   *_delta:   quantized coordinate deltas of every kept row
+    #   order:     feature order of the snapshot, when not the row order
+    #
+    # Rows are matched on uuid. A snapshot whose uuids are not unique, or whose
+    # delta does not rebuild it exactly, is written as a keyframe.
+    #
+    # Coordinates are stored as integer multiples of `quantum` degrees (1e-6,
+    # about 10 cm, finer than the float32 coordinates of ApacheParquetStore),
+    # and distance as float32 as there. A read loads the frames back to the
+    # keyframe, at most keyframe_interval, and applies the deltas with NumPy.
+    # The last reconstructed snapshot is kept, so that reads in timestamp order
+    # apply one delta each.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Create tmp directory if it doesn't exist
+        os.makedirs('tmp', exist_ok=True)
+        self.keyframe_interval = kwargs.get('keyframe_interval', 10)
+        self.quantum = kwargs.get('quantum', 1e-6)
+        self.level = kwargs.get('level', 3)
+        self.compressor = zstandard.ZstdCompressor(level=self.level)
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.clear()
+
+    def clear(self):
+        # Writer state: last snapshot written and frames since its keyframe
+        self.previous = None
+        self.since_keyframe = 0
+        # Last snapshot reconstructed by a read
+        self.cached = (None, None)
+
+    def reset(self):
+        shutil.rmtree('tmp')
+        os.makedirs('tmp', exist_ok=False)
+        self.clear()
+
+    def to_state(self, columns: dict):
+        # {attribute: NumPy array} in feature order, coordinates quantized
+        state = {}
+        for name in COLUMNS:
+            column = columns[name]
+            if isinstance(column, pyarrow.Array):
+                column = column.to_numpy(zero_copy_only=False)
+            if name in TEXT_COLUMNS:
+                column = numpy.asarray(column, dtype=object)
+                missing = numpy.equal(column, None)
+                state[f'{name}_null'] = missing
+                column = numpy.char.encode(numpy.where(missing, '', column).astype(str), 'utf-8')
+            state[name] = numpy.asarray(column, dtype=numpy.float32 if name == 'distance' else None)
+        for name in COORDINATES:
+            column = numpy.asarray(columns[name], dtype=numpy.float64)
+            state[name] = numpy.round(column / self.quantum).astype(numpy.int64)
+        return state
+
+    def store_document(self, data: dict, timestamp: str):
+        self.store_state(self.to_state(columnar.flatten([(data, timestamp)])), timestamp)
+
+    def store_raw(self, raw: bytes, timestamp: str):
+        try:
+            columns = columnar.decode_raw(raw, timestamp)
+        except pyarrow.ArrowInvalid:
+            super().store_raw(raw, timestamp)
+            return
+        self.store_state(self.to_state(columns), timestamp)
+
+    def store_state(self, state: dict, timestamp: str):
+        frame = None
+        if self.previous is not None and self.since_keyframe + 1 < self.keyframe_interval:
+            frame = self.delta(self.previous[1], state)
+        if frame is None:
+            frame = {'keyframe': numpy.array(True), **state}
+            self.since_keyframe = 0
+        else:
+            frame['base'] = numpy.array(self.previous[0])
+            self.since_keyframe += 1
+        with open(f'tmp/{timestamp}.frame.zst', 'wb') as file:
+            file.write(self.compressor.compress(pack(frame)))
+        self.previous = (timestamp, state)
+
+    def delta(self, previous: dict, state: dict):
+        # None when the snapshot can not be delta encoded against the previous
+        for uuids in (previous['uuid'], state['uuid']):
+            if len(numpy.unique(uuids)) != len(uuids):
+                return None
+        rows = {uuid: i for i, uuid in enumerate(previous['uuid'].tolist())}
+        matches = numpy.array([rows.get(uuid, -1) for uuid in state['uuid'].tolist()], dtype=numpy.int64)
+        matched = matches >= 0
+        kept = numpy.unique(matches[matched])
+        frame = {'removed': narrow(numpy.setdiff1d(numpy.arange(len(previous['uuid'])), kept))}
+
+        # Rows of the kept vehicles once the removed ones are dropped, then the
+        # vehicles that appeared
+        positions = numpy.empty(len(matches), dtype=numpy.int64)
+        positions[matched] = numpy.searchsorted(kept, matches[matched])
+        positions[~matched] = len(kept) + numpy.arange(numpy.count_nonzero(~matched))
+        if not numpy.array_equal(positions, numpy.arange(len(positions))):
+            frame['order'] = narrow(positions)
+
+        # New values of the kept rows, in kept order
+        current = numpy.empty(len(kept), dtype=numpy.int64)
+        current[positions[matched]] = numpy.flatnonzero(matched)
+        for name in COLUMNS + NULLS + COORDINATES:
+            values = state[name][current]
+            frame[f'added_{name}'] = state[name][~matched]
+            if name in COORDINATES:
+                frame[f'{name}_delta'] = narrow(values - previous[name][kept])
+                continue
+            changed = values != previous[name][kept]
+            frame[f'{name}_changed'] = numpy.packbits(changed)
+            frame[f'{name}_values'] = values[changed]
+
+        rebuilt = self.apply(previous, frame)
+        if not all(numpy.array_equal(rebuilt[name], state[name]) for name in COLUMNS + NULLS + COORDINATES):
+            return None
+        return frame
+
+    def read_frame(self, timestamp: str):
+        try:
+            with open(f'tmp/{timestamp}.frame.zst', 'rb') as file:
+                compressed = file.read()
+        except FileNotFoundError:
+            return None
+        return unpack(self.decompressor.decompress(compressed))
+
+    def get_state(self, timestamp: str):
+        if self.cached[0] == timestamp:
+            return self.cached[1]
+        # Frames from the requested one back to its keyframe, or to the
+        # snapshot reconstructed last
+        requested = timestamp
+        frames = []
+        state = None
+        while True:
+            frame = self.read_frame(timestamp)
+            if frame is None:
+                return None
+            frames.append(frame)
+            if 'keyframe' in frame:
+                break
+            timestamp = str(frame['base'])
+            if self.cached[0] == timestamp:
+                state = self.cached[1]
+                break
+
+        for frame in reversed(frames):
+            state = frame if 'keyframe' in frame else self.apply(state, frame)
+        self.cached = (requested, state)
+        return state
+
+    def apply(self, previous: dict, frame: dict):
+        kept = numpy.ones(len(previous['uuid']), dtype=bool)
+        kept[frame['removed']] = False
+        state = {}
+        for name in COLUMNS + NULLS + COORDINATES:
+            values = previous[name][kept]
+            if name in COORDINATES:
+                values = values + frame[f'{name}_delta']
+            else:
+                changed = numpy.unpackbits(frame[f'{name}_changed'], count=len(values)).view(bool)
+                values[changed] = frame[f'{name}_values']
+            values = numpy.concatenate([values, frame[f'added_{name}']])
+            if 'order' in frame:
+                values = values[frame['order']]
+            state[name] = values
+        return state
+
+    def get_document(self, timestamp: str):
+        state = self.get_state(timestamp)
+        if state is None:
+            return None
+        return self.to_document(state)
+
+    def to_document(self, state: dict):
+        columns = {name: column(state, name).tolist() for name in COLUMNS}
+        longitudes = (state['coordinates_0'] * self.quantum).tolist()
+        latitudes = (state['coordinates_1'] * self.quantum).tolist()
+        return {
+            'type': 'FeatureCollection',
+            'features': [
+                {
+                    'type': 'Feature',
+                    'properties': {
+                        'uuid': uuid,
+                        'id': id,
+                        'color': color,
+                        'direction': int(direction) + 1,
+                        'distance': distance,
+                        'distanceFromPoint': distance_from_point,
+                        'lineId': line_id,
+                        'pointId': point_id,
+                    },
+                    'geometry': {'type': 'Point', 'coordinates': [longitude, latitude]},
+                }
+                for uuid, id, color, direction, distance, distance_from_point, line_id, point_id, longitude, latitude
+                in zip(*(columns[name] for name in COLUMNS), longitudes, latitudes)
+            ],
+        }
+
+    def get_document_arrow(self, timestamp: str):
+        state = self.get_state(timestamp)
+        if state is None:
+            return columnar.table_from_columns({})
+        return columnar.table_from_columns(
+            {
+                'timestamp': pyarrow.repeat(timestamp, len(state['uuid'])),
+                **{name: column(state, name) for name in COLUMNS},
+                **{name: state[name] * self.quantum for name in COORDINATES},
+            }
+        )
+
+    def list_timestamps(self):
+        return [f.removesuffix('.frame.zst') for f in os.listdir('tmp') if f.endswith('.frame.zst')]
+
+    def storage_paths(self):
+        return ['tmp']
+
+    def get_total_size(self):
+        return sum(os.path.getsize(f'tmp/{f}') for f in os.listdir('tmp'))
+
+    def name(self):
+        return f'DeltaEncodedStore(keyframe_interval={self.keyframe_interval}, quantum={self.quantum})'
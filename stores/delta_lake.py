@@ -39,6 +39,9 @@ class DeltaLakeStore(BaseStore):
             .where(f"timestamp = '{timestamp}'")
         )
 
+    def storage_paths(self):
+        return ["delta_lake"]
+
     def get_total_size(self):
         root_directory = Path("delta_lake")
         return sum([
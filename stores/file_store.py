@@ -23,5 +23,11 @@ class FileStore(BaseStore):
         with open(f'tmp/{timestamp}.json', 'r') as file:
             return json.load(file)
 
+    def list_timestamps(self):
+        return [f.removesuffix('.json') for f in os.listdir('tmp')]
+
+    def storage_paths(self):
+        return ['tmp']
+
     def get_total_size(self):
         return sum(os.path.getsize(f'tmp/{f}') for f in os.listdir('tmp'))
@@ -24,5 +24,11 @@ class GZipFileStore(BaseStore):
         with gzip.open(f'tmp/{timestamp}.json.gz', 'rt') as file:
             return json.load(file)
 
+    def list_timestamps(self):
+        return [f.removesuffix('.json.gz') for f in os.listdir('tmp')]
+
+    def storage_paths(self):
+        return ['tmp']
+
     def get_total_size(self):
         return sum(os.path.getsize(f'tmp/{f}') for f in os.listdir('tmp'))
@@ -0,0 +1,294 @@
+import json
+import os
+import shutil
+
+import numpy
+import pyarrow
+import pyarrow.compute
+
+from stores import columnar
+from stores.base_store import BaseStore
+
+# One append-only file of fixed-width values per attribute, row after row.
+# Text attributes hold codes into a dictionary file of their distinct values,
+# one JSON string per line, and direction is a bitmap (True for direction 2).
+COLUMNS = {
+    'uuid': numpy.uint32,
+    'id': numpy.int32,
+    'color': numpy.uint16,
+    'distance': numpy.float32,
+    'distanceFromPoint': numpy.uint16,
+    'lineId': numpy.uint16,
+    'pointId': numpy.uint32,
+    'coordinates_0': numpy.float32,
+    'coordinates_1': numpy.float32,
+}
+TEXT_COLUMNS = ['uuid', 'color', 'lineId', 'pointId']
+# Snapshots: their timestamp and the row that ends them, written last so that
+# a snapshot is only visible once all its rows are
+TIMESTAMPS = numpy.dtype('S32')
+ENDS = numpy.dtype('<i8')
+
+
+def path(name: str):
+    return f'tmp/{name}.bin'
+
+
+def write_at(name: str, position: int, data: bytes):
+    # Rows left by an interrupted write are overwritten
+    fd = os.open(path(name), os.O_WRONLY | os.O_CREAT)
+    try:
+        os.pwrite(fd, data, position)
+        os.ftruncate(fd, position + len(data))
+    finally:
+        os.close(fd)
+
+
+def to_numpy(column):
+    if isinstance(column, (pyarrow.Array, pyarrow.ChunkedArray)):
+        return column.to_numpy(zero_copy_only=False)
+    return numpy.asarray(column)
+
+
+def narrow(name: str, values, dtype):
+    # Fixed-width values of the column; integers out of its range would wrap
+    values = numpy.asarray(values)
+    if numpy.issubdtype(dtype, numpy.integer) and len(values):
+        info = numpy.iinfo(dtype)
+        low, high = values.min(), values.max()
+        if low < info.min or high > info.max:
+            raise ValueError(f'{name} values [{low}, {high}] do not fit in {numpy.dtype(dtype)}')
+    return values.astype(dtype)
+
+
+class MemmapColumnarStore(BaseStore):
+    # No decoding on reads: a snapshot is a slice of the memory-mapped file of
+    # every attribute, found through the ends of the snapshots. The numeric
+    # columns of get_document_arrow and get_documents_arrow are views of the
+    # mapped files, consecutive snapshots are read as one slice.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Create tmp directory if it doesn't exist
+        os.makedirs('tmp', exist_ok=True)
+        self.clear()
+
+    def clear(self):
+        # Mapped snapshots and rows, and timestamp -> snapshot
+        self.count = 0
+        self.rows = 0
+        self.index = {}
+        self.maps = {}
+        self.ends = numpy.zeros(0, ENDS)
+        # Distinct values of the text columns, and how far their files were read
+        self.dictionaries = {name: [] for name in TEXT_COLUMNS}
+        self.dictionary_arrays = {}
+        self.dictionary_sizes = {name: 0 for name in TEXT_COLUMNS}
+        # Writer state, loaded from the files on the first write
+        self.writing = False
+        self.codes = {}
+        self.written_count = 0
+        self.written_rows = 0
+
+    def reset(self):
+        self.maps = {}
+        shutil.rmtree('tmp')
+        os.makedirs('tmp', exist_ok=False)
+        self.clear()
+
+    def refresh(self):
+        # Map the snapshots committed since the last call
+        try:
+            count = os.path.getsize(path('ends')) // ENDS.itemsize
+        except FileNotFoundError:
+            return
+        if count == self.count:
+            return
+        self.ends = self.map('ends', ENDS, count)
+        timestamps = self.map('timestamps', TIMESTAMPS, count)
+        self.index.update(
+            (timestamp.decode(), i) for i, timestamp in enumerate(timestamps[self.count:].tolist(), self.count)
+        )
+        self.timestamps = timestamps
+        self.count = count
+        self.rows = int(self.ends[-1])
+        self.maps = {name: self.map(name, dtype, self.rows) for name, dtype in COLUMNS.items()}
+        self.maps['direction'] = self.map('direction', numpy.uint8, (self.rows + 7) // 8)
+        for name in TEXT_COLUMNS:
+            self.read_dictionary(name)
+
+    def map(self, name: str, dtype, length: int):
+        # Empty files can not be mapped
+        if not length:
+            return numpy.zeros(0, dtype)
+        return numpy.memmap(path(name), dtype, mode='r', shape=(length,))
+
+    def read_dictionary(self, name: str):
+        # Values are appended before the rows that use them
+        try:
+            with open(path(f'{name}.dictionary'), 'rb') as file:
+                file.seek(self.dictionary_sizes[name])
+                data = file.read()
+        except FileNotFoundError:
+            return
+        complete = data[:data.rfind(b'\n') + 1]
+        if not complete:
+            return
+        self.dictionaries[name].extend(json.loads(line) for line in complete.splitlines())
+        self.dictionary_sizes[name] += len(complete)
+        self.dictionary_arrays.pop(name, None)
+
+    def open_writer(self):
+        self.refresh()
+        self.writing = True
+        self.written_count, self.written_rows = self.count, self.rows
+        self.codes = {name: {value: code for code, value in enumerate(self.dictionaries[name])} for name in TEXT_COLUMNS}
+
+    def store_document(self, data: dict, timestamp: str):
+        self.store_columns(columnar.flatten([(data, timestamp)]), timestamp)
+
+    def store_raw(self, raw: bytes, timestamp: str):
+        try:
+            columns = columnar.decode_raw(raw, timestamp)
+        except pyarrow.ArrowInvalid:
+            super().store_raw(raw, timestamp)
+            return
+        self.store_columns(columns, timestamp)
+
+    def encode(self, name: str, column):
+        # Codes of the values, new values are appended to the dictionary file
+        # Missing values (e.g. pointId) are a null entry of the dictionary, and
+        # numbers (pointId in some feeds) are stored as text
+        if not isinstance(column, (pyarrow.Array, pyarrow.ChunkedArray)):
+            column = pyarrow.array(column)
+        encoded = pyarrow.compute.dictionary_encode(column.cast(pyarrow.string()), null_encoding='encode')
+        codes = self.codes[name]
+        added = [value for value in encoded.dictionary.to_pylist() if value not in codes]
+        if added:
+            with open(path(f'{name}.dictionary'), 'ab') as file:
+                file.write(b''.join(json.dumps(value).encode() + b'\n' for value in added))
+            for value in added:
+                codes[value] = len(codes)
+        mapping = narrow(name, [codes[value] for value in encoded.dictionary.to_pylist()], COLUMNS[name])
+        return mapping[encoded.indices.to_numpy(zero_copy_only=False)]
+
+    def store_columns(self, columns: dict, timestamp: str):
+        if not self.writing:
+            self.open_writer()
+        rows, count = self.written_rows, self.written_count
+        length = len(columns['uuid'])
+        for name, dtype in COLUMNS.items():
+            if name in TEXT_COLUMNS:
+                values = self.encode(name, columns[name])
+            else:
+                values = narrow(name, to_numpy(columns[name]), dtype)
+            write_at(name, rows * numpy.dtype(dtype).itemsize, values.tobytes())
+
+        # Bits of the direction bitmap are appended after the last partial byte
+        directions = to_numpy(columns['direction']).astype(bool)
+        with open(path('direction'), 'a+b') as file:
+            file.seek(rows // 8)
+            tail = numpy.unpackbits(numpy.frombuffer(file.read(1), numpy.uint8))[:rows % 8]
+        write_at('direction', rows // 8, numpy.packbits(numpy.concatenate([tail.astype(bool), directions])).tobytes())
+
+        write_at('timestamps', count * TIMESTAMPS.itemsize, numpy.array([timestamp.encode()], TIMESTAMPS).tobytes())
+        write_at('ends', count * ENDS.itemsize, numpy.array([rows + length], ENDS).tobytes())
+        self.written_rows, self.written_count = rows + length, count + 1
+
+    def locate(self, timestamp: str):
+        if timestamp not in self.index:
+            self.refresh()
+        return self.index.get(timestamp)
+
+    def row_range(self, snapshot: int):
+        return (int(self.ends[snapshot - 1]) if snapshot else 0), int(self.ends[snapshot])
+
+    def slice(self, start: int, end: int):
+        # {attribute: array} of rows [start, end), numeric columns are views
+        columns = {name: self.maps[name][start:end] for name in COLUMNS}
+        bits = numpy.unpackbits(self.maps['direction'][start // 8:(end + 7) // 8])
+        columns['direction'] = bits[start % 8:start % 8 + end - start].astype(bool)
+        return columns
+
+    def get_document(self, timestamp: str):
+        snapshot = self.locate(timestamp)
+        if snapshot is None:
+            return None
+        columns = self.slice(*self.row_range(snapshot))
+        values = {
+            name: (
+                [self.dictionaries[name][code] for code in columns[name].tolist()]
+                if name in TEXT_COLUMNS else columns[name].tolist()
+            )
+            for name in columns
+        }
+        return {
+            'type': 'FeatureCollection',
+            'features': [
+                {
+                    'type': 'Feature',
+                    'properties': {
+                        'uuid': uuid,
+                        'id': id,
+                        'color': color,
+                        'direction': int(direction) + 1,
+                        'distance': distance,
+                        'distanceFromPoint': distance_from_point,
+                        'lineId': line_id,
+                        'pointId': point_id,
+                    },
+                    'geometry': {'type': 'Point', 'coordinates': [longitude, latitude]},
+                }
+                for uuid, id, color, direction, distance, distance_from_point, line_id, point_id, longitude, latitude
+                in zip(*(values[name] for name in (
+                    'uuid', 'id', 'color', 'direction', 'distance', 'distanceFromPoint', 'lineId', 'pointId',
+                    'coordinates_0', 'coordinates_1',
+                )))
+            ],
+        }
+
+    def dictionary_array(self, name: str):
+        if name not in self.dictionary_arrays:
+            self.dictionary_arrays[name] = pyarrow.array(self.dictionaries[name], pyarrow.string())
+        return self.dictionary_arrays[name]
+
+    def to_table(self, snapshots: range):
+        start, end = self.row_range(snapshots.start)[0], self.row_range(snapshots.stop - 1)[1]
+        columns = self.slice(start, end)
+        for name in TEXT_COLUMNS:
+            columns[name] = self.dictionary_array(name).take(pyarrow.array(columns[name]))
+        counts = numpy.diff(self.ends[snapshots.start:snapshots.stop], prepend=start)
+        timestamps = self.timestamps[snapshots.start:snapshots.stop].astype(str)
+        columns['timestamp'] = pyarrow.array(numpy.repeat(timestamps, counts), pyarrow.string())
+        return columnar.table_from_columns(columns)
+
+    def get_document_arrow(self, timestamp: str):
+        snapshot = self.locate(timestamp)
+        if snapshot is None:
+            return columnar.table_from_columns({})
+        return self.to_table(range(snapshot, snapshot + 1))
+
+    def get_documents_arrow(self, timestamps: list):
+        # Runs of consecutive snapshots are read as one slice of every column
+        snapshots = sorted({self.locate(timestamp) for timestamp in timestamps} - {None})
+        runs = []
+        for snapshot in snapshots:
+            if runs and runs[-1].stop == snapshot:
+                runs[-1] = range(runs[-1].start, snapshot + 1)
+            else:
+                runs.append(range(snapshot, snapshot + 1))
+        if not runs:
+            return columnar.table_from_columns({})
+        return pyarrow.concat_tables([self.to_table(run) for run in runs])
+
+    def list_timestamps(self):
+        self.refresh()
+        return list(self.index)
+
+    def storage_paths(self):
+        return ['tmp']
+
+    def get_total_size(self):
+        return sum(os.path.getsize(f'tmp/{f}') for f in os.listdir('tmp'))
+
+    def name(self):
+        return 'MemmapColumnarStore'
@@ -3,6 +3,9 @@ from sqlalchemy.orm import DeclarativeBase
 
 from stores.base_store import BaseStore
 
+# Rows fetched per round trip by the server-side cursor of iter_documents
+STREAM_ROWS = 10000
+
 
 class MobilityDBStore(BaseStore):
     def __init__(self, *args, **kwargs):
@@ -94,6 +97,26 @@ ttext '[{feature['properties']['pointId']}@{timestamp}]'
 
         self.connection.commit()
 
+    def row_to_feature(self, row, timestamp: str):
+        return {
+            'geometry': {
+                'coordinates': row[8],
+                'type': 'Point'
+            },
+            'id': str(row[0]),
+            'properties': {
+                'color': row[1],
+                'direction': row[2],
+                'distance': row[3],
+                'distanceFromPoint': row[4],
+                'id': row[5],
+                'lineId': row[6],
+                'pointId': row[7],
+                'timestamp': timestamp,
+                'uuid': str(row[0])
+            }
+        }
+
     def get_document(self, timestamp: str):
         features_rows = self.connection.execute(sqlalchemy.text(
                 f"""
@@ -113,31 +136,50 @@ ttext '[{feature['properties']['pointId']}@{timestamp}]'
 
         )).fetchall()
         print(len(features_rows))
-        return {'features': [
-            {
-                'geometry': {
-                    'coordinates': row[8],
-                    'type': 'Point'
-                },
-                'id': str(row[0]),
-                'properties': {
-                    'color': row[1],
-                    'direction': row[2],
-                    'distance': row[3],
-                    'distanceFromPoint': row[4],
-                    'id': row[5],
-                    'lineId': row[6],
-                    'pointId': row[7],
-                    'timestamp': timestamp,
-                    'uuid': str(row[0])
-                }
-            } for row in features_rows
-
-        ], 'type': 'FeatureCollection'}
+        return {'features': [self.row_to_feature(row, timestamp) for row in features_rows], 'type': 'FeatureCollection'}
 
-    def get_total_size(self):
+    def iter_documents(self, start: str, end: str):
+        # Restrict every trip to the period, unnest its instants and stream them
+        # ordered by time through a server-side cursor
+        with self.engine.connect() as connection:
+            result = connection.execution_options(yield_per=STREAM_ROWS).execute(sqlalchemy.text(
+                """
+            SELECT
+                properties_uuid,
+                properties_color,
+                properties_direction,
+                getValue(atTimestamp(properties_distance, t)),
+                getValue(atTimestamp(properties_distance_from_point, t)),
+                getValue(atTimestamp(properties_id, t)),
+                properties_lineid,
+                getValue(atTimestamp(properties_pointid, t)),
+                asText(atTimestamp(geometry_coordinates, t)),
+                t
+            FROM feature,
+                unnest(timestamps(atPeriod(properties_pointid, CAST(:period AS period)))) AS t
+            WHERE properties_pointid && CAST(:period AS period)
+            ORDER BY t
+        """
+            ), {'period': f'[{start}, {end})'})
+
+            timestamp, features = None, []
+            for row in result:
+                # Keyed like the stored timestamps, without the UTC offset of timestamptz
+                row_timestamp = row[9].replace(tzinfo=None).isoformat()
+                if row_timestamp != timestamp:
+                    if timestamp is not None:
+                        yield {'features': features, 'type': 'FeatureCollection'}, timestamp
+                    timestamp, features = row_timestamp, []
+                features.append(self.row_to_feature(row, timestamp))
+
+            if timestamp is not None:
+                yield {'features': features, 'type': 'FeatureCollection'}, timestamp
+
+    def finalize(self):
         self.connection.execute(sqlalchemy.text('commit'))
         self.connection.execute(sqlalchemy.text('vacuum full public.feature'))
+
+    def get_total_size(self):
         with self.engine.connect() as connection:
             result_1 = connection.execute(sqlalchemy.text('SELECT pg_relation_size(\'document\')'))
             result_2 = connection.execute(sqlalchemy.text('SELECT pg_relation_size(\'feature\')'))
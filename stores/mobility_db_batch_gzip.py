@@ -1,11 +1,25 @@
 import gzip
-from collections import defaultdict
 
 import sqlalchemy
 from sqlalchemy.orm import DeclarativeBase
 
+from stores import columnar
 from stores.base_store import BaseStore
 
+# Buffer columns grouped per vehicle, named after the feature table columns
+BUFFER_COLUMNS = {
+    "timestamp": "timestamp",
+    "geometry_coordinates": "geometry_coordinates",
+    "properties_color": "color",
+    "properties_uuid": "uuid",
+    "properties_direction": "direction",
+    "properties_distance": "distance",
+    "properties_distance_from_point": "distanceFromPoint",
+    "properties_id": "id",
+    "properties_lineid": "lineId",
+    "properties_pointid": "pointId",
+}
+
 
 class MobilityDBBatchCompressedGZIPStore(BaseStore):
     def __init__(self, *args, **kwargs):
@@ -96,26 +110,19 @@ class MobilityDBBatchCompressedGZIPStore(BaseStore):
     def store_buffer(self):
         if not self.buffer:
             return
-        features_data = defaultdict(lambda: defaultdict(list))
         min_timestamp = self.buffer[0][1]
         max_timestamp = self.buffer[-1][1]
-        for data, timestamp in self.buffer:
-            for feature in data["features"]:
-                dic = features_data[feature["properties"]["uuid"]]
-                dic["timestamp"].append(timestamp)
-                dic["geometry_coordinates"].append(
-                    f"POINT({' '.join(map(str, feature['geometry']['coordinates']))})"
-                )
-                dic["properties_color"].append(feature["properties"]["color"])
-                dic["properties_uuid"].append(feature["properties"]["uuid"])
-                dic["properties_direction"].append(feature["properties"]["direction"])
-                dic["properties_distance"].append(feature["properties"]["distance"])
-                dic["properties_distance_from_point"].append(
-                    feature["properties"]["distanceFromPoint"]
-                )
-                dic["properties_id"].append(feature["properties"]["id"])
-                dic["properties_lineid"].append(feature["properties"]["lineId"])
-                dic["properties_pointid"].append(feature["properties"]["pointId"])
+        columns = columnar.flatten(self.buffer)
+        # MobilityDB keeps the original 1/2 direction
+        columns["direction"] = columns["direction"] + 1
+        columns["geometry_coordinates"] = [
+            f"POINT({x} {y})"
+            for x, y in columnar.records(columns, ("coordinates_0", "coordinates_1"))
+        ]
+        features_data = {}
+        for uuid, rows in columnar.group_by(columns).items():
+            values = columnar.to_python(columns, BUFFER_COLUMNS.values(), rows)
+            features_data[uuid] = {key: values[name] for key, name in BUFFER_COLUMNS.items()}
 
         for uuid, data in features_data.items():
             result = self.connection.execute(
@@ -201,9 +208,11 @@ class MobilityDBBatchCompressedGZIPStore(BaseStore):
 
         return {"features": features, "type": "FeatureCollection"}
 
-    def get_total_size(self):
+    def finalize(self):
         self.store_buffer()
+        self.buffer.clear()
 
+    def get_total_size(self):
         with self.engine.connect() as connection:
             result_2 = connection.execute(
                 sqlalchemy.text("SELECT pg_relation_size('compressed_feature')")
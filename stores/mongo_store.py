@@ -22,7 +22,9 @@ class MongoStore(BaseStore):
     def get_document(self, timestamp: str):
         return self.collection.find_one({"timestamp": timestamp})
 
-    def get_total_size(self):
+    def finalize(self):
         # FLush changes to disk
         self.client["admin"].command("fsync")
+
+    def get_total_size(self):
         return self.db.command("dbstats")["storageSize"]
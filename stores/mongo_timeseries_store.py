@@ -25,10 +25,11 @@ class MongoTimeSeriesStore(BaseStore):
         self.collection = self.db["documentsTS"]
 
     def store_document(self, data: dict, timestamp: str):
+        moment = datetime.datetime.fromisoformat(timestamp)
         self.collection.insert_many(
             [
                 {
-                    "timestamp": datetime.datetime.fromisoformat(timestamp),
+                    "timestamp": moment,
                     "uuid": feature["properties"]["uuid"],
                     "id": feature["properties"]["id"],
                     "color": feature["properties"]["color"],
@@ -51,7 +52,9 @@ class MongoTimeSeriesStore(BaseStore):
             "type": "FeatureCollection",
         }
 
-    def get_total_size(self):
+    def finalize(self):
         # FLush changes to disk
         self.client["admin"].command("fsync")
+
+    def get_total_size(self):
         return self.db.command("dbstats")["storageSize"]
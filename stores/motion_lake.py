@@ -34,8 +34,7 @@ class MotionLakeStore(BaseStore):
         )
 
     def get_total_size(self):
-        self.client.flush_buffer("benchmark")
         return self.client.get_collection_size("benchmark")
 
-    def flush_buffer(self):
+    def finalize(self):
         self.client.flush_buffer("benchmark")
\ No newline at end of file
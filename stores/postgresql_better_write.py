@@ -1,8 +1,13 @@
+from collections import defaultdict
+
 from sqlalchemy.orm import DeclarativeBase
 
 from stores.base_store import BaseStore
 import sqlalchemy
 
+# Rows fetched per round trip by the server-side cursor of iter_documents
+STREAM_ROWS = 10000
+
 
 class Base(DeclarativeBase):
     pass
@@ -51,16 +56,40 @@ class PostgreSQLPythonBetterWriteStore(BaseStore):
         Base.metadata.create_all(self.engine)
         self.last_inserted_id = 0
 
+    def feature_values(self, data: dict):
+        return [f"({self.last_inserted_id}, {feature["geometry"]["coordinates"][0]}, {feature["geometry"]["coordinates"][1]}, \'{feature["id"]}\', \'{feature["properties"]["color"]}\', {bool(feature["properties"]["direction"] - 1)}, {feature["properties"]["distance"]}, {feature["properties"]["distanceFromPoint"]}, {feature["properties"]["id"]}, \'{feature["properties"]["lineId"]}\', {feature["properties"]["pointId"]})" for feature in data["features"]]
+
+    def insert_features(self, values: list):
+        self.session.execute(sqlalchemy.text(
+            f'INSERT INTO feature (document_id, geometry_coordinates_0, geometry_coordinates_1, id, properties_color, properties_direction, properties_distance, properties_distance_from_point, properties_id, properties_lineid, properties_pointid) VALUES '
+            f'{",".join(values)}'
+        ))
+
     def store_document(self, data: dict, timestamp: str):
         self.last_inserted_id += 1
         self.session.add(Document(timestamp=timestamp, id=self.last_inserted_id))
         self.session.commit()
-        self.session.execute(sqlalchemy.text(
-            f'INSERT INTO feature (document_id, geometry_coordinates_0, geometry_coordinates_1, id, properties_color, properties_direction, properties_distance, properties_distance_from_point, properties_id, properties_lineid, properties_pointid) VALUES '
-            f'{",".join([f"({self.last_inserted_id}, {feature["geometry"]["coordinates"][0]}, {feature["geometry"]["coordinates"][1]}, \'{feature["id"]}\', \'{feature["properties"]["color"]}\', {bool(feature["properties"]["direction"] - 1)}, {feature["properties"]["distance"]}, {feature["properties"]["distanceFromPoint"]}, {feature["properties"]["id"]}, \'{feature["properties"]["lineId"]}\', {feature["properties"]["pointId"]})" for feature in data["features"]])}'
-        ))
+        self.insert_features(self.feature_values(data))
         self.session.commit()
 
+    def store_documents(self, documents):
+        # A single multi-row INSERT for the features of the whole batch
+        values = []
+        for data, timestamp in documents:
+            self.last_inserted_id += 1
+            self.session.add(Document(timestamp=timestamp, id=self.last_inserted_id))
+            values.extend(self.feature_values(data))
+        self.session.commit()
+        if values:
+            self.insert_features(values)
+        self.session.commit()
+
+    def row_to_feature(self, row, timestamp: str):
+        return {"type": "Feature", 'geometry': {'type': 'Point', 'coordinates': [row[1], row[2]]}, 'id': row[3],
+                'properties': {'color': row[4], 'direction': row[5] + 1, 'distance': row[6],
+                               'distanceFromPoint': row[7], 'id': row[8], 'lineId': row[9], 'pointId': row[10],
+                               'timestamp': timestamp, 'uuid': row[3]}}
+
     def get_document(self, timestamp: str):
         result = self.connection.execute(sqlalchemy.text(
             f'SELECT * FROM document WHERE timestamp = \'{timestamp}\''
@@ -70,13 +99,53 @@ class PostgreSQLPythonBetterWriteStore(BaseStore):
             f'SELECT * FROM feature WHERE document_id = {document_id}'
         ))
 
-        features = [{"type": "Feature", 'geometry': {'type': 'Point', 'coordinates': [row[1], row[2]]}, 'id': row[3],
-                     'properties': {'color': row[4], 'direction': row[5] + 1, 'distance': row[6],
-                                    'distanceFromPoint': row[7], 'id': row[8], 'lineId': row[9], 'pointId': row[10],
-                                    'timestamp': timestamp, 'uuid': row[3]}} for row in result.fetchall()]
+        features = [self.row_to_feature(row, timestamp) for row in result.fetchall()]
 
         return {'features': features, 'type': 'FeatureCollection'}
 
+    def get_documents(self, timestamps: list):
+        # Keep the requested text of each timestamp to map the rows back to it
+        documents = self.connection.execute(sqlalchemy.text(
+            'SELECT requested.requested_timestamp, document.id '
+            'FROM unnest(CAST(:timestamps AS text[])) AS requested(requested_timestamp) '
+            'JOIN document ON document.timestamp = CAST(requested.requested_timestamp AS timestamp)'
+        ), {'timestamps': list(set(timestamps))}).fetchall()
+        document_timestamps = {row[1]: row[0] for row in documents}
+
+        result = self.connection.execute(sqlalchemy.text(
+            'SELECT * FROM feature WHERE document_id = ANY(:document_ids)'
+        ), {'document_ids': list(document_timestamps)})
+
+        features = defaultdict(list)
+        for row in result.fetchall():
+            timestamp = document_timestamps[row[0]]
+            features[timestamp].append(self.row_to_feature(row, timestamp))
+
+        return [{'features': features[timestamp], 'type': 'FeatureCollection'} for timestamp in timestamps]
+
+    def iter_documents(self, start: str, end: str):
+        # Server-side cursor: rows are fetched in chunks while the caller consumes them
+        with self.engine.connect() as connection:
+            result = connection.execution_options(yield_per=STREAM_ROWS).execute(sqlalchemy.text(
+                'SELECT feature.*, document.timestamp FROM document '
+                'JOIN feature ON feature.document_id = document.id '
+                'WHERE document.timestamp >= CAST(:start AS timestamp) AND document.timestamp < CAST(:end AS timestamp) '
+                'ORDER BY document.timestamp'
+            ), {'start': start, 'end': end})
+
+            timestamp, features = None, []
+            for row in result:
+                # Keyed like the stored timestamps, without the UTC offset of timestamptz
+                row_timestamp = row[11].replace(tzinfo=None).isoformat()
+                if row_timestamp != timestamp:
+                    if timestamp is not None:
+                        yield {'features': features, 'type': 'FeatureCollection'}, timestamp
+                    timestamp, features = row_timestamp, []
+                features.append(self.row_to_feature(row, timestamp))
+
+            if timestamp is not None:
+                yield {'features': features, 'type': 'FeatureCollection'}, timestamp
+
     def get_total_size(self):
         with self.engine.connect() as connection:
             result_1 = connection.execute(sqlalchemy.text('SELECT pg_relation_size(\'document\')'))
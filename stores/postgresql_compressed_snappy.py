@@ -158,9 +158,11 @@ class PostgreSQLCompressedSnappy(BaseStore):
 
         return {"features": features, "type": "FeatureCollection"}
 
-    def get_total_size(self):
+    def finalize(self):
         self.store_buffer()
+        self.buffer.clear()
 
+    def get_total_size(self):
         with self.engine.connect() as connection:
             result_2 = connection.execute(
                 sqlalchemy.text("SELECT pg_relation_size('compressed_feature')")
@@ -70,11 +70,9 @@ class PostgreJSONAggSQLStore(BaseStore):
             ))
         self.session.commit()
 
-    def get_document(self, timestamp: str):
-        with self.engine.connect() as connection:
-            result = connection.execute(sqlalchemy.text(
-                f'''
-                SELECT jsonb_build_object(
+    def feature_collection_sql(self, timestamp_sql: str):
+        return f'''
+                jsonb_build_object(
                     'type', 'FeatureCollection',
                     'features', jsonb_agg(
                         jsonb_build_object(
@@ -93,11 +91,18 @@ class PostgreJSONAggSQLStore(BaseStore):
                                 'lineId', feature.properties_lineid,
                                 'pointId', feature.properties_pointId,
                                 'uuid', feature.id,
-                                'timestamp', '{timestamp}'
+                                'timestamp', {timestamp_sql}
                             )
                         )
                     )
-                ) AS feature_collection
+                )
+                '''
+
+    def get_document(self, timestamp: str):
+        with self.engine.connect() as connection:
+            result = connection.execute(sqlalchemy.text(
+                f'''
+                SELECT {self.feature_collection_sql(f"'{timestamp}'")} AS feature_collection
                 FROM feature
                 JOIN document ON feature.document_id = document.id
                 WHERE document.timestamp = '{timestamp}'
@@ -105,6 +110,22 @@ class PostgreJSONAggSQLStore(BaseStore):
             ))
             return result.fetchone()[0]
 
+    def get_documents(self, timestamps: list):
+        # One aggregation query grouped by requested timestamp
+        with self.engine.connect() as connection:
+            result = connection.execute(sqlalchemy.text(
+                f'''
+                SELECT requested.requested_timestamp,
+                       {self.feature_collection_sql('requested.requested_timestamp')} AS feature_collection
+                FROM unnest(CAST(:timestamps AS text[])) AS requested(requested_timestamp)
+                JOIN document ON document.timestamp = CAST(requested.requested_timestamp AS timestamp)
+                JOIN feature ON feature.document_id = document.id
+                GROUP BY requested.requested_timestamp
+                '''
+            ), {'timestamps': list(set(timestamps))})
+            documents = {row[0]: row[1] for row in result.fetchall()}
+        return [documents.get(timestamp) for timestamp in timestamps]
+
     def get_total_size(self):
         with self.engine.connect() as connection:
             result_1 = connection.execute(sqlalchemy.text('SELECT pg_relation_size(\'document\')'))
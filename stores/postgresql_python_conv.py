@@ -1,8 +1,15 @@
+from collections import defaultdict
+
 from sqlalchemy.orm import DeclarativeBase
 
+from stores import columnar
 from stores.base_store import BaseStore
+import pyarrow
 import sqlalchemy
 
+# Rows fetched per round trip by the server-side cursor of iter_documents
+STREAM_ROWS = 10000
+
 
 class Base(DeclarativeBase):
     pass
@@ -52,7 +59,7 @@ class PostgreSQLPythonReadStore(BaseStore):
         Base.metadata.create_all(self.engine)
         self.last_inserted_id = 0
 
-    def store_document(self, data: dict, timestamp: str):
+    def add_document(self, data: dict, timestamp: str):
         self.last_inserted_id += 1
         self.session.add(Document(timestamp=timestamp, id=self.last_inserted_id))
         for feature in data['features']:
@@ -69,8 +76,23 @@ class PostgreSQLPythonReadStore(BaseStore):
                 properties_lineid=feature['properties']['lineId'],
                 properties_pointid=feature['properties']['pointId'],
             ))
+
+    def store_document(self, data: dict, timestamp: str):
+        self.add_document(data, timestamp)
+        self.session.commit()
+
+    def store_documents(self, documents):
+        # One transaction for the whole batch
+        for data, timestamp in documents:
+            self.add_document(data, timestamp)
         self.session.commit()
 
+    def row_to_feature(self, row, timestamp: str):
+        return {"type": "Feature", 'geometry': {'type': 'Point', 'coordinates': [row[1], row[2]]}, 'id': row[3],
+                'properties': {'color': row[4], 'direction': row[5] + 1, 'distance': row[6],
+                               'distanceFromPoint': row[7], 'id': row[8], 'lineId': row[9], 'pointId': row[10],
+                               'timestamp': timestamp, 'uuid': row[3]}}
+
     def get_document(self, timestamp: str):
         result = self.connection.execute(sqlalchemy.text(
             f'SELECT * FROM document WHERE timestamp = \'{timestamp}\''
@@ -80,13 +102,75 @@ class PostgreSQLPythonReadStore(BaseStore):
             f'SELECT * FROM feature WHERE document_id = {document_id}'
         ))
 
-        features = [{"type": "Feature", 'geometry': {'type': 'Point', 'coordinates': [row[1], row[2]]}, 'id': row[3],
-                     'properties': {'color': row[4], 'direction': row[5] + 1, 'distance': row[6],
-                                    'distanceFromPoint': row[7], 'id': row[8], 'lineId': row[9], 'pointId': row[10],
-                                    'timestamp': timestamp, 'uuid': row[3]}} for row in result.fetchall()]
+        features = [self.row_to_feature(row, timestamp) for row in result.fetchall()]
 
         return {'features': features, 'type': 'FeatureCollection'}
 
+    def get_document_arrow(self, timestamp: str):
+        rows = self.connection.execute(sqlalchemy.text(
+            'SELECT feature.* FROM feature JOIN document ON feature.document_id = document.id '
+            'WHERE document.timestamp = CAST(:timestamp AS timestamp)'
+        ), {'timestamp': timestamp}).fetchall()
+
+        # Transpose the rows once and build every column in a single call
+        columns = list(zip(*rows)) if rows else [()] * 11
+        return columnar.table_from_columns({
+            'timestamp': pyarrow.repeat(timestamp, len(rows)),
+            'uuid': [str(uuid) for uuid in columns[3]],
+            'id': columns[8],
+            'color': columns[4],
+            'direction': columns[5],
+            'distance': columns[6],
+            'distanceFromPoint': columns[7],
+            'lineId': columns[9],
+            'pointId': [None if point_id is None else str(point_id) for point_id in columns[10]],
+            'coordinates_0': columns[1],
+            'coordinates_1': columns[2],
+        })
+
+    def get_documents(self, timestamps: list):
+        # Keep the requested text of each timestamp to map the rows back to it
+        documents = self.connection.execute(sqlalchemy.text(
+            'SELECT requested.requested_timestamp, document.id '
+            'FROM unnest(CAST(:timestamps AS text[])) AS requested(requested_timestamp) '
+            'JOIN document ON document.timestamp = CAST(requested.requested_timestamp AS timestamp)'
+        ), {'timestamps': list(set(timestamps))}).fetchall()
+        document_timestamps = {row[1]: row[0] for row in documents}
+
+        result = self.connection.execute(sqlalchemy.text(
+            'SELECT * FROM feature WHERE document_id = ANY(:document_ids)'
+        ), {'document_ids': list(document_timestamps)})
+
+        features = defaultdict(list)
+        for row in result.fetchall():
+            timestamp = document_timestamps[row[0]]
+            features[timestamp].append(self.row_to_feature(row, timestamp))
+
+        return [{'features': features[timestamp], 'type': 'FeatureCollection'} for timestamp in timestamps]
+
+    def iter_documents(self, start: str, end: str):
+        # Server-side cursor: rows are fetched in chunks while the caller consumes them
+        with self.engine.connect() as connection:
+            result = connection.execution_options(yield_per=STREAM_ROWS).execute(sqlalchemy.text(
+                'SELECT feature.*, document.timestamp FROM document '
+                'JOIN feature ON feature.document_id = document.id '
+                'WHERE document.timestamp >= CAST(:start AS timestamp) AND document.timestamp < CAST(:end AS timestamp) '
+                'ORDER BY document.timestamp'
+            ), {'start': start, 'end': end})
+
+            timestamp, features = None, []
+            for row in result:
+                # Keyed like the stored timestamps, without the UTC offset of timestamptz
+                row_timestamp = row[11].replace(tzinfo=None).isoformat()
+                if row_timestamp != timestamp:
+                    if timestamp is not None:
+                        yield {'features': features, 'type': 'FeatureCollection'}, timestamp
+                    timestamp, features = row_timestamp, []
+                features.append(self.row_to_feature(row, timestamp))
+
+            if timestamp is not None:
+                yield {'features': features, 'type': 'FeatureCollection'}, timestamp
+
     def get_total_size(self):
         with self.engine.connect() as connection:
             result_1 = connection.execute(sqlalchemy.text('SELECT pg_relation_size(\'document\')'))
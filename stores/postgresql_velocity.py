@@ -1,4 +1,5 @@
 import hashlib
+from collections import defaultdict
 
 from sqlalchemy.orm import DeclarativeBase
 
@@ -114,6 +115,15 @@ class PostgreSQLVelocityStore(BaseStore):
 
         self.session.commit()
 
+    def row_to_feature(self, row, hash_to_item: dict, timestamp: str):
+        return {"type": "Feature", 'geometry': {'type': 'Point', 'coordinates': [row[2] / 10 ** 8, row[3] / 10 ** 8]},
+                'id': str(hash_to_item[row[1]][1]),
+                'properties': {'color': hash_to_item[row[1]][3],
+                               'direction': int(hash_to_item[row[1]][4]) + 1, 'distance': row[4],
+                               'distanceFromPoint': row[5], 'id': str(hash_to_item[row[1]][1]),
+                               'lineId': hash_to_item[row[1]][5], 'pointId': hash_to_item[row[1]][5],
+                               'timestamp': timestamp, 'uuid': str(hash_to_item[row[1]][1])}}
+
     def get_document(self, timestamp: str):
         document = self.connection.execute(sqlalchemy.text(
             f'SELECT * FROM document WHERE timestamp = \'{timestamp}\''
@@ -129,17 +139,36 @@ class PostgreSQLVelocityStore(BaseStore):
 
         hash_to_item = {item[0]: item for item in items}
 
-        features = [{"type": "Feature", 'geometry': {'type': 'Point', 'coordinates': [row[2] / 10 ** 8, row[3] / 10 ** 8]},
-                     'id': str(hash_to_item[row[1]][1]),
-                     'properties': {'color': hash_to_item[row[1]][3],
-                                    'direction': int(hash_to_item[row[1]][4]) + 1, 'distance': row[4],
-                                    'distanceFromPoint': row[5], 'id': str(hash_to_item[row[1]][1]),
-                                    'lineId': hash_to_item[row[1]][5], 'pointId': hash_to_item[row[1]][5],
-                                    'timestamp': timestamp, 'uuid': str(hash_to_item[row[1]][1])}} for row in
-                    features]
+        features = [self.row_to_feature(row, hash_to_item, timestamp) for row in features]
 
         return {'features': features, 'type': 'FeatureCollection'}
 
+    def get_documents(self, timestamps: list):
+        # Keep the requested text of each timestamp to map the rows back to it
+        documents = self.connection.execute(sqlalchemy.text(
+            'SELECT requested.requested_timestamp, document.id '
+            'FROM unnest(CAST(:timestamps AS text[])) AS requested(requested_timestamp) '
+            'JOIN document ON document.timestamp = CAST(requested.requested_timestamp AS timestamp)'
+        ), {'timestamps': list(set(timestamps))}).fetchall()
+        document_timestamps = {row[1]: row[0] for row in documents}
+
+        features = self.connection.execute(sqlalchemy.text(
+            'SELECT * FROM feature WHERE document_id = ANY(:document_ids)'
+        ), {'document_ids': list(document_timestamps)}).fetchall()
+
+        items = self.connection.execute(sqlalchemy.text(
+            'SELECT * FROM item WHERE hash = ANY(:hashes)'
+        ), {'hashes': list({feature[1] for feature in features})}).fetchall()
+
+        hash_to_item = {item[0]: item for item in items}
+
+        documents = defaultdict(list)
+        for row in features:
+            timestamp = document_timestamps[row[0]]
+            documents[timestamp].append(self.row_to_feature(row, hash_to_item, timestamp))
+
+        return [{'features': documents[timestamp], 'type': 'FeatureCollection'} for timestamp in timestamps]
+
     def get_total_size(self):
         with self.engine.connect() as connection:
             result_1 = connection.execute(sqlalchemy.text('SELECT pg_relation_size(\'document\')'))
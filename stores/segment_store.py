@@ -0,0 +1,389 @@
+import json
+import os
+import shutil
+import struct
+import threading
+
+import numpy
+import zstandard
+
+from stores.base_store import BaseStore
+
+# Log-structured store: snapshots are appended to rolling segment files, and a
+# sorted index (timestamp -> segment, offset, length) is persisted next to them.
+#
+#   segment: b'SEG1' | dictionary length | dictionary | records
+#   record:  timestamp (TIMESTAMP_SIZE bytes, zero padded) | length | zstd frame
+#   index:   b'IDX1' | live segment | offset | entries | INDEX_DTYPE entries
+#
+# Live segments are compressed quickly and without dictionary. Once
+# compaction_segments of them are sealed, a background thread merges them into
+# one segment compressed at compaction_level against a dictionary trained on
+# their snapshots, then rewrites the index. The index header tells readers from
+# which live segment and offset the snapshots are not indexed yet: they index
+# those from the record headers, so other instances read while a feed is written.
+TIMESTAMP_SIZE = 32
+SEGMENT_HEADER = struct.Struct('<4sI')
+RECORD = struct.Struct(f'<{TIMESTAMP_SIZE}sI')
+INDEX_HEADER = struct.Struct('<4sIQQ')
+INDEX_DTYPE = numpy.dtype(
+    [('timestamp', f'S{TIMESTAMP_SIZE}'), ('segment', '<u4'), ('offset', '<u8'), ('length', '<u4')]
+)
+INDEX_PATH = 'tmp/index.bin'
+DICTIONARY_SIZE = 110 * 1024
+# Snapshots the dictionary of a compacted segment is trained on
+TRAINING_SAMPLES = 100
+
+
+def segment_path(segment: int):
+    return f'tmp/segment-{segment:08d}.log'
+
+
+def segment_ids():
+    return sorted(
+        int(f.removeprefix('segment-').removesuffix('.log'))
+        for f in os.listdir('tmp')
+        if f.startswith('segment-') and f.endswith('.log')
+    )
+
+
+class SegmentStore(BaseStore):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Create tmp directory if it doesn't exist
+        os.makedirs('tmp', exist_ok=True)
+        self.level = kwargs.get('level', 1)
+        self.segment_size = kwargs.get('segment_size', 1 << 20)
+        self.compaction_segments = kwargs.get('compaction_segments', 4)
+        self.compaction_level = kwargs.get('compaction_level', 9)
+        self.compressor = zstandard.ZstdCompressor(level=self.level)
+        # Guards the index, the file descriptors and the writer state shared
+        # with the compaction thread
+        self.lock = threading.Lock()
+        self.worker = None
+        self.worker_error = None
+        self.clear()
+
+    def clear(self):
+        # Persisted sorted index, memory-mapped, and the locations indexed since
+        self.index = numpy.zeros(0, INDEX_DTYPE)
+        self.index_version = None
+        self.recent = {}
+        # Offset up to which every live segment is indexed
+        self.scanned = {}
+        self.first_live = 0
+        self.fds = {}
+        self.decompressors = {}
+        # Writer state: segment being appended, sealed segments not compacted yet
+        self.writer = False
+        self.active = None
+        self.active_file = None
+        self.active_size = 0
+        self.sealed = []
+        self.next_segment = 0
+
+    def close(self):
+        self.wait()
+        if self.active_file is not None:
+            self.active_file.close()
+        for fd in self.fds.values():
+            os.close(fd)
+
+    def reset(self):
+        self.close()
+        shutil.rmtree('tmp')
+        os.makedirs('tmp', exist_ok=False)
+        self.clear()
+
+    def store_raw(self, raw: bytes, timestamp: str):
+        key = timestamp.encode()
+        if len(key) > TIMESTAMP_SIZE:
+            # struct would truncate it, and the snapshot could not be found
+            raise ValueError(f'Timestamp longer than {TIMESTAMP_SIZE} bytes: {timestamp!r}')
+        if self.active is None:
+            self.open_segment()
+        compressed = self.compressor.compress(raw)
+        offset = self.active_size + RECORD.size
+        # Unbuffered, a record is visible to readers as soon as it is written
+        self.active_file.write(RECORD.pack(key, len(compressed)) + compressed)
+        with self.lock:
+            self.recent[timestamp] = (self.active, offset, len(compressed))
+            self.active_size = offset + len(compressed)
+            self.scanned[self.active] = self.active_size
+        if self.active_size >= self.segment_size:
+            self.roll()
+
+    def store_document(self, data: dict, timestamp: str):
+        self.store_raw(json.dumps(data).encode(), timestamp)
+
+    def open_segment(self):
+        if not self.writer:
+            # Continue after the segments already in tmp/: load their index
+            # and the records appended after it while still a reader. The live
+            # segments of the previous writer are compacted with the next ones.
+            self.refresh()
+            with self.lock:
+                indexed = set(self.index['segment'].tolist())
+                self.sealed = [
+                    segment for segment in segment_ids()
+                    if segment == self.first_live or segment > self.first_live and segment not in indexed
+                ]
+            self.writer = True
+            self.next_segment = max(segment_ids(), default=-1) + 1
+        segment = self.next_segment
+        # The header is written under another name, readers listing the
+        # segments never see a file without it
+        with open(f'{segment_path(segment)}.tmp', 'wb') as file:
+            file.write(SEGMENT_HEADER.pack(b'SEG1', 0))
+        os.replace(f'{segment_path(segment)}.tmp', segment_path(segment))
+        self.active_file = open(segment_path(segment), 'ab', buffering=0)
+        # persist() reads both, they change together
+        with self.lock:
+            self.active, self.active_size = segment, SEGMENT_HEADER.size
+            self.next_segment = segment + 1
+
+    def roll(self):
+        self.active_file.close()
+        with self.lock:
+            self.sealed.append(self.active)
+            self.active, self.active_file, self.active_size = None, None, 0
+        if len(self.sealed) >= self.compaction_segments and (self.worker is None or not self.worker.is_alive()):
+            self.raise_worker_error()
+            segments, self.sealed = self.sealed, []
+            self.worker = threading.Thread(target=self.compact_in_background, args=(segments,), daemon=True)
+            self.worker.start()
+
+    def compact_in_background(self, segments):
+        try:
+            self.compact(segments)
+        except Exception as error:
+            self.worker_error = error
+
+    def raise_worker_error(self):
+        if self.worker_error is not None:
+            error, self.worker_error = self.worker_error, None
+            raise RuntimeError('Segment compaction failed') from error
+
+    def wait(self):
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+        self.raise_worker_error()
+
+    def compact(self, segments):
+        # Merge sealed segments into one segment compressed with a dictionary
+        with self.lock:
+            entries = self.entries(segments)
+        documents = [(timestamp, self.read(location)) for timestamp, location in entries]
+        samples = [raw for _, raw in documents[::max(len(documents) // TRAINING_SAMPLES, 1)]]
+        try:
+            dictionary = zstandard.train_dictionary(DICTIONARY_SIZE, samples, level=self.compaction_level)
+            compressor = zstandard.ZstdCompressor(level=self.compaction_level, dict_data=dictionary)
+            dictionary = dictionary.as_bytes()
+        except zstandard.ZstdError:
+            # Too few snapshots to train on
+            compressor = zstandard.ZstdCompressor(level=self.compaction_level)
+            dictionary = b''
+
+        with self.lock:
+            segment, self.next_segment = self.next_segment, self.next_segment + 1
+        # Written under another name, readers listing the segments never see
+        # a partial one
+        locations = {}
+        offset = SEGMENT_HEADER.size + len(dictionary)
+        with open(f'{segment_path(segment)}.tmp', 'wb') as file:
+            file.write(SEGMENT_HEADER.pack(b'SEG1', len(dictionary)) + dictionary)
+            for timestamp, raw in documents:
+                compressed = compressor.compress(raw)
+                file.write(RECORD.pack(timestamp.encode(), len(compressed)) + compressed)
+                locations[timestamp] = (segment, offset + RECORD.size, len(compressed))
+                offset += RECORD.size + len(compressed)
+        os.replace(f'{segment_path(segment)}.tmp', segment_path(segment))
+
+        with self.lock:
+            for timestamp, location in locations.items():
+                # Unless it was stored again meanwhile
+                if self.locate_locked(timestamp)[0] in segments:
+                    self.recent[timestamp] = location
+            self.persist()
+            for old in segments:
+                if old in self.fds:
+                    os.close(self.fds.pop(old))
+                self.decompressors.pop(old, None)
+                self.scanned.pop(old, None)
+        for old in segments:
+            os.remove(segment_path(old))
+
+    def entries(self, segments):
+        # (timestamp, location) of every snapshot in the given segments, sorted
+        in_segments = self.index[numpy.isin(self.index['segment'], list(segments))]
+        found = {
+            timestamp.decode(): (int(segment), int(offset), int(length))
+            for timestamp, segment, offset, length in in_segments.tolist()
+        }
+        found.update((timestamp, location) for timestamp, location in self.recent.items() if location[0] in segments)
+        return sorted(found.items())
+
+    def persist(self):
+        # Merge the recent locations into the sorted index file; called with the lock
+        self.load_index()
+        recent = numpy.array(
+            [(timestamp.encode(), *location) for timestamp, location in self.recent.items()], INDEX_DTYPE
+        )
+        kept = self.index[~numpy.isin(self.index['timestamp'], recent['timestamp'])]
+        merged = numpy.concatenate([kept, recent])
+        merged.sort(order='timestamp')
+        # Readers index what is appended after this point themselves
+        live = self.active if self.active is not None else self.next_segment
+        offset = self.active_size if self.active is not None else 0
+        with open(f'{INDEX_PATH}.tmp', 'wb') as file:
+            file.write(INDEX_HEADER.pack(b'IDX1', live, offset, len(merged)))
+            file.write(merged.tobytes())
+        os.replace(f'{INDEX_PATH}.tmp', INDEX_PATH)
+        self.map_index(live, offset, len(merged))
+        self.recent = {}
+
+    def map_index(self, live, offset, count):
+        stat = os.stat(INDEX_PATH)
+        self.index_version = (stat.st_ino, stat.st_mtime_ns)
+        if count:
+            self.index = numpy.memmap(INDEX_PATH, INDEX_DTYPE, mode='r', offset=INDEX_HEADER.size, shape=(count,))
+        else:
+            self.index = numpy.zeros(0, INDEX_DTYPE)
+        self.first_live = live
+        self.scanned = {segment: size for segment, size in self.scanned.items() if segment >= live}
+        self.scanned[live] = max(self.scanned.get(live, 0), offset)
+
+    def load_index(self):
+        # Map the index file if it was rewritten since it was mapped
+        try:
+            stat = os.stat(INDEX_PATH)
+        except FileNotFoundError:
+            return False
+        if (stat.st_ino, stat.st_mtime_ns) == self.index_version:
+            return False
+        with open(INDEX_PATH, 'rb') as file:
+            _, live, offset, count = INDEX_HEADER.unpack(file.read(INDEX_HEADER.size))
+        self.map_index(live, offset, count)
+        return True
+
+    def refresh(self):
+        # Reload the index if it was rewritten, then index the records appended
+        # to the live segments since; only needed by readers
+        if self.writer:
+            return
+        if self.load_index():
+            # Segments before the live ones may have been compacted away
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds, self.decompressors = {}, {}
+            self.recent = {
+                timestamp: location for timestamp, location in self.recent.items() if location[0] >= self.first_live
+            }
+
+        for segment in segment_ids():
+            if segment < self.first_live:
+                continue
+            try:
+                fd = self.fd(segment)
+            except FileNotFoundError:
+                continue
+            size = os.fstat(fd).st_size
+            if size < SEGMENT_HEADER.size:
+                continue
+            _, dictionary_length = SEGMENT_HEADER.unpack(os.pread(fd, SEGMENT_HEADER.size, 0))
+            if size < SEGMENT_HEADER.size + dictionary_length:
+                continue
+            offset = max(self.scanned.get(segment, 0), SEGMENT_HEADER.size + dictionary_length)
+            while offset + RECORD.size <= size:
+                timestamp, length = RECORD.unpack(os.pread(fd, RECORD.size, offset))
+                if offset + RECORD.size + length > size:
+                    # Still being written
+                    break
+                self.recent[timestamp.rstrip(b'\0').decode()] = (segment, offset + RECORD.size, length)
+                offset += RECORD.size + length
+            self.scanned[segment] = offset
+
+    def fd(self, segment: int):
+        if segment not in self.fds:
+            self.fds[segment] = os.open(segment_path(segment), os.O_RDONLY)
+        return self.fds[segment]
+
+    def decompressor(self, segment: int):
+        if segment not in self.decompressors:
+            fd = self.fd(segment)
+            _, dictionary_length = SEGMENT_HEADER.unpack(os.pread(fd, SEGMENT_HEADER.size, 0))
+            dictionary = os.pread(fd, dictionary_length, SEGMENT_HEADER.size)
+            self.decompressors[segment] = zstandard.ZstdDecompressor(
+                dict_data=zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            )
+        return self.decompressors[segment]
+
+    def locate_locked(self, timestamp: str):
+        location = self.recent.get(timestamp)
+        if location is not None:
+            return location
+        key = timestamp.encode()
+        timestamps = self.index['timestamp']
+        i = numpy.searchsorted(timestamps, key)
+        if i < len(timestamps) and timestamps[i] == key:
+            _, segment, offset, length = self.index[i].tolist()
+            return segment, offset, length
+        return None, None, None
+
+    def read(self, location):
+        segment, offset, length = location
+        with self.lock:
+            compressed = os.pread(self.fd(segment), length, offset)
+            decompressor = self.decompressor(segment)
+        return decompressor.decompress(compressed)
+
+    def get_raw(self, timestamp: str):
+        for attempt in range(2):
+            with self.lock:
+                location = self.locate_locked(timestamp)
+            try:
+                if location[0] is not None:
+                    return self.read(location)
+            except FileNotFoundError:
+                # Compacted since the index was read
+                pass
+            if attempt == 0:
+                self.refresh()
+        return None
+
+    def get_document(self, timestamp: str):
+        raw = self.get_raw(timestamp)
+        return json.loads(raw) if raw is not None else None
+
+    def list_timestamps(self):
+        self.refresh()
+        with self.lock:
+            return [t.decode() for t in self.index['timestamp'].tolist()] + list(self.recent)
+
+    def finalize(self):
+        # Seal the live segment and compact everything
+        self.wait()
+        if self.active is not None:
+            self.active_file.close()
+            with self.lock:
+                self.sealed.append(self.active)
+                self.active, self.active_file, self.active_size = None, None, 0
+        if self.sealed:
+            segments, self.sealed = self.sealed, []
+            self.compact(segments)
+        elif self.recent:
+            with self.lock:
+                self.persist()
+
+    def storage_paths(self):
+        return ['tmp']
+
+    def get_total_size(self):
+        return sum(os.path.getsize(f'tmp/{f}') for f in os.listdir('tmp'))
+
+    def name(self):
+        return (
+            f'SegmentStore(level={self.level}, segment_size={self.segment_size}, '
+            f'compaction_level={self.compaction_level})'
+        )
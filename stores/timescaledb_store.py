@@ -71,22 +71,22 @@ class TimeScaleDBTimeSeriesStore(BaseStore):
             connection.execute(text("commit"))
 
     def store_document(self, data: Dict, timestamp: str):
-        documents = []
-        for feature in data["features"]:
-            documents.append(
-                Document(
-                    timestamp=datetime.fromisoformat(timestamp),
-                    uuid=feature["properties"]["uuid"],
-                    id=feature["properties"]["id"],
-                    color=feature["properties"]["color"],
-                    direction=bool(feature["properties"]["direction"] - 1),
-                    distance=feature["properties"]["distance"],
-                    distance_from_point=feature["properties"]["distanceFromPoint"],
-                    line_id=feature["properties"]["lineId"],
-                    coordinates_0=feature["geometry"]["coordinates"][0],
-                    coordinates_1=feature["geometry"]["coordinates"][1],
-                )
+        moment = datetime.fromisoformat(timestamp)
+        documents = [
+            Document(
+                timestamp=moment,
+                uuid=feature["properties"]["uuid"],
+                id=feature["properties"]["id"],
+                color=feature["properties"]["color"],
+                direction=bool(feature["properties"]["direction"] - 1),
+                distance=feature["properties"]["distance"],
+                distance_from_point=feature["properties"]["distanceFromPoint"],
+                line_id=feature["properties"]["lineId"],
+                coordinates_0=feature["geometry"]["coordinates"][0],
+                coordinates_1=feature["geometry"]["coordinates"][1],
             )
+            for feature in data["features"]
+        ]
         self.session.add_all(documents)
         self.session.commit()
 
@@ -101,25 +101,28 @@ class TimeScaleDBTimeSeriesStore(BaseStore):
             "type": "FeatureCollection",
         }
 
-    def get_total_size(self) -> int:
+    def connect(self):
         import psycopg2
-        conn = psycopg2.connect(
+        return psycopg2.connect(
             dbname="store",
             user="postgres",
             password="postgres",
             host="localhost",
             port="5435",
         )
+
+    def finalize(self):
+        conn = self.connect()
         cur = conn.cursor()
-        print("yo")
-        cur.execute("select compress_chunk(show_chunks('documents') )")
-        print(cur.fetchall())
-        cur.execute("""
-        SELECT pg_size_pretty(sum(after_compression_total_bytes)) as total,
-       pg_size_pretty(sum(before_compression_total_bytes)) as before,
-       pg_size_pretty(sum(after_compression_total_bytes) - sum(before_compression_total_bytes)) as saved
-FROM chunk_compression_stats('documents'::regclass)""")
-        print(cur.fetchall())
-        cur.execute("SELECT hypertable_size('documents')")
+        # Chunks the compression policy already compressed are skipped
+        cur.execute("select compress_chunk(show_chunks('documents'), if_not_compressed => true)")
+        conn.commit()
+        conn.close()
 
-        return cur.fetchone()[0]
\ No newline at end of file
+    def get_total_size(self) -> int:
+        conn = self.connect()
+        cur = conn.cursor()
+        cur.execute("SELECT hypertable_size('documents')")
+        size = cur.fetchone()[0]
+        conn.close()
+        return size
\ No newline at end of file
@@ -0,0 +1,138 @@
+import collections
+import json
+import os
+import shutil
+
+import zstandard
+
+from stores.base_store import BaseStore
+
+
+class ZstdDictionaryFileStore(BaseStore):
+    # One zstd file per snapshot, compressed against a dictionary trained on
+    # recent snapshots: the uuids, colors, line ids and keys every snapshot
+    # repeats are stored once in tmp/dictionaries/ instead of in every file.
+    # The dictionary id is in the header of every frame, so a snapshot is read
+    # with the dictionary it was written with. The first training_snapshots
+    # snapshots are compressed without dictionary, then a dictionary is trained
+    # on them, and retrained on the latest ones when the compression ratio
+    # drops by more than `drift` from the ratio of the dictionary when new.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Create tmp directory if it doesn't exist
+        os.makedirs('tmp/dictionaries', exist_ok=True)
+        self.level = kwargs.get('level', 3)
+        self.training_snapshots = kwargs.get('training_snapshots', 20)
+        self.dictionary_size = kwargs.get('dictionary_size', 110 * 1024)
+        self.drift = kwargs.get('drift', 0.1)
+        self.decompressors = {}
+        self.clear()
+        # Continue with the latest dictionary of the snapshots already stored
+        latest = self.latest_dictionary_id()
+        if latest:
+            self.use(latest)
+
+    def clear(self):
+        self.recent = collections.deque(maxlen=self.training_snapshots)
+        self.ratios = collections.deque(maxlen=self.training_snapshots)
+        self.dictionary_id = 0
+        self.trained_ratio = None
+        self.compressor = zstandard.ZstdCompressor(level=self.level)
+
+    def reset(self):
+        shutil.rmtree('tmp')
+        os.makedirs('tmp/dictionaries', exist_ok=False)
+        self.decompressors = {}
+        self.clear()
+
+    def latest_dictionary_id(self):
+        return max(
+            (int(f.removesuffix('.zdict')) for f in os.listdir('tmp/dictionaries') if f.endswith('.zdict')),
+            default=0,
+        )
+
+    def train(self):
+        # Dictionary ids are sequential, 0 means no dictionary in zstd frames.
+        # A dictionary file is never overwritten, the frames written with it
+        # would no longer decompress: the file is linked into place, which
+        # fails if another writer took the id meanwhile, and readers never see
+        # a partial dictionary.
+        while True:
+            dictionary = zstandard.train_dictionary(
+                self.dictionary_size,
+                list(self.recent),
+                dict_id=max(self.dictionary_id, self.latest_dictionary_id()) + 1,
+                level=self.level,
+            )
+            path = f'tmp/dictionaries/{dictionary.dict_id()}.zdict'
+            with open(f'{path}.tmp', 'wb') as file:
+                file.write(dictionary.as_bytes())
+            try:
+                os.link(f'{path}.tmp', path)
+                break
+            except FileExistsError:
+                continue
+            finally:
+                os.remove(f'{path}.tmp')
+        self.use(dictionary.dict_id())
+
+    def use(self, dictionary_id: int):
+        # Compress with a stored dictionary from now on
+        self.dictionary_id = dictionary_id
+        self.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.load(dictionary_id))
+        self.trained_ratio = None
+        self.ratios.clear()
+
+    def load(self, dictionary_id: int):
+        with open(f'tmp/dictionaries/{dictionary_id}.zdict', 'rb') as file:
+            return zstandard.ZstdCompressionDict(file.read())
+
+    def store_document(self, data: dict, timestamp: str):
+        self.store_raw(json.dumps(data).encode(), timestamp)
+
+    def store_raw(self, raw: bytes, timestamp: str):
+        compressed = self.compressor.compress(raw)
+        with open(f'tmp/{timestamp}.json.zst', 'wb') as file:
+            file.write(compressed)
+
+        self.recent.append(raw)
+        self.ratios.append(len(raw) / len(compressed))
+        if len(self.ratios) < self.training_snapshots:
+            return
+        ratio = sum(self.ratios) / len(self.ratios)
+        if not self.dictionary_id or (self.trained_ratio and ratio < self.trained_ratio * (1 - self.drift)):
+            self.train()
+        elif self.trained_ratio is None:
+            # Measured on the first snapshots compressed with the dictionary,
+            # the snapshots it was trained on would overestimate it
+            self.trained_ratio = ratio
+
+    def decompressor(self, dictionary_id: int):
+        if dictionary_id not in self.decompressors:
+            if dictionary_id:
+                self.decompressors[dictionary_id] = zstandard.ZstdDecompressor(dict_data=self.load(dictionary_id))
+            else:
+                self.decompressors[dictionary_id] = zstandard.ZstdDecompressor()
+        return self.decompressors[dictionary_id]
+
+    def get_document(self, timestamp: str):
+        with open(f'tmp/{timestamp}.json.zst', 'rb') as file:
+            compressed = file.read()
+        dictionary_id = zstandard.get_frame_parameters(compressed).dict_id
+        return json.loads(self.decompressor(dictionary_id).decompress(compressed))
+
+    def list_timestamps(self):
+        return [f.removesuffix('.json.zst') for f in os.listdir('tmp') if f.endswith('.json.zst')]
+
+    def storage_paths(self):
+        return ['tmp']
+
+    def get_total_size(self):
+        return sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk('tmp')
+            for f in files
+        )
+
+    def name(self):
+        return f'ZstdDictionaryFileStore(level={self.level}, training_snapshots={self.training_snapshots})'